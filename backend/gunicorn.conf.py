@@ -0,0 +1,32 @@
+import gc
+import os
+
+# gunicorn -c gunicorn.conf.py src.main:app
+# (or with -k uvicorn.workers.UvicornWorker src.asgi:app)
+
+bind = f"0.0.0.0:{os.environ.get('PORT', 5000)}"
+workers = int(os.environ.get('WEB_CONCURRENCY', 4))
+
+# Each open /api/triage/queue/stream holds a thread, not a whole worker; a sync
+# worker would also be killed by the worker timeout while it streams
+worker_class = os.environ.get('GUNICORN_WORKER_CLASS', 'gthread')
+threads = int(os.environ.get('GUNICORN_THREADS', 32))
+
+# Import the app once in the master; the triage model is loaded there too (see
+# when_ready) so forked workers share its memory copy-on-write instead of each
+# loading their own copy
+preload_app = True
+
+# Threads do not survive fork; start them in each worker instead (see post_fork)
+os.environ.setdefault('BACKGROUND_JOBS_AT_IMPORT', 'false')
+os.environ.setdefault('MODEL_WARMUP', 'lazy')
+
+def when_ready(server):
+    from src.models.registry import model_registry
+    model_registry.warm()
+    # Keep the garbage collector from touching (and so copying) the preloaded objects
+    gc.freeze()
+
+def post_fork(server, worker):
+    from src.main import start_background_jobs
+    start_background_jobs()
@@ -0,0 +1,232 @@
+import asyncio
+import json
+import os
+import sys
+from concurrent.futures import ThreadPoolExecutor
+from tempfile import SpooledTemporaryFile
+from asgiref.sync import async_to_sync, sync_to_async
+from src.main import app as flask_app, CORS_ORIGINS
+from src.routes.triage import queue_scheduler, queue_broadcaster, QUEUE_STREAM_KEEPALIVE_SECONDS
+from src.audit_log import priority_log_writer
+
+QUEUE_STREAM_PATH = '/api/triage/queue/stream'
+
+# Threads serving Flask routes concurrently in each ASGI worker
+WSGI_THREADS = int(os.environ.get('ASGI_WSGI_THREADS', 32))
+wsgi_executor = ThreadPoolExecutor(max_workers=WSGI_THREADS, thread_name_prefix='asgi-wsgi')
+
+def wsgi_environ(scope, body):
+    """WSGI environ for an ASGI HTTP scope and its buffered request body"""
+    script_name = scope.get('root_path', '').encode('utf8').decode('latin1')
+    path_info = scope['path'].encode('utf8').decode('latin1')
+    if path_info.startswith(script_name):
+        path_info = path_info[len(script_name):]
+    server = scope.get('server') or ('localhost', 80)
+    environ = {
+        'REQUEST_METHOD': scope['method'],
+        'SCRIPT_NAME': script_name,
+        'PATH_INFO': path_info,
+        'QUERY_STRING': scope['query_string'].decode('ascii'),
+        'SERVER_PROTOCOL': f"HTTP/{scope['http_version']}",
+        'SERVER_NAME': server[0],
+        'SERVER_PORT': str(server[1]),
+        'wsgi.version': (1, 0),
+        'wsgi.url_scheme': scope.get('scheme', 'http'),
+        'wsgi.input': body,
+        # The whole body is buffered, so it can be read to the end without a Content-Length
+        'wsgi.input_terminated': True,
+        'wsgi.errors': sys.stderr,
+        'wsgi.multithread': True,
+        'wsgi.multiprocess': True,
+        'wsgi.run_once': False
+    }
+    if scope.get('client'):
+        environ['REMOTE_ADDR'] = scope['client'][0]
+    for name, value in scope.get('headers', []):
+        name = name.decode('latin1')
+        if name == 'content-length':
+            key = 'CONTENT_LENGTH'
+        elif name == 'content-type':
+            key = 'CONTENT_TYPE'
+        else:
+            key = 'HTTP_' + name.upper().replace('-', '_')
+        value = value.decode('latin1')
+        environ[key] = f"{environ[key]},{value}" if key in environ else value
+    return environ
+
+class WsgiBridge:
+    """Serves a WSGI app to ASGI HTTP requests, each on a thread from a pool.
+
+    asgiref's own WsgiToAsgi runs every request on one shared thread, so slow
+    routes queued behind each other. Here the app runs through
+    sync_to_async(thread_sensitive=False) on `executor`, and each chunk it
+    yields is sent as it comes, so streamed responses stay streamed.
+    """
+
+    def __init__(self, wsgi_app, executor=None):
+        self.wsgi_app = wsgi_app
+        self.executor = executor
+
+    async def __call__(self, scope, receive, send):
+        with SpooledTemporaryFile(max_size=65536) as body:
+            while True:
+                message = await receive()
+                if message['type'] == 'http.disconnect':
+                    return
+                body.write(message.get('body', b''))
+                if not message.get('more_body'):
+                    break
+            body.seek(0)
+            run = sync_to_async(self.run_app, thread_sensitive=False, executor=self.executor)
+            await run(wsgi_environ(scope, body), async_to_sync(send))
+
+    def run_app(self, environ, send):
+        """Call the WSGI app on this thread, sending its response through send"""
+        response = {}
+
+        def start_response(status, headers, exc_info=None):
+            if exc_info and response.get('sent'):
+                raise exc_info[1].with_traceback(exc_info[2])
+            response['start'] = {
+                'type': 'http.response.start',
+                'status': int(status.split(' ', 1)[0]),
+                'headers': [(name.lower().encode('latin1'), value.encode('latin1')) for name, value in headers]
+            }
+
+        def send_start():
+            if not response.get('sent'):
+                response['sent'] = True
+                send(response['start'])
+
+        result = self.wsgi_app(environ, start_response)
+        try:
+            for chunk in result:
+                if chunk:
+                    send_start()
+                    send({'type': 'http.response.body', 'body': chunk, 'more_body': True})
+        finally:
+            if hasattr(result, 'close'):
+                result.close()
+        send_start()
+        send({'type': 'http.response.body'})
+
+class TriageASGIApp:
+    """ASGI entry point, an alternative to running src.main directly.
+
+    The queue stream is served on the event loop: an open stream is a
+    coroutine waiting on the broadcaster rather than a worker thread, so many
+    dashboards can stay connected at once. Every other route goes to the
+    Flask app through WsgiBridge, on a pool of `ASGI_WSGI_THREADS` threads so
+    slow routes do not queue behind each other.
+
+    Run with `uvicorn src.asgi:app --host 0.0.0.0 --port 5000` or
+    `gunicorn -k uvicorn.workers.UvicornWorker -b 0.0.0.0:5000 src.asgi:app`.
+    """
+
+    def __init__(self, wsgi_app):
+        self.wsgi = WsgiBridge(wsgi_app, wsgi_executor)
+
+    async def __call__(self, scope, receive, send):
+        if scope['type'] == 'lifespan':
+            await self.lifespan(receive, send)
+        elif scope['type'] == 'http' and scope['method'] == 'GET' and scope['path'].rstrip('/') == QUEUE_STREAM_PATH:
+            await self.stream_queue(scope, receive, send)
+        else:
+            await self.wsgi(scope, receive, send)
+
+    async def lifespan(self, receive, send):
+        while True:
+            message = await receive()
+            if message['type'] == 'lifespan.startup':
+                await send({'type': 'lifespan.startup.complete'})
+            elif message['type'] == 'lifespan.shutdown':
+                # Don't lose buffered audit rows when the server stops
+                await asyncio.to_thread(priority_log_writer.flush)
+                await send({'type': 'lifespan.shutdown.complete'})
+                return
+
+    async def stream_queue(self, scope, receive, send):
+        """Same events as the Flask /queue/stream route, without holding a thread"""
+        try:
+            # Runs the first pass (which publishes the queue) if none has run yet
+            await asyncio.to_thread(queue_scheduler.get_latest)
+        except Exception as e:
+            print(f"Queue Stream Error: {str(e)}")  # Add debug logging
+            await self.send_error(scope, send, 500, str(e))
+            return
+
+        loop = asyncio.get_running_loop()
+        changed = asyncio.Event()
+
+        def waker():
+            loop.call_soon_threadsafe(changed.set)
+
+        # Register before taking the snapshot so no publish in between is missed
+        queue_broadcaster.add_waker(waker)
+        version, snapshot = queue_broadcaster.snapshot()
+        disconnected = asyncio.ensure_future(self.wait_for_disconnect(receive))
+        try:
+            await send({
+                'type': 'http.response.start',
+                'status': 200,
+                'headers': self.headers(scope, [
+                    (b'content-type', b'text/event-stream'),
+                    (b'cache-control', b'no-cache'),
+                    (b'x-accel-buffering', b'no')  # Stop nginx buffering the stream
+                ])
+            })
+            await self.send_chunk(send, snapshot)
+
+            while not disconnected.done():
+                woken = asyncio.ensure_future(changed.wait())
+                await asyncio.wait([woken, disconnected], timeout=QUEUE_STREAM_KEEPALIVE_SECONDS,
+                                   return_when=asyncio.FIRST_COMPLETED)
+                if disconnected.done():
+                    woken.cancel()
+                    break
+                if not woken.done():
+                    woken.cancel()
+                    await self.send_chunk(send, ": keep-alive\n\n")
+                    continue
+
+                changed.clear()
+                version, messages = queue_broadcaster.wait(version, 0)
+                for message in messages:
+                    await self.send_chunk(send, message)
+        finally:
+            queue_broadcaster.remove_waker(waker)
+            disconnected.cancel()
+
+    async def wait_for_disconnect(self, receive):
+        while (await receive())['type'] != 'http.disconnect':
+            pass
+
+    async def send_chunk(self, send, text):
+        await send({'type': 'http.response.body', 'body': text.encode('utf-8'), 'more_body': True})
+
+    async def send_error(self, scope, send, status, error):
+        body = json.dumps({"error": error}).encode('utf-8')
+        await send({
+            'type': 'http.response.start',
+            'status': status,
+            'headers': self.headers(scope, [(b'content-type', b'application/json')])
+        })
+        await send({'type': 'http.response.body', 'body': body})
+
+    def headers(self, scope, headers):
+        """Response headers plus the CORS headers Flask-CORS would add for this origin"""
+        origin = dict(scope['headers']).get(b'origin', b'').decode('latin-1')
+        if origin in CORS_ORIGINS:
+            headers = headers + [
+                (b'access-control-allow-origin', origin.encode('latin-1')),
+                (b'access-control-allow-credentials', b'true'),
+                (b'vary', b'Origin')
+            ]
+        return headers
+
+app = TriageASGIApp(flask_app)
+
+if __name__ == '__main__':
+    import uvicorn
+    # Get port from environment variable or default to 5000
+    uvicorn.run(app, host='0.0.0.0', port=int(os.environ.get('PORT', 5000)))
@@ -0,0 +1,271 @@
+import atexit
+import contextlib
+import json
+import os
+import queue
+import threading
+import time
+from datetime import datetime
+from .supabase_client import supabase_request, SupabaseError
+
+try:
+    import fcntl
+except ImportError:  # Not available on Windows; the spill file is then only locked within a process
+    fcntl = None
+
+@contextlib.contextmanager
+def file_lock(path, blocking=True):
+    """Exclusive lock on path across processes; yields whether it was acquired"""
+    if fcntl is None:
+        yield True
+        return
+    with open(path, 'a') as lock_file:
+        try:
+            fcntl.flock(lock_file, fcntl.LOCK_EX | (0 if blocking else fcntl.LOCK_NB))
+        except BlockingIOError:
+            yield False
+            return
+        try:
+            yield True
+        finally:
+            fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+class WriteBehindLog:
+    """Buffers rows for a Supabase table and inserts them from a background thread.
+
+    Callers hand rows to submit() and return immediately. The flusher inserts
+    them in batches of up to batch_size rows, or whatever has arrived after
+    flush_interval seconds. The in-memory buffer is bounded: when it is full,
+    or when Supabase rejects a batch, rows are appended to a local spill file
+    instead, and the file is replayed once inserts succeed again. Only
+    connection errors and retryable statuses (5xx, 408, 429) spill: when
+    Supabase rejects a batch outright (e.g. a 409 for a row whose patient was
+    deleted before the flush), the batch is split until the rejected rows are
+    isolated, the rest are written, and the rejected rows go to a dead-letter
+    file next to the spill file.
+
+    Every gunicorn worker shares the spill file, so appends and the handover
+    to replay hold a file lock, and only one process replays at a time.
+    """
+
+    def __init__(self, path, spill_path, batch_size=None, flush_interval=None, max_pending=None):
+        self.path = path
+        self.spill_path = spill_path
+        self.dead_letter_path = spill_path + '.dead'
+        self.batch_size = batch_size or int(os.environ.get('AUDIT_BATCH_SIZE', 200))
+        self.flush_interval = flush_interval or float(os.environ.get('AUDIT_FLUSH_INTERVAL_SECONDS', 2))
+        self.max_pending = max_pending or int(os.environ.get('AUDIT_MAX_PENDING', 10000))
+
+        self._queue = queue.Queue(maxsize=self.max_pending)
+        self._spill_lock = threading.Lock()
+        self._replay_lock = threading.Lock()
+        self._thread = None
+        self._start_lock = threading.Lock()
+        self._stop = threading.Event()
+        self._stats_lock = threading.Lock()
+        self._stats = {'submitted': 0, 'written': 0, 'batches': 0, 'spilled': 0, 'replayed': 0, 'errors': 0, 'dead_lettered': 0}
+
+    def submit(self, rows):
+        """Queue rows for insertion without waiting on any I/O to Supabase"""
+        if isinstance(rows, dict):
+            rows = [rows]
+        self._ensure_started()
+        overflow = []
+        for row in rows:
+            try:
+                self._queue.put_nowait(row)
+            except queue.Full:
+                overflow.append(row)
+        self._count('submitted', len(rows))
+        if overflow:
+            # The flusher is behind; divert to disk rather than block the caller
+            self._spill(overflow)
+
+    def flush(self):
+        """Insert everything buffered now; used at shutdown and by the flusher"""
+        while True:
+            batch = self._drain(self.batch_size)
+            if not batch:
+                return
+            self._write(batch)
+
+    def stats(self):
+        with self._stats_lock:
+            stats = dict(self._stats)
+        stats['pending'] = self._queue.qsize()
+        stats['spill_file_bytes'] = sum(
+            os.path.getsize(path) for path in self._spill_files() if os.path.exists(path)
+        )
+        stats['dead_letter_file_bytes'] = os.path.getsize(self.dead_letter_path) if os.path.exists(self.dead_letter_path) else 0
+        return stats
+
+    def stop(self):
+        self._stop.set()
+
+    def _ensure_started(self):
+        if self._thread is not None and self._thread.is_alive():
+            return
+        with self._start_lock:
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(target=self._run, name='audit-log-writer', daemon=True)
+                self._thread.start()
+
+    def _run(self):
+        while not self._stop.is_set():
+            batch = self._collect()
+            if batch:
+                self._write(batch)
+            elif self._has_spill():
+                self._replay()
+
+    def _collect(self):
+        """Wait for a full batch or the flush interval, whichever comes first"""
+        batch = []
+        deadline = time.monotonic() + self.flush_interval
+        while len(batch) < self.batch_size:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            try:
+                batch.append(self._queue.get(timeout=remaining))
+            except queue.Empty:
+                break
+        return batch + self._drain(self.batch_size - len(batch))
+
+    def _drain(self, limit):
+        rows = []
+        while len(rows) < limit:
+            try:
+                rows.append(self._queue.get_nowait())
+            except queue.Empty:
+                break
+        return rows
+
+    def _write(self, batch):
+        unwritten = self._insert(batch, 'written')
+        if unwritten:
+            print(f"Audit log write to {self.path} failed, spilling {len(unwritten)} rows")
+            self._spill(unwritten)
+            return False
+
+        self._count('batches')
+        # Supabase is reachable again; catch up on anything spilled earlier
+        if self._has_spill():
+            self._replay()
+        return True
+
+    def _insert(self, rows, counter):
+        """Insert rows, dead-lettering any Supabase rejects outright.
+
+        Returns the rows left unwritten by a retryable failure, which stops
+        the insert; the caller keeps them for a later attempt.
+        """
+        try:
+            supabase_request('POST', self.path, data=rows)
+        except Exception as e:
+            if is_retryable(e):
+                print(f"Audit log insert into {self.path} failed: {str(e)}")
+                self._count('errors')
+                return rows
+            if len(rows) == 1:
+                print(f"Audit log row rejected, moving it to {self.dead_letter_path}: {str(e)}")
+                self._dead_letter(rows[0], e)
+                return []
+            # Split to find the rejected rows and still write the others
+            middle = len(rows) // 2
+            unwritten = self._insert(rows[:middle], counter)
+            if unwritten:
+                return unwritten + rows[middle:]
+            return self._insert(rows[middle:], counter)
+
+        self._count(counter, len(rows))
+        return []
+
+    def _dead_letter(self, row, error):
+        entry = {'row': row, 'error': str(error), 'at': datetime.now().isoformat()}
+        self._ensure_directory()
+        with self._spill_lock, file_lock(self.spill_path + '.lock'):
+            with open(self.dead_letter_path, 'a') as dead_letter:
+                dead_letter.write(json.dumps(entry, default=str) + '\n')
+        self._count('dead_lettered')
+
+    def _spill(self, rows):
+        self._ensure_directory()
+        with self._spill_lock, file_lock(self.spill_path + '.lock'):
+            with open(self.spill_path, 'a') as spill:
+                for row in rows:
+                    spill.write(json.dumps(row, default=str) + '\n')
+        self._count('spilled', len(rows))
+
+    def _ensure_directory(self):
+        directory = os.path.dirname(self.spill_path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+
+    def _spill_files(self):
+        return (self.spill_path, self.spill_path + '.replay')
+
+    def _has_spill(self):
+        return any(os.path.exists(path) and os.path.getsize(path) > 0 for path in self._spill_files())
+
+    def _replay(self):
+        """Replay the spill file unless another thread or process already is"""
+        if not self._replay_lock.acquire(blocking=False):
+            return
+        try:
+            with file_lock(self.spill_path + '.replay.lock', blocking=False) as acquired:
+                if acquired:
+                    self._replay_spill()
+        finally:
+            self._replay_lock.release()
+
+    def _replay_spill(self):
+        """Insert spilled rows in batches; stops at the first failure and keeps the rest"""
+        with self._spill_lock, file_lock(self.spill_path + '.lock'):
+            # Take the file over so new spills start a fresh one
+            replaying = self.spill_path + '.replay'
+            if not os.path.exists(replaying):
+                if not os.path.exists(self.spill_path):
+                    return  # Another process replayed it already
+                os.replace(self.spill_path, replaying)
+
+        with open(replaying) as spill:
+            rows = [json.loads(line) for line in spill if line.strip()]
+
+        for start in range(0, len(rows), self.batch_size):
+            unwritten = self._insert(rows[start:start + self.batch_size], 'replayed')
+            remaining = unwritten + rows[start + self.batch_size:]
+            # Record progress after every batch, so if this process dies mid-replay
+            # the next replayer does not insert the same rows again
+            self._keep(replaying, remaining)
+            if unwritten:
+                print(f"Audit log replay failed, keeping {len(remaining)} spilled rows")
+                time.sleep(self.flush_interval)
+                return
+
+    def _keep(self, replaying, rows):
+        """Atomically replace the replay file with the rows still to insert"""
+        if not rows:
+            os.remove(replaying)
+            return
+        with open(replaying + '.tmp', 'w') as spill:
+            for row in rows:
+                spill.write(json.dumps(row, default=str) + '\n')
+        os.replace(replaying + '.tmp', replaying)
+
+    def _count(self, name, amount=1):
+        with self._stats_lock:
+            self._stats[name] += amount
+
+def is_retryable(error):
+    """Connection errors and 5xx/408/429 may succeed later; other 4xx responses will not"""
+    if not isinstance(error, SupabaseError):
+        return True
+    return error.status_code >= 500 or error.status_code in (408, 429)
+
+# Shared writer for priority_logs audit rows
+priority_log_writer = WriteBehindLog(
+    '/rest/v1/priority_logs',
+    os.environ.get('AUDIT_SPILL_PATH', os.path.join('data', 'priority_logs.spill.jsonl'))
+)
+atexit.register(priority_log_writer.flush)
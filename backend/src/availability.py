@@ -0,0 +1,132 @@
+import os
+import threading
+import time
+from .supabase_client import supabase_request
+
+# How often the in-process index is reloaded from Supabase, in seconds
+RECONCILE_SECONDS = float(os.environ.get('AVAILABILITY_RECONCILE_SECONDS', 60))
+
+class AvailabilityIndex:
+    """Counts of available staff or resources per specialty/type, held in process.
+
+    The staff and resource write endpoints apply the rows they write, so a
+    lookup is a dictionary read. The index is reloaded from Supabase when it
+    is older than `reconcile_seconds`, which picks up changes made by other
+    workers or directly in the database. If a reload fails the current counts
+    keep being served.
+    """
+
+    def __init__(self, table, column, reconcile_seconds=None):
+        self.table = table
+        self.column = column
+        self.reconcile_seconds = reconcile_seconds or RECONCILE_SECONDS
+        self._members = {}  # id -> (column value, is available)
+        self._counts = {}   # column value -> number of available members
+        self._loaded = False
+        self._loaded_at = None
+        self._changes_during_load = None
+        self._lock = threading.Lock()
+        self._load_lock = threading.Lock()
+        self._stats = {'lookups': 0, 'reloads': 0, 'reload_errors': 0, 'applied': 0}
+
+    def counts(self):
+        """Available member count per specialty/type, reconciling first if due"""
+        if not self._loaded:
+            self.reload(wait=True)
+        elif self._loaded_at is None or time.monotonic() - self._loaded_at >= self.reconcile_seconds:
+            self.reload()
+        with self._lock:
+            self._stats['lookups'] += 1
+            if not self._loaded:
+                raise RuntimeError(f"{self.table} availability has not been loaded")
+            return dict(self._counts)
+
+    def reload(self, wait=False):
+        """Rebuild the index from Supabase; writes applied meanwhile are kept"""
+        if not self._load_lock.acquire(blocking=wait):
+            # Another thread is already reconciling; serve the current counts
+            return
+        try:
+            with self._lock:
+                self._changes_during_load = []
+            try:
+                rows = supabase_request('GET', f'/rest/v1/{self.table}', params={
+                    'select': f'id,{self.column},status'
+                })
+            except Exception as e:
+                print(f"Error reconciling {self.table} availability: {e}")
+                with self._lock:
+                    self._changes_during_load = None
+                    self._stats['reload_errors'] += 1
+                return
+
+            members = {
+                str(row['id']): (row.get(self.column), row.get('status') == 'available')
+                for row in rows or []
+            }
+            with self._lock:
+                # Writes that landed while the query ran may be newer than its result
+                for member_id, member in self._changes_during_load:
+                    if member is None:
+                        members.pop(member_id, None)
+                    else:
+                        members[member_id] = member
+                self._changes_during_load = None
+                self._members = members
+                self._counts = {}
+                for value, available in members.values():
+                    if available:
+                        self._counts[value] = self._counts.get(value, 0) + 1
+                self._loaded = True
+                self._loaded_at = time.monotonic()
+                self._stats['reloads'] += 1
+        finally:
+            self._load_lock.release()
+
+    def apply(self, row):
+        """Update the index from a staff/resource row returned by a write"""
+        if not row or 'id' not in row:
+            return
+        member_id = str(row['id'])
+        with self._lock:
+            previous = self._members.get(member_id)
+            value = row[self.column] if self.column in row else (previous[0] if previous else None)
+            available = row['status'] == 'available' if 'status' in row else bool(previous and previous[1])
+            self._set(member_id, (value, available))
+
+    def remove(self, member_id):
+        """Drop a deleted staff member or resource from the index"""
+        with self._lock:
+            self._set(str(member_id), None)
+
+    def invalidate(self):
+        """Force the next lookup to reload; current counts stay as a fallback"""
+        with self._lock:
+            self._loaded_at = None
+
+    def stats(self):
+        with self._lock:
+            stats = dict(self._stats)
+            stats['members'] = len(self._members)
+            stats['available'] = dict(self._counts)
+        stats['age_seconds'] = time.monotonic() - self._loaded_at if self._loaded_at is not None else None
+        return stats
+
+    def _set(self, member_id, member):
+        """Replace one member and adjust the counts; caller holds the lock"""
+        previous = self._members.pop(member_id, None)
+        if previous and previous[1]:
+            self._counts[previous[0]] -= 1
+            if not self._counts[previous[0]]:
+                del self._counts[previous[0]]
+        if member is not None:
+            self._members[member_id] = member
+            if member[1]:
+                self._counts[member[0]] = self._counts.get(member[0], 0) + 1
+        if self._changes_during_load is not None:
+            self._changes_during_load.append((member_id, member))
+        self._stats['applied'] += 1
+
+# Shared per process; kept current by the staff and resources routes
+staff_availability = AvailabilityIndex('staff', 'specialty')
+resource_availability = AvailabilityIndex('resources', 'type')
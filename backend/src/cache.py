@@ -0,0 +1,146 @@
+import threading
+import time
+from collections import OrderedDict
+
+class TTLCache:
+    """Caches the result of a loader function for a fixed time-to-live.
+
+    The value can be invalidated explicitly when the underlying data is known
+    to have changed. If a reload fails and serve_stale is set, the last value
+    that loaded successfully is returned instead of raising.
+
+    invalidate() only reaches this process. When other processes may change
+    the data, pass version, a cheap function returning something that changes
+    with it (e.g. an updated_at column): a cached value is reloaded once its
+    version differs, checked at most every version_ttl seconds.
+    """
+
+    def __init__(self, loader, ttl, serve_stale=True, version=None, version_ttl=5):
+        self.loader = loader
+        self.ttl = ttl
+        self.serve_stale = serve_stale
+        self.version = version
+        self.version_ttl = version_ttl
+        self._value = None
+        self._loaded_at = None
+        self._loaded_version = None
+        self._checked_at = None
+        self._has_value = False
+        self._lock = threading.Lock()
+        self._stats = {'hits': 0, 'misses': 0, 'stale_hits': 0, 'load_errors': 0, 'invalidations': 0,
+                       'version_checks': 0, 'version_changes': 0}
+
+    def get(self, revalidate=False):
+        """Return the cached value, reloading it if it expired, was invalidated or its version changed.
+
+        revalidate checks the version now rather than after version_ttl.
+        """
+        with self._lock:
+            if self._is_fresh() and not self._version_changed(revalidate):
+                self._stats['hits'] += 1
+                return self._value
+
+            self._stats['misses'] += 1
+            try:
+                # Read before the value, so a change made during the load is caught next time
+                version = self._current_version()
+                value = self.loader()
+            except Exception:
+                self._stats['load_errors'] += 1
+                if self.serve_stale and self._has_value:
+                    self._stats['stale_hits'] += 1
+                    return self._value
+                raise
+
+            self._value = value
+            self._loaded_at = self._checked_at = time.monotonic()
+            self._loaded_version = version
+            self._has_value = True
+            return value
+
+    def invalidate(self):
+        """Force the next get() to reload; the old value stays as a stale fallback"""
+        with self._lock:
+            self._loaded_at = None
+            self._stats['invalidations'] += 1
+
+    def stats(self):
+        with self._lock:
+            stats = dict(self._stats)
+        lookups = stats['hits'] + stats['misses']
+        stats['hit_rate'] = stats['hits'] / lookups if lookups else 0.0
+        stats['ttl_seconds'] = self.ttl
+        return stats
+
+    def _is_fresh(self):
+        return self._loaded_at is not None and time.monotonic() - self._loaded_at < self.ttl
+
+    def _current_version(self):
+        return self.version() if self.version is not None else None
+
+    def _version_changed(self, revalidate):
+        if self.version is None:
+            return False
+        if not revalidate and time.monotonic() - self._checked_at < self.version_ttl:
+            return False
+        self._stats['version_checks'] += 1
+        try:
+            version = self.version()
+        except Exception:
+            # Keep serving the cached value; the TTL still bounds how stale it gets
+            self._stats['load_errors'] += 1
+            return False
+        finally:
+            self._checked_at = time.monotonic()
+        if version == self._loaded_version:
+            return False
+        self._stats['version_changes'] += 1
+        return True
+
+class LRUCache:
+    """Keeps the `max_size` most recently used values by key.
+
+    Lookups and inserts are O(1) under one lock; inserting past `max_size`
+    evicts the least recently used entry. A max_size of 0 disables caching.
+    """
+
+    def __init__(self, max_size):
+        self.max_size = max_size
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self._stats = {'hits': 0, 'misses': 0, 'evictions': 0, 'clears': 0}
+
+    def get(self, key):
+        """Return the value cached for key, or None"""
+        with self._lock:
+            value = self._entries.get(key)
+            if value is None:
+                self._stats['misses'] += 1
+                return None
+            self._entries.move_to_end(key)
+            self._stats['hits'] += 1
+            return value
+
+    def put(self, key, value):
+        if self.max_size <= 0:
+            return
+        with self._lock:
+            self._entries[key] = value
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+                self._stats['evictions'] += 1
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._stats['clears'] += 1
+
+    def stats(self):
+        with self._lock:
+            stats = dict(self._stats)
+            stats['size'] = len(self._entries)
+        lookups = stats['hits'] + stats['misses']
+        stats['hit_rate'] = stats['hits'] / lookups if lookups else 0.0
+        stats['max_size'] = self.max_size
+        return stats
@@ -1,4 +1,6 @@
 import os
+import threading
+import time
 from flask import Flask, jsonify, request
 from flask_cors import CORS
 import json
@@ -7,27 +9,39 @@ import math
 from dotenv import load_dotenv
 load_dotenv()
 
+# Startup timings, reported by /api/ready
+process_started = time.perf_counter()
+startup_timings = {}
+
 app = Flask(__name__)
 # Disable automatic slash redirects
 app.url_map.strict_slashes = False
 
+# Common dev server ports; also used by the ASGI queue stream in src/asgi.py
+CORS_ORIGINS = ["http://localhost:3000", "http://localhost:5173"]
+
 # Configure CORS with all necessary settings
 CORS(app, 
      resources={r"/*": {  # Changed from "/" to "/*" to match all routes
-         "origins": ["http://localhost:3000", "http://localhost:5173"],  # Common dev server ports
+         "origins": CORS_ORIGINS,
          "methods": ["GET", "POST", "PUT", "DELETE", "OPTIONS"],
          "allow_headers": ["Content-Type", "Authorization", "apikey", "Prefer"],
-         "expose_headers": ["Content-Type", "Authorization"],
+         "expose_headers": ["Content-Type", "Authorization", "X-Priority-Rows-Written", "X-Priority-Write-Ms", "X-Queue-Computed-At", "X-Queue-Total", "X-Next-Cursor"],
          "supports_credentials": True,
          "send_wildcard": False,
          "max_age": 3600
      }})
 
 # Import routes
+imports_started = time.perf_counter()
+from src.supabase_client import supabase
 from src.routes.patients import patients_bp
 from src.routes.staff import staff_bp
 from src.routes.resources import resources_bp
 from src.routes.triage import triage_bp
+from src.models.registry import model_registry
+from src.models.shadow import shadow_evaluator
+startup_timings['route_imports_seconds'] = time.perf_counter() - imports_started
 
 # Register blueprints
 app.register_blueprint(patients_bp, url_prefix='/api/patients')
@@ -35,6 +49,53 @@ app.register_blueprint(staff_bp, url_prefix='/api/staff')
 app.register_blueprint(resources_bp, url_prefix='/api/resources')
 app.register_blueprint(triage_bp, url_prefix='/api/triage')
 
+from src.routes.triage import queue_scheduler, settings_cache, prediction_cache, sync_wait_stats
+from src.audit_log import priority_log_writer
+from src.availability import staff_availability, resource_availability
+from src.requirement_index import resource_requirements, specialty_requirements
+from src.wait_stats import wait_stats
+
+# When to load the triage model: 'background' (default), 'eager' (before serving) or 'lazy' (first prediction)
+MODEL_WARMUP = os.environ.get('MODEL_WARMUP', 'background').lower()
+if MODEL_WARMUP == 'eager':
+    model_registry.warm()
+
+# Seconds between pulls of new treatment starts into the wait-time statistics
+WAIT_STATS_SYNC_SECONDS = float(os.environ.get('WAIT_STATS_SYNC_SECONDS', 30))
+
+def run_wait_stats_sync():
+    """Warm the wait-time statistics from the database, then keep pulling new treatment starts"""
+    while True:
+        backfill = wait_stats.synced_through is None
+        try:
+            count = sync_wait_stats()
+            if backfill:
+                print(f"Loaded {count} recent treatment starts into the wait-time statistics")
+        except Exception as e:
+            print(f"Wait-time statistics sync failed: {str(e)}")
+        time.sleep(WAIT_STATS_SYNC_SECONDS)
+
+def start_background_jobs():
+    """Start this process's background threads; run once per worker, after any fork"""
+    # Background queue rescoring (set QUEUE_SCHEDULER_ENABLED=false to only rescore on demand)
+    if os.environ.get('QUEUE_SCHEDULER_ENABLED', 'true').lower() == 'true':
+        queue_scheduler.start()
+    
+    # Feed the in-memory wait-time percentiles from the database without delaying startup
+    if os.environ.get('WAIT_STATS_BACKFILL', 'true').lower() == 'true':
+        threading.Thread(target=run_wait_stats_sync, name='wait-stats-sync', daemon=True).start()
+    
+    # Load the triage model without delaying /api/health; /api/ready reports when it is done
+    if MODEL_WARMUP == 'background':
+        threading.Thread(target=model_registry.warm, name='model-warmup', daemon=True).start()
+    
+    # Swap in a retrained model when its file is replaced (MODEL_WATCH_SECONDS=0 turns this off)
+    model_registry.start_watching()
+
+# gunicorn.conf.py sets BACKGROUND_JOBS_AT_IMPORT=false and starts them in each worker after the fork
+if os.environ.get('BACKGROUND_JOBS_AT_IMPORT', 'true').lower() == 'true':
+    start_background_jobs()
+
 @app.route('/')
 def index():
     return jsonify({
@@ -51,12 +112,64 @@ def health_check():
         "timestamp": datetime.now().isoformat()
     })
 
-# Supabase connection helper
-def get_supabase_url():
-    return os.environ.get('SUPABASE_URL', 'https://my-custom.supabase.co')
+@app.route('/api/ready')
+def readiness_check():
+    """Ready once the triage model has loaded and passed the golden set; /api/health only says the process is up"""
+    model = model_registry.status()
+    ready = model['state'] == 'ready'
+    return jsonify({
+        "status": "ready" if ready else "not_ready",
+        "model": model,
+        "startup": startup_timings,
+        "timestamp": datetime.now().isoformat()
+    }), 200 if ready else 503
+
+@app.route('/api/model/reload', methods=['POST'])
+def reload_model():
+    """Load the model file again and swap it in if the new version validates.
+    
+    This worker reloads now; touching the file makes every other worker's
+    watcher reload it within MODEL_WATCH_SECONDS.
+    """
+    try:
+        signal = {"signalled": True}
+        try:
+            model_registry.signal_reload()
+        except OSError as e:
+            signal = {"signalled": False, "error": str(e)}
+        attempt = model_registry.reload()
+        status_code = 422 if attempt and attempt['outcome'] in ('rejected', 'failed') else 200
+        return jsonify({"reload": attempt, "other_workers": signal, "model": model_registry.status()}), status_code
+    except Exception as e:
+        return jsonify({"error": str(e)}), 500
+
+@app.route('/api/model/shadow')
+def shadow_model_stats():
+    """Agreement and latency of the shadow candidate model (SHADOW_MODEL_PATH) against production"""
+    return jsonify(shadow_evaluator.stats())
+
+@app.route('/api/model/shadow/reset', methods=['POST'])
+def reset_shadow_model_stats():
+    """Start a new shadow comparison, e.g. after replacing the candidate model file"""
+    shadow_evaluator.reset()
+    return jsonify(shadow_evaluator.stats())
+
+@app.route('/api/metrics')
+def metrics():
+    return jsonify({
+        "supabase": supabase.stats(),
+        "queue_scheduler": queue_scheduler.stats(),
+        "settings_cache": settings_cache.stats(),
+        "prediction_cache": prediction_cache.stats(),
+        "priority_logs": priority_log_writer.stats(),
+        "staff_availability": staff_availability.stats(),
+        "resource_availability": resource_availability.stats(),
+        "resource_requirements": resource_requirements.stats(),
+        "specialty_requirements": specialty_requirements.stats(),
+        "timestamp": datetime.now().isoformat()
+    })
 
-def get_supabase_key():
-    return os.environ.get('SUPABASE_SERVICE_KEY', 'SUPABASE_SERVICE_KEY')
+startup_timings['app_init_seconds'] = time.perf_counter() - process_started
 
 if __name__ == '__main__':
     # Get port from environment variable or default to 5000
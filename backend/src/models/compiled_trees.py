@@ -0,0 +1,350 @@
+"""Triage tree ensembles compiled to flat NumPy arrays for serving.
+
+A trained model (an XGBoost or scikit-learn tree classifier, optionally behind
+a pipeline whose preprocessing inference.CompiledPreprocessor can replay) is
+exported once to an .npz file holding:
+
+- the preprocessing as an affine map over the numeric vitals plus a table per
+  categorical field;
+- every tree as node arrays (feature, threshold, left/right child, whether
+  missing values go left, leaf values), concatenated with global node ids;
+- how leaf values combine into a class (XGBoost margins or averaged forest
+  probabilities).
+
+Serving loads the file with np.load only: no joblib, pandas, sklearn or
+xgboost import, and no object graph to unpickle. Predictions walk all trees
+for all records at once, one tree level per step. Leaves point to
+themselves, so every walk takes exactly max_depth steps without branching.
+
+Comparisons follow the source library: XGBoost compares float32 inputs with
+`<`, sklearn compares float32-rounded inputs with `<=` in float64, and leaf
+values are accumulated in tree order, so the compiled model reproduces the
+original predictions exactly rather than approximately.
+
+Run `python -m src.models.compiled_trees model.joblib model.npz` to export a
+model. The export is only written if it predicts the same risk level as the
+original model on every parity record; set TRIAGE_MODEL_PATH to the .npz file
+to serve it.
+"""
+import json
+import sys
+import numpy as np
+from .inference import CATEGORICAL_CODES, DEFAULT_FEATURES, PROBE_RECORDS, TriageInference, encode_records
+
+FORMAT_VERSION = 1
+
+class CompiledTriageModel:
+    """Array-based tree ensemble loaded from an exported .npz file"""
+
+    def __init__(self, arrays, meta):
+        if meta.get('format_version') != FORMAT_VERSION:
+            raise ValueError(f"Unsupported compiled model format: {meta.get('format_version')}")
+        if any(CATEGORICAL_CODES.get(feature) != codes for feature, codes in meta['categorical_codes'].items()):
+            raise ValueError("Compiled model was exported with different categorical codes")
+
+        self.meta = meta
+        self.feature_names_in_ = list(meta['features'])
+        self.classes_ = np.asarray(meta['classes'])
+        self.kind = meta['kind']
+        self.depth = int(meta['depth'])
+
+        self.numeric = arrays.get('numeric')
+        self.base_numeric = arrays.get('base_numeric')
+        self.base_output = arrays.get('base_output')
+        self.numeric_weights = arrays.get('numeric_weights')
+        self.category_tables = {
+            int(name.split('_')[-1]): table for name, table in arrays.items() if name.startswith('category_table_')
+        }
+
+        self.roots = arrays['roots']
+        self.feature = arrays['feature']
+        self.threshold = arrays['threshold']
+        self.left = arrays['left']
+        self.right = arrays['right']
+        self.missing_left = arrays['missing_left']
+        self.value = arrays['value']
+        self.tree_class = arrays.get('tree_class')
+        self.base_margin = arrays.get('base_margin')
+
+    @classmethod
+    def load(cls, path):
+        with np.load(path, allow_pickle=False) as archive:
+            arrays = {name: archive[name] for name in archive.files if name != 'meta'}
+            meta = json.loads(str(archive['meta']))
+        return cls(arrays, meta)
+
+    def save(self, path):
+        arrays = {
+            'roots': self.roots, 'feature': self.feature, 'threshold': self.threshold,
+            'left': self.left, 'right': self.right, 'missing_left': self.missing_left, 'value': self.value
+        }
+        for name in ('numeric', 'base_numeric', 'base_output', 'numeric_weights', 'tree_class', 'base_margin'):
+            if getattr(self, name) is not None:
+                arrays[name] = getattr(self, name)
+        for j, table in self.category_tables.items():
+            arrays[f'category_table_{j}'] = table
+        with open(path, 'wb') as model_file:
+            np.savez_compressed(model_file, meta=np.array(json.dumps(self.meta)), **arrays)
+
+    def predict_matrix(self, matrix):
+        """Class labels for a float matrix of raw intake fields in feature order"""
+        if self.numeric is not None:
+            matrix = self.preprocess(matrix)
+        leaves = self.walk(matrix)
+        if self.kind == 'forest':
+            return self.classes_.take(np.argmax(self.forest_proba(leaves), axis=1))
+        return self.classes_.take(self.xgboost_classes(leaves))
+
+    def preprocess(self, matrix):
+        """Same arithmetic as inference.CompiledPreprocessor, from the exported arrays"""
+        output = self.base_output + (matrix[:, self.numeric] - self.base_numeric) @ self.numeric_weights
+        for j, table in self.category_tables.items():
+            output += table[matrix[:, j].astype(int)]
+        return output
+
+    def walk(self, matrix):
+        """Leaf node id reached in every tree, shape (records, trees)"""
+        if self.kind == 'xgboost':
+            values = matrix.astype(np.float32)
+        else:
+            # sklearn trees see float32 inputs but keep float64 thresholds
+            values = matrix.astype(np.float32).astype(np.float64)
+        rows = np.arange(len(values))[:, None]
+        nodes = np.broadcast_to(self.roots, (len(values), len(self.roots)))
+        has_missing = np.isnan(values).any()
+        for _ in range(self.depth):
+            x = values[rows, self.feature[nodes]]
+            if self.kind == 'xgboost':
+                go_left = x < self.threshold[nodes]
+            else:
+                go_left = x <= self.threshold[nodes]
+            if has_missing:
+                go_left = np.where(np.isnan(x), self.missing_left[nodes], go_left)
+            nodes = np.where(go_left, self.left[nodes], self.right[nodes])
+        return nodes
+
+    def forest_proba(self, leaves):
+        """Per-tree class probabilities summed in tree order, then averaged"""
+        proba = np.cumsum(self.value[leaves], axis=1)[:, -1]
+        return proba / leaves.shape[1]
+
+    def xgboost_classes(self, leaves):
+        """Class index from XGBoost margins, with the objective's float32 transform"""
+        n_classes = len(self.base_margin)
+        margins = np.empty((len(leaves), n_classes), dtype=np.float32)
+        leaf_values = self.value[leaves]
+        for c in range(n_classes):
+            columns = np.flatnonzero(self.tree_class == c)
+            # Prepend the base margin and add trees one at a time, as XGBoost does
+            terms = np.concatenate([np.full((len(leaves), 1), self.base_margin[c], dtype=np.float32),
+                                    leaf_values[:, columns]], axis=1)
+            margins[:, c] = np.cumsum(terms, axis=1, dtype=np.float32)[:, -1]
+
+        objective = self.meta['objective']
+        if objective == 'binary:logistic':
+            proba = np.float32(1) / (np.float32(1) + np.exp(-margins[:, 0]))
+            return (proba > np.float32(0.5)).astype(int)
+        if objective == 'multi:softprob':
+            # argmax of the softmax, including its float32 rounding
+            exp = np.exp(margins - margins.max(axis=1, keepdims=True))
+            return np.argmax(exp / exp.sum(axis=1, keepdims=True), axis=1)
+        return np.argmax(margins, axis=1)
+
+def pack_trees(trees):
+    """Concatenate per-tree node arrays; leaves become self-loops on feature 0"""
+    arrays = {name: [] for name in ('feature', 'threshold', 'left', 'right', 'missing_left', 'value')}
+    roots = []
+    depth = 0
+    offset = 0
+    for tree in trees:
+        count = len(tree['feature'])
+        leaf = tree['left'] < 0
+        ids = np.arange(count) + offset
+        roots.append(offset)
+        arrays['feature'].append(np.where(leaf, 0, tree['feature']))
+        arrays['threshold'].append(tree['threshold'])
+        arrays['left'].append(np.where(leaf, ids, tree['left'] + offset))
+        arrays['right'].append(np.where(leaf, ids, tree['right'] + offset))
+        arrays['missing_left'].append(tree['missing_left'])
+        arrays['value'].append(tree['value'])
+        depth = max(depth, tree_depth(tree['left'], tree['right']))
+        offset += count
+
+    packed = {name: np.concatenate(values) for name, values in arrays.items()}
+    packed['feature'] = packed['feature'].astype(np.int32)
+    packed['left'] = packed['left'].astype(np.int32)
+    packed['right'] = packed['right'].astype(np.int32)
+    packed['missing_left'] = packed['missing_left'].astype(bool)
+    packed['roots'] = np.array(roots, dtype=np.int32)
+    return packed, depth
+
+def tree_depth(left, right):
+    depth = 0
+    level = [0]
+    while level:
+        level = [child for node in level for child in (left[node], right[node]) if child >= 0]
+        depth += 1 if level else 0
+    return depth
+
+def xgboost_trees(estimator):
+    """Trees, tree classes, base margins and objective from an XGBClassifier or Booster"""
+    booster = estimator.get_booster() if hasattr(estimator, 'get_booster') else estimator
+    learner = json.loads(booster.save_raw('json'))['learner']
+    objective = learner['objective']['name']
+    if learner['gradient_booster']['name'] != 'gbtree':
+        raise ValueError(f"Only gbtree boosters can be compiled, not {learner['gradient_booster']['name']}")
+    if objective not in ('binary:logistic', 'multi:softprob', 'multi:softmax'):
+        raise ValueError(f"Unsupported XGBoost objective: {objective}")
+
+    model = learner['gradient_booster']['model']
+    trees = model['trees']
+    best_iteration = getattr(estimator, 'best_iteration', None)
+    if best_iteration is not None and 'iteration_indptr' in model:
+        # XGBClassifier.predict stops at the best iteration when early stopping was used
+        trees = trees[:model['iteration_indptr'][best_iteration + 1]]
+
+    nodes = []
+    for tree in trees:
+        if any(tree.get('split_type', [])):
+            raise ValueError("Categorical splits cannot be compiled")
+        left = np.array(tree['left_children'])
+        nodes.append({
+            'feature': np.array(tree['split_indices']),
+            'threshold': np.array(tree['split_conditions'], dtype=np.float32),
+            'left': left,
+            'right': np.array(tree['right_children']),
+            'missing_left': np.array(tree['default_left'], dtype=bool),
+            # Leaves hold their value in split_conditions
+            'value': np.where(left < 0, np.array(tree['split_conditions'], dtype=np.float32), 0).astype(np.float32)
+        })
+
+    n_classes = max(int(learner['learner_model_param'].get('num_class', 0)), 1)
+    base_score = json.loads(learner['learner_model_param']['base_score'].lower())
+    base_score = np.atleast_1d(np.array(base_score, dtype=np.float32))
+    if objective == 'binary:logistic':
+        # Stored as a probability; predictions start from its logit
+        base_margin = np.log(base_score / (np.float32(1) - base_score)).astype(np.float32)
+    else:
+        base_margin = np.broadcast_to(base_score, (n_classes,)).astype(np.float32)
+
+    tree_class = np.array(model['tree_info'][:len(trees)], dtype=np.int32)
+    return nodes, tree_class, base_margin, objective
+
+def sklearn_trees(estimator):
+    """Trees from a fitted sklearn decision tree or forest classifier"""
+    estimators = getattr(estimator, 'estimators_', [estimator])
+    nodes = []
+    for tree_estimator in estimators:
+        tree = getattr(tree_estimator, 'tree_', None)
+        if tree is None or tree.n_outputs != 1:
+            raise ValueError(f"Unsupported estimator: {type(tree_estimator).__name__}")
+        # Normalized the way DecisionTreeClassifier.predict_proba does
+        value = tree.value[:, 0, :len(estimator.classes_)].astype(np.float64)
+        normalizer = value.sum(axis=1, keepdims=True)
+        normalizer[normalizer == 0.0] = 1.0
+        missing_left = getattr(tree, 'missing_go_to_left', None)
+        nodes.append({
+            'feature': np.array(tree.feature),
+            'threshold': np.array(tree.threshold, dtype=np.float64),
+            'left': np.array(tree.children_left),
+            'right': np.array(tree.children_right),
+            'missing_left': np.zeros(tree.node_count, dtype=bool) if missing_left is None else np.array(missing_left, dtype=bool),
+            'value': value / normalizer
+        })
+    return nodes
+
+def compile_triage_model(model):
+    """CompiledTriageModel equivalent to a loaded triage model; raises ValueError if unsupported"""
+    inference = TriageInference(model)
+    if inference.path != 'matrix':
+        raise ValueError("Only models verified on the float-matrix path can be compiled: the model must predict "
+                         "from raw intake fields and any preprocessing must be affine")
+    estimator = inference.estimator
+
+    meta = {
+        'format_version': FORMAT_VERSION,
+        'features': inference.features,
+        'categorical_codes': {feature: CATEGORICAL_CODES[feature] for feature in inference.features if feature in CATEGORICAL_CODES},
+        'classes': [int(label) for label in estimator.classes_],
+        'source': f"{type(model).__module__}.{type(model).__name__}"
+    }
+    arrays = {}
+    if inference.preprocess is not None:
+        preprocess = inference.preprocess
+        arrays['numeric'] = np.array(preprocess.numeric, dtype=np.int32)
+        arrays['base_numeric'] = preprocess.base_numeric
+        arrays['base_output'] = preprocess.base_output
+        arrays['numeric_weights'] = preprocess.numeric_weights
+        for j, table in preprocess.category_tables.items():
+            arrays[f'category_table_{j}'] = table
+
+    if type(estimator).__module__.startswith('xgboost'):
+        nodes, tree_class, base_margin, objective = xgboost_trees(estimator)
+        meta.update(kind='xgboost', objective=objective)
+        arrays['tree_class'] = tree_class
+        arrays['base_margin'] = base_margin
+    else:
+        nodes = sklearn_trees(estimator)
+        meta['kind'] = 'forest'
+
+    packed, meta['depth'] = pack_trees(nodes)
+    arrays.update(packed)
+    return CompiledTriageModel(arrays, meta)
+
+def parity_records(samples=20000, seed=0):
+    """Probe, golden and random intake records, with Shock_Index and NEWS2 derived"""
+    from .features import news2_scores, shock_indices
+    from .registry import load_golden_set
+
+    rng = np.random.default_rng(seed)
+    columns = {
+        'Pulse_Rate': rng.integers(20, 200, samples).astype(float),
+        'Systolic_BP': rng.integers(50, 250, samples).astype(float),
+        'Respiratory_Rate': rng.integers(4, 45, samples).astype(float),
+        'SPO2': rng.integers(70, 101, samples).astype(float),
+        'Temperature': rng.uniform(32, 42, samples).round(1),
+        'AVPU': rng.choice(list(CATEGORICAL_CODES['AVPU']), samples),
+        'Lactate': rng.uniform(0.2, 15, samples).round(1)
+    }
+    columns['Shock_Index'] = shock_indices(columns)
+    columns['NEWS2'] = news2_scores(columns)
+    records = [
+        {field: (str(values[i]) if field == 'AVPU' else float(values[i])) for field, values in columns.items()}
+        for i in range(samples)
+    ]
+    return list(PROBE_RECORDS) + load_golden_set()[0] + records
+
+def check_parity(model, compiled, records=None):
+    """Records where the compiled model's risk level differs from the original model's"""
+    import pandas as pd
+    records = records if records is not None else parity_records()
+    features = list(getattr(model, 'feature_names_in_', DEFAULT_FEATURES))
+    try:
+        expected = np.asarray(model.predict(pd.DataFrame(records, columns=features))).astype(int)
+    except Exception as e:
+        # Encoding the records first would use the same guessed category codes as the export
+        raise ValueError(f"The original model cannot predict from raw intake fields, so parity cannot be checked: {str(e)}")
+    actual = np.asarray(compiled.predict_matrix(encode_records(records, compiled.feature_names_in_))).astype(int)
+    return [(record, int(e), int(a)) for record, e, a in zip(records, expected, actual) if e != a]
+
+if __name__ == '__main__':
+    from .triage_model import load_triage_model
+
+    if len(sys.argv) != 3:
+        raise SystemExit("Usage: python -m src.models.compiled_trees model.joblib model.npz")
+    source_path, target_path = sys.argv[1], sys.argv[2]
+    model = load_triage_model(source_path)
+    try:
+        compiled = compile_triage_model(model)
+        records = parity_records()
+        mismatches = check_parity(model, compiled, records)
+    except ValueError as e:
+        raise SystemExit(f"Not exported: {str(e)}")
+    if mismatches:
+        for record, expected, actual in mismatches[:10]:
+            print(f"Mismatch: {record} -> {expected}, compiled {actual}")
+        raise SystemExit(f"{len(mismatches)} of {len(records)} parity records differ; nothing written")
+
+    compiled.save(target_path)
+    print(f"{len(compiled.roots)} trees, {len(compiled.feature)} nodes, depth {compiled.depth}; "
+          f"identical on all {len(records)} parity records; written to {target_path}")
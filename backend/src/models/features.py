@@ -0,0 +1,59 @@
+"""Vital-sign features fed to the triage model: NEWS2 and Shock Index.
+
+NEWS2 points come from band tables of closed [low, high] intervals per vital
+sign. A value is looked up with a sorted search over the band lower bounds,
+so a single record and a whole batch go through the same code. Values that
+fall between two bands (e.g. a respiratory rate of 8.5) score 0, the same as
+the original if/elif rules.
+"""
+import numpy as np
+
+# (low, high, points) closed intervals; values outside every band score 0
+NEWS2_BANDS = {
+    'Respiratory_Rate': [(-np.inf, 8, 3), (9, 11, 1), (21, 24, 2), (25, np.inf, 3)],
+    'SPO2': [(-np.inf, 92, 3), (93, 94, 2), (95, 96, 1)],  # Assuming room air
+    'Systolic_BP': [(-np.inf, 90, 3), (91, 100, 2), (101, 110, 1), (220, np.inf, 3)],
+    'Pulse_Rate': [(-np.inf, 40, 3), (41, 50, 1), (91, 110, 1), (111, 130, 2), (131, np.inf, 3)],
+    'Temperature': [(-np.inf, 35.0, 3), (35.1, 36.0, 1), (38.1, 39.0, 1), (39.1, np.inf, 2)]
+}
+
+# Points for any level of consciousness other than Alert
+AVPU_POINTS = 3
+
+class BandTable:
+    """Vectorized lookup of the points for one vital sign"""
+
+    def __init__(self, bands):
+        self.lows = np.array([low for low, _, _ in bands], dtype=float)
+        self.highs = np.array([high for _, high, _ in bands], dtype=float)
+        self.points = np.array([points for _, _, points in bands])
+
+    def __call__(self, values):
+        values = np.asarray(values, dtype=float)
+        index = np.searchsorted(self.lows, values, side='right') - 1
+        inside = (index >= 0) & (values <= self.highs[np.clip(index, 0, None)])
+        return np.where(inside, self.points[np.clip(index, 0, None)], 0)
+
+BAND_TABLES = {field: BandTable(bands) for field, bands in NEWS2_BANDS.items()}
+
+def news2_scores(vitals):
+    """NEWS2 scores for a DataFrame or dict of arrays, one entry per patient"""
+    score = sum(table(vitals[field]) for field, table in BAND_TABLES.items())
+    return score + np.where(np.asarray(vitals['AVPU']) != 'Alert', AVPU_POINTS, 0)
+
+def news2_score(record):
+    """NEWS2 score for one intake record"""
+    try:
+        vitals = {field: [float(record[field])] for field in BAND_TABLES}
+        vitals['AVPU'] = [record['AVPU']]
+    except (ValueError, KeyError) as e:
+        raise ValueError(f"Error calculating NEWS2 score: {str(e)}")
+    return int(news2_scores(vitals)[0])
+
+def shock_indices(vitals):
+    """Shock Index (pulse / systolic BP) for a DataFrame or dict of arrays"""
+    return np.asarray(vitals['Pulse_Rate'], dtype=float) / np.asarray(vitals['Systolic_BP'], dtype=float)
+
+def shock_index(record):
+    """Shock Index for one intake record; raises on a zero or non-numeric BP"""
+    return float(record['Pulse_Rate']) / float(record['Systolic_BP'])
@@ -0,0 +1,183 @@
+"""Mamdani fuzzy inference for patient priority, precompiled to a lookup grid.
+
+Implements the membership functions and rule base from
+`TriageAI- System Docs/Fuzzy Logic System.md`: min for AND and implication,
+max for aggregation and centroid defuzzification. The rule base is evaluated
+once over a dense grid of (risk, wait, resource, staff) points, and runtime
+scoring is a multilinear interpolation into that grid.
+
+The docs leave the "Priority IS Decreased" consequent of the availability rules
+undefined; it is treated as the VeryLow output set, so low availability pulls
+the centroid down in proportion to how strongly the rule fires.
+"""
+import functools
+import numpy as np
+
+# Membership functions as trapezoids (a, b, c, d); triangles have b == c
+RISK_SETS = {
+    'low': (0, 1, 1, 2),
+    'medium': (1, 2, 2, 3),
+    'high': (2, 3, 3, 4)
+}
+
+WAIT_SETS = {
+    'short': (0, 0, 15, 30),
+    'medium': (15, 45, 45, 75),
+    'long': (60, 90, 120, 120)
+}
+
+AVAILABILITY_SETS = {
+    'low': (0, 0, 30, 50),
+    'medium': (30, 60, 60, 90),
+    'high': (70, 90, 100, 100)
+}
+
+PRIORITY_SETS = {
+    'very_low': (0, 10, 10, 20),
+    'low': (10, 25, 25, 40),
+    'medium_low': (30, 45, 45, 60),
+    'medium': (50, 65, 65, 80),
+    'high': (70, 85, 85, 100),
+    'very_high': (90, 100, 100, 100)
+}
+
+# (risk set, wait set) -> priority set; None matches any wait
+RISK_WAIT_RULES = [
+    ('high', None, 'very_high'),
+    ('medium', 'long', 'high'),
+    ('medium', 'medium', 'medium'),
+    ('medium', 'short', 'medium_low'),
+    ('low', 'long', 'medium'),
+    ('low', 'medium', 'low'),
+    ('low', 'short', 'very_low')
+]
+
+# Low resource or staff availability -> Decreased
+DECREASED_SET = 'very_low'
+
+# Input domains; values outside are clipped before evaluation
+RISK_RANGE = (0, 4)
+WAIT_RANGE = (0, 120)
+AVAILABILITY_RANGE = (0, 100)
+
+# Availability only enters the rules through the Low set, which is flat
+# outside 30-50, so the grid only needs resolution inside that band
+AVAILABILITY_AXIS = np.concatenate([[0], np.arange(30, 51), [100]])
+
+# Grid axes and output universe resolution
+GRID_AXES = (
+    np.arange(0, 4.5, 0.5),      # risk level
+    np.arange(0, 121),           # waiting minutes
+    AVAILABILITY_AXIS,           # resource availability
+    AVAILABILITY_AXIS            # staff availability
+)
+OUTPUT_UNIVERSE = np.linspace(0, 100, 101)
+
+def trapezoid(x, a, b, c, d):
+    """Trapezoidal membership, vectorized; shoulders when a == b or c == d"""
+    x = np.asarray(x, dtype=float)
+    membership = np.zeros_like(x)
+    membership[(x >= b) & (x <= c)] = 1.0
+    if b > a:
+        rising = (x > a) & (x < b)
+        membership[rising] = (x[rising] - a) / (b - a)
+    if d > c:
+        falling = (x > c) & (x < d)
+        membership[falling] = (d - x[falling]) / (d - c)
+    return membership
+
+def _clip_inputs(risk, wait, resource, staff):
+    return (
+        np.clip(np.asarray(risk, dtype=float), *RISK_RANGE),
+        np.clip(np.asarray(wait, dtype=float), *WAIT_RANGE),
+        np.clip(np.asarray(resource, dtype=float), *AVAILABILITY_RANGE),
+        np.clip(np.asarray(staff, dtype=float), *AVAILABILITY_RANGE)
+    )
+
+def _output_set_strengths(risk, wait, resource, staff):
+    """Firing strength of each priority output set; inputs broadcast together"""
+    risk_m = {name: trapezoid(risk, *params) for name, params in RISK_SETS.items()}
+    wait_m = {name: trapezoid(wait, *params) for name, params in WAIT_SETS.items()}
+    resource_low = trapezoid(resource, *AVAILABILITY_SETS['low'])
+    staff_low = trapezoid(staff, *AVAILABILITY_SETS['low'])
+
+    shape = np.broadcast_shapes(risk.shape, wait.shape, resource.shape, staff.shape)
+    strengths = {name: np.zeros(shape) for name in PRIORITY_SETS}
+
+    for risk_set, wait_set, priority_set in RISK_WAIT_RULES:
+        strength = risk_m[risk_set] if wait_set is None else np.minimum(risk_m[risk_set], wait_m[wait_set])
+        strengths[priority_set] = np.maximum(strengths[priority_set], np.broadcast_to(strength, shape))
+
+    for low in (resource_low, staff_low):
+        strengths[DECREASED_SET] = np.maximum(strengths[DECREASED_SET], np.broadcast_to(low, shape))
+
+    return strengths
+
+def _defuzzify(strengths):
+    """Centroid of the clipped and max-aggregated output sets"""
+    aggregated = None
+    for name, params in PRIORITY_SETS.items():
+        clipped = np.minimum(strengths[name][..., None], trapezoid(OUTPUT_UNIVERSE, *params))
+        aggregated = clipped if aggregated is None else np.maximum(aggregated, clipped)
+
+    area = aggregated.sum(axis=-1)
+    moment = (aggregated * OUTPUT_UNIVERSE).sum(axis=-1)
+    # No rule fired -> lowest priority
+    return np.where(area > 0, moment / np.where(area > 0, area, 1), 0.0)
+
+def reference_priority(risk, wait, resource, staff):
+    """Direct rule evaluation for one patient (slow path, used to verify the grid)"""
+    inputs = [np.array([value]) for value in _clip_inputs(risk, wait, resource, staff)]
+    return float(_defuzzify(_output_set_strengths(*inputs))[0])
+
+@functools.lru_cache(maxsize=1)
+def compile_grid():
+    """Evaluate the rule base at every grid point, one risk slice at a time"""
+    risk_axis, wait_axis, resource_axis, staff_axis = GRID_AXES
+    grid = np.empty((len(risk_axis), len(wait_axis), len(resource_axis), len(staff_axis)))
+
+    wait = wait_axis[:, None, None].astype(float)
+    resource = resource_axis[None, :, None].astype(float)
+    staff = staff_axis[None, None, :].astype(float)
+    for i, risk in enumerate(risk_axis):
+        grid[i] = _defuzzify(_output_set_strengths(np.array(risk), wait, resource, staff))
+
+    return grid
+
+class MamdaniPriorityEngine:
+    """Scores patients by interpolating the precompiled Mamdani grid"""
+
+    def __init__(self):
+        self.grid = compile_grid()
+        self.axes = [axis.astype(float) for axis in GRID_AXES]
+
+    def evaluate(self, risk, wait, resource, staff):
+        """Priority score(s) in 0-100 for scalar or array inputs"""
+        points = _clip_inputs(risk, wait, resource, staff)
+        shape = np.broadcast_shapes(*(point.shape for point in points))
+        points = [np.broadcast_to(point, shape).ravel() for point in points]
+
+        # Lower corner index and fractional offset along each axis
+        lower = []
+        fraction = []
+        for axis, values in zip(self.axes, points):
+            index = np.clip(np.searchsorted(axis, values, side='right') - 1, 0, len(axis) - 2)
+            lower.append(index)
+            fraction.append((values - axis[index]) / (axis[index + 1] - axis[index]))
+
+        # Multilinear interpolation over the 16 corners of the enclosing cell
+        result = np.zeros(len(points[0]))
+        for corner in range(16):
+            offsets = [(corner >> bit) & 1 for bit in range(4)]
+            weight = np.ones(len(points[0]))
+            for offset, frac in zip(offsets, fraction):
+                weight *= frac if offset else (1 - frac)
+            index = tuple(low + offset for low, offset in zip(lower, offsets))
+            result += weight * self.grid[index]
+
+        return result.reshape(shape)
+
+@functools.lru_cache(maxsize=1)
+def get_mamdani_engine():
+    """Shared engine; the grid is compiled on first use"""
+    return MamdaniPriorityEngine()
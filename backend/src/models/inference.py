@@ -0,0 +1,280 @@
+"""Inference wrapper around the triage model.
+
+Builds model inputs straight from validated intake fields in the model's own
+feature order, so predictions no longer depend on the key order or extra fields
+of the request body, and skips pandas on the hot path:
+
+- a bare estimator gets a preallocated float matrix, with AVPU encoded as a
+  small integer code, if that matches what it predicts from the raw fields;
+- a pipeline (sklearn/imblearn) has its fitted preprocessing compiled into an
+  affine map over the numeric vitals plus a lookup table per categorical field
+  (e.g. the one-hot encoding of AVPU), and its final estimator is called on
+  the resulting float matrix.
+
+Either path is only used if it reproduces the model's own predictions on probe
+records; otherwise, or if the model cannot predict from the raw fields at all,
+the wrapper falls back to a DataFrame holding exactly the model's columns.
+
+A model exported by compiled_trees gets the same float matrix and evaluates
+its own preprocessing and trees in NumPy.
+
+Run `python -m src.models.inference [model.joblib]` for a single-prediction
+latency benchmark against the previous `pd.DataFrame([data])` path.
+"""
+import sys
+import time
+import warnings
+import numpy as np
+from .triage_model import load_triage_model
+
+# Feature order used when the model does not record the columns it was fitted on
+DEFAULT_FEATURES = [
+    'Pulse_Rate', 'Systolic_BP', 'Respiratory_Rate', 'SPO2',
+    'Temperature', 'AVPU', 'Lactate', 'Shock_Index', 'NEWS2'
+]
+
+# Integer codes of categorical fields on the float-matrix path
+CATEGORICAL_CODES = {
+    'AVPU': {'Alert': 0, 'Voice': 1, 'Pain': 2, 'Unresponsive': 3}
+}
+
+# Records used to compile and verify the fast paths
+PROBE_RECORDS = [
+    {'Pulse_Rate': 72, 'Systolic_BP': 120, 'Respiratory_Rate': 14, 'SPO2': 98, 'Temperature': 36.8,
+     'AVPU': 'Alert', 'Lactate': 1.0, 'Shock_Index': 72 / 120, 'NEWS2': 0},
+    {'Pulse_Rate': 118, 'Systolic_BP': 96, 'Respiratory_Rate': 23, 'SPO2': 93, 'Temperature': 38.6,
+     'AVPU': 'Voice', 'Lactate': 2.8, 'Shock_Index': 118 / 96, 'NEWS2': 12},
+    {'Pulse_Rate': 145, 'Systolic_BP': 78, 'Respiratory_Rate': 31, 'SPO2': 85, 'Temperature': 34.6,
+     'AVPU': 'Unresponsive', 'Lactate': 6.5, 'Shock_Index': 145 / 78, 'NEWS2': 18},
+    {'Pulse_Rate': 55, 'Systolic_BP': 230, 'Respiratory_Rate': 9, 'SPO2': 95, 'Temperature': 35.5,
+     'AVPU': 'Pain', 'Lactate': 3.9, 'Shock_Index': 55 / 230, 'NEWS2': 10}
+]
+
+def _dense(values):
+    if hasattr(values, 'toarray'):
+        values = values.toarray()
+    return np.asarray(values, dtype=float)
+
+def encode_columns(columns, count, features):
+    """Preallocated float matrix from column-oriented input, categories as codes"""
+    matrix = np.empty((count, len(features)), dtype=float)
+    for j, feature in enumerate(features):
+        values = columns.get(feature)
+        if values is None:
+            matrix[:, j] = np.nan
+        elif feature in CATEGORICAL_CODES:
+            codes = CATEGORICAL_CODES[feature]
+            try:
+                matrix[:, j] = [codes[value] for value in values]
+            except (KeyError, TypeError):
+                raise ValueError(f"Invalid value for {feature}. Must be one of: {', '.join(codes)}")
+        else:
+            matrix[:, j] = np.asarray(values, dtype=float)
+    return matrix
+
+def encode_records(records, features):
+    """Float matrix of raw intake fields in feature order"""
+    columns = {feature: [record.get(feature) for record in records] for feature in features}
+    return encode_columns(columns, len(records), features)
+
+class CompiledPreprocessor:
+    """Fitted pipeline preprocessing replayed as a numeric affine map plus category tables.
+
+    Built by probing the real transformers for the output of a base record,
+    the change per unit of each numeric field and the change for each
+    category. Only valid for preprocessing that is affine in the numeric
+    fields (passthrough, scalers) and additive across fields (column
+    transformers), which compile() checks before it is used.
+    """
+
+    def __init__(self, transformers, features):
+        self.transformers = transformers
+        self.features = features
+        self.numeric = [j for j, feature in enumerate(features) if feature not in CATEGORICAL_CODES]
+        self.categorical = [j for j, feature in enumerate(features) if feature in CATEGORICAL_CODES]
+
+        base = {feature: PROBE_RECORDS[0].get(feature, 0) for feature in features}
+        self.base_numeric = np.array([float(base[features[j]]) for j in self.numeric])
+        self.base_output = self.transform_records([base])[0]
+
+        self.numeric_weights = np.empty((len(self.numeric), len(self.base_output)))
+        for row, j in enumerate(self.numeric):
+            shifted = dict(base)
+            shifted[features[j]] = float(base[features[j]]) + 1
+            self.numeric_weights[row] = self.transform_records([shifted])[0] - self.base_output
+
+        self.category_tables = {}
+        for j in self.categorical:
+            codes = CATEGORICAL_CODES[features[j]]
+            table = np.empty((len(codes), len(self.base_output)))
+            for category, code in codes.items():
+                table[code] = self.transform_records([dict(base, **{features[j]: category})])[0] - self.base_output
+            self.category_tables[j] = table
+
+    def transform_records(self, records):
+        """Run the real transformers on records (slow, only used while compiling)"""
+        import pandas as pd
+        values = pd.DataFrame(records, columns=self.features)
+        for transformer in self.transformers:
+            values = transformer.transform(values)
+        return _dense(values)
+
+    def __call__(self, matrix):
+        output = self.base_output + (matrix[:, self.numeric] - self.base_numeric) @ self.numeric_weights
+        for j, table in self.category_tables.items():
+            output += table[matrix[:, j].astype(int)]
+        return output
+
+    @classmethod
+    def compile(cls, transformers, features):
+        """Compile the transformers, or return None if they are not affine and additive"""
+        try:
+            compiled = cls(transformers, features)
+            records = []
+            for record in PROBE_RECORDS:
+                record = {feature: record.get(feature, 0) for feature in features}
+                records.append(record)
+                # Scaled copies catch transformers that are not affine in the numeric fields
+                records.append({
+                    feature: value if isinstance(value, str) else value * 1.5
+                    for feature, value in record.items()
+                })
+            expected = compiled.transform_records(records)
+            actual = compiled(encode_records(records, features))
+        except Exception:
+            return None
+
+        if actual.shape != expected.shape or not np.allclose(actual, expected, rtol=1e-9, atol=1e-9):
+            return None
+        return compiled
+
+class TriageInference:
+    """Predicts risk levels with the loaded triage model"""
+
+    def __init__(self, model, version=None):
+        self.model = model
+        # Identifies the model file this wrapper serves; recorded with each prediction
+        self.version = version
+        self.features = list(getattr(model, 'feature_names_in_', DEFAULT_FEATURES))
+        self.estimator = None
+        self.preprocess = None
+        self.path = 'dataframe'
+        if model is not None:
+            self._select_path()
+
+    def predict_one(self, record):
+        """Risk level for one intake record"""
+        return int(self.predict([record])[0])
+
+    def predict(self, records):
+        """Risk levels for a list of intake records"""
+        columns = {feature: [record.get(feature) for record in records] for feature in self.features}
+        return self.predict_columns(columns, len(records))
+
+    def predict_columns(self, columns, count=None):
+        """Risk levels for column-oriented input (a DataFrame or a dict of sequences)"""
+        if self.model is None:
+            raise RuntimeError("Triage model is not loaded")
+
+        if count is None:
+            count = len(columns[self.features[0]])
+
+        if self.path == 'dataframe':
+            return np.asarray(self.model.predict(self.build_frame(columns))).astype(int)
+
+        matrix = encode_columns(columns, count, self.features)
+        if self.path == 'compiled':
+            return np.asarray(self.model.predict_matrix(matrix)).astype(int)
+        if self.preprocess is not None:
+            matrix = self.preprocess(matrix)
+        with warnings.catch_warnings():
+            # Estimators fitted on DataFrames warn about missing feature names
+            warnings.simplefilter('ignore', UserWarning)
+            return np.asarray(self.estimator.predict(matrix)).astype(int)
+
+    def build_frame(self, columns):
+        """DataFrame holding exactly the model's columns, in order"""
+        import pandas as pd
+        return pd.DataFrame({feature: columns.get(feature) for feature in self.features}, columns=self.features)
+
+    def _select_path(self):
+        """Use the float-matrix path if it reproduces the model's own predictions"""
+        if hasattr(self.model, 'predict_matrix'):
+            # Exported by compiled_trees, already checked against the original model
+            self.path = 'compiled'
+            return
+
+        records = [{feature: record.get(feature, 0) for feature in self.features} for record in PROBE_RECORDS]
+        try:
+            expected = np.asarray(self.model.predict(self.build_frame(
+                {feature: [record[feature] for record in records] for feature in self.features}
+            ))).astype(int)
+        except Exception:
+            # Nothing to verify the matrix path against, and its category codes are
+            # only a guess at the model's encoding; keep the DataFrame path
+            return
+
+        steps = getattr(self.model, 'steps', None)
+        if steps:
+            # Samplers such as SMOTE only act during fit and are skipped at predict time
+            transformers = [
+                step for _, step in steps[:-1]
+                if step not in (None, 'passthrough') and hasattr(step, 'transform')
+            ]
+            self.preprocess = CompiledPreprocessor.compile(transformers, self.features)
+            if self.preprocess is None:
+                return
+            self.estimator = steps[-1][1]
+        else:
+            self.estimator = self.model
+
+        self.path = 'matrix'
+        try:
+            actual = self.predict(records)
+        except Exception:
+            actual = None
+        if actual is None or actual.shape != expected.shape or not np.all(actual == expected):
+            self.path = 'dataframe'
+            self.estimator = None
+            self.preprocess = None
+
+def benchmark(model, iterations=2000):
+    """p50/p99 single-prediction latency of the old and new paths, in microseconds"""
+    import pandas as pd
+
+    inference = TriageInference(model)
+    record = PROBE_RECORDS[1]
+
+    def dataframe_path():
+        model.predict(pd.DataFrame([record]))
+
+    def wrapper_path():
+        inference.predict_one(record)
+
+    results = {}
+    for name, call in (('dataframe', dataframe_path), ('wrapper', wrapper_path)):
+        for _ in range(50):
+            call()  # Warm up
+        timings = np.empty(iterations)
+        for i in range(iterations):
+            started = time.perf_counter()
+            call()
+            timings[i] = (time.perf_counter() - started) * 1e6
+        results[name] = {
+            'p50_us': float(np.percentile(timings, 50)),
+            'p99_us': float(np.percentile(timings, 99))
+        }
+
+    results['wrapper']['path'] = inference.path
+    return results
+
+if __name__ == '__main__':
+    try:
+        model = load_triage_model(sys.argv[1] if len(sys.argv) > 1 else None)
+    except Exception as e:
+        raise SystemExit(f"No triage model loaded ({e}); pass the path to a .joblib model")
+
+    results = benchmark(model)
+    print(f"pd.DataFrame([data]) + predict: p50 {results['dataframe']['p50_us']:.0f} us, p99 {results['dataframe']['p99_us']:.0f} us")
+    print(f"TriageInference.predict_one ({results['wrapper']['path']} path): "
+          f"p50 {results['wrapper']['p50_us']:.0f} us, p99 {results['wrapper']['p99_us']:.0f} us")
@@ -0,0 +1,253 @@
+import hashlib
+import json
+import os
+import threading
+import time
+from datetime import datetime
+from .triage_model import load_triage_model, model_path
+from .inference import TriageInference
+from .features import news2_score, shock_index
+
+# Intake records with clear-cut risk levels that every deployed model must reproduce
+GOLDEN_SET_PATH = os.path.join(os.path.dirname(__file__), 'golden_vitals.json')
+
+class ModelValidationError(Exception):
+    """Raised when a candidate model fails the golden-set check"""
+
+def file_version(path):
+    """Short content hash identifying one model file"""
+    digest = hashlib.sha256()
+    with open(path, 'rb') as model_file:
+        for chunk in iter(lambda: model_file.read(1 << 20), b''):
+            digest.update(chunk)
+    return digest.hexdigest()[:12]
+
+def load_golden_set(path=GOLDEN_SET_PATH):
+    """Golden records with Shock_Index and NEWS2 derived, and their expected risk levels"""
+    with open(path) as golden_file:
+        cases = json.load(golden_file)
+    records = []
+    for case in cases:
+        record = dict(case['vitals'])
+        record['Shock_Index'] = shock_index(record)
+        record['NEWS2'] = news2_score(record)
+        records.append(record)
+    return records, [case['risk_level'] for case in cases]
+
+def validate_triage_inference(inference, min_agreement=None):
+    """Check a loaded model against the golden set; raises ModelValidationError"""
+    min_agreement = min_agreement if min_agreement is not None else float(os.environ.get('MODEL_GOLDEN_MIN_AGREEMENT', 1.0))
+    records, expected = load_golden_set()
+    try:
+        predicted = [int(level) for level in inference.predict(records)]
+    except Exception as e:
+        raise ModelValidationError(f"Prediction on the golden set failed: {str(e)}")
+
+    invalid = sorted(set(level for level in predicted if level not in (0, 1, 2)))
+    if invalid:
+        raise ModelValidationError(f"Predicted unknown risk levels: {invalid}")
+
+    agreement = sum(1 for p, e in zip(predicted, expected) if p == e) / len(expected)
+    if agreement < min_agreement:
+        raise ModelValidationError(
+            f"Agrees with {agreement:.0%} of the {len(expected)} golden cases; at least {min_agreement:.0%} required"
+        )
+    return {'golden_cases': len(expected), 'golden_agreement': agreement}
+
+class ModelRegistry:
+    """Serves one model from a file and swaps in new versions of it while running.
+
+    Nothing is read from disk at import time, so the app can answer
+    /api/health while the first version is still loading. A first version that
+    fails to load or validate is not served either: the failure is kept with
+    its error, get() raises it, and tries again once `retry_seconds` have
+    passed or the watcher sees the file change.
+
+    A new version (the file's content hash changed) is loaded, built and
+    checked by `validate` on the file watcher's thread or in the reload
+    endpoint, while requests keep using the current one. It is then swapped
+    in with a single reference assignment. A version that fails to load or
+    validate is never served. get() only reads that reference, so predictions
+    never wait on a reload.
+    """
+
+    def __init__(self, name, path, build, validate=None, retry_seconds=None, watch_seconds=None):
+        self.name = name
+        self.path = path
+        self.build = build
+        self.validate = validate
+        self.retry_seconds = retry_seconds or float(os.environ.get('MODEL_RETRY_SECONDS', 30))
+        self.watch_seconds = watch_seconds if watch_seconds is not None else float(os.environ.get('MODEL_WATCH_SECONDS', 30))
+        self._active = None  # {'model', 'version', 'loaded_at', 'load_seconds', 'validation'}
+        self._state = 'not_loaded'
+        self._error = None
+        self._failed_at = None
+        self._last_reload = None
+        self._history = []
+        self._file_signature = None
+        self._lock = threading.Lock()
+        self._watcher = None
+        self._swap_listeners = []
+        if hasattr(os, 'register_at_fork'):
+            os.register_at_fork(after_in_child=self._after_fork)
+
+    def get(self):
+        """The active model, loading the first version now if nobody has yet"""
+        active = self._active
+        if active is not None:
+            return active['model']
+        with self._lock:
+            if self._active is None and (self._state == 'not_loaded' or (
+                    self._state == 'failed' and time.monotonic() - self._failed_at >= self.retry_seconds)):
+                self._load_first()
+        if self._active is None:
+            raise RuntimeError(f"{self.name} is not loaded: {self._error}")
+        return self._active['model']
+
+    def warm(self):
+        """Load the first version now (again, if an earlier attempt failed); returns whether one is active"""
+        with self._lock:
+            if self._active is None:
+                self._load_first()
+        return self._active is not None
+
+    def reload(self):
+        """Load the file again and swap it in if it is a new version that validates.
+
+        Returns a summary of the attempt; the active version is unchanged on failure.
+        """
+        with self._lock:
+            if self._active is None:
+                self._load_first()
+                return self._last_reload
+
+            started = time.perf_counter()
+            attempt = {'at': datetime.now().isoformat(), 'from_version': self._active['version']}
+            try:
+                self._file_signature = self._signature()
+                version = file_version(self.path)
+                attempt['version'] = version
+                if version == self._active['version']:
+                    attempt['outcome'] = 'unchanged'
+                else:
+                    candidate = self._build(version)
+                    # Validation also warms the new model before it takes traffic
+                    candidate['validation'] = self.validate(candidate['model']) if self.validate else None
+                    candidate['load_seconds'] = time.perf_counter() - started
+                    self._active = candidate
+                    attempt['outcome'] = 'swapped'
+                    self._history.append({'version': version, 'loaded_at': candidate['loaded_at']})
+                    del self._history[:-10]
+                    print(f"{self.name} version {version} swapped in after {candidate['load_seconds']:.2f}s")
+                    self._notify_swap(version)
+            except Exception as e:
+                attempt['outcome'] = 'rejected'
+                attempt['error'] = str(e)
+                print(f"{self.name} reload rejected: {str(e)}")
+
+            attempt['seconds'] = time.perf_counter() - started
+            self._last_reload = attempt
+            return attempt
+
+    def signal_reload(self):
+        """Touch the model file so the watcher in every process sharing it reloads it"""
+        os.utime(self.path)
+
+    def add_swap_listener(self, listener):
+        """Call listener(version) after each swap, e.g. to drop results cached for the old version"""
+        self._swap_listeners.append(listener)
+
+    def start_watching(self):
+        """Poll the model file and reload when it changes; off when watch_seconds is 0"""
+        if self.watch_seconds <= 0 or (self._watcher is not None and self._watcher.is_alive()):
+            return
+        self._watcher = threading.Thread(target=self._watch, name='model-watcher', daemon=True)
+        self._watcher.start()
+
+    def status(self):
+        active = self._active
+        return {
+            'name': self.name,
+            'path': self.path,
+            'state': self._state,
+            'error': self._error,
+            'version': active['version'] if active else None,
+            'loaded_at': active['loaded_at'] if active else None,
+            'load_seconds': active['load_seconds'] if active else None,
+            'validation': active['validation'] if active else None,
+            'last_reload': self._last_reload,
+            'history': list(self._history)
+        }
+
+    def _load_first(self):
+        """Load whatever the file holds now; caller holds the lock"""
+        self._state = 'loading'
+        started = time.perf_counter()
+        try:
+            self._file_signature = self._signature()
+            version = file_version(self.path)
+            candidate = self._build(version)
+            candidate['validation'] = self.validate(candidate['model']) if self.validate else None
+        except Exception as e:
+            print(f"Error loading {self.name}: {str(e)}")
+            self._state = 'failed'
+            self._failed_at = time.monotonic()
+            self._error = str(e)
+            self._last_reload = {'at': datetime.now().isoformat(), 'outcome': 'failed', 'error': str(e)}
+            return
+
+        candidate['load_seconds'] = time.perf_counter() - started
+        self._active = candidate
+        self._state = 'ready'
+        self._error = None
+        self._history.append({'version': version, 'loaded_at': candidate['loaded_at']})
+        self._last_reload = {'at': candidate['loaded_at'], 'version': version, 'outcome': 'loaded'}
+        print(f"{self.name} version {version} loaded in {candidate['load_seconds']:.2f}s")
+
+    def _build(self, version):
+        return {
+            'model': self.build(self.path, version),
+            'version': version,
+            'loaded_at': datetime.now().isoformat()
+        }
+
+    def _notify_swap(self, version):
+        # The swap already happened; a failing listener must not report it as rejected
+        for listener in self._swap_listeners:
+            try:
+                listener(version)
+            except Exception as e:
+                print(f"{self.name} swap listener failed: {str(e)}")
+
+    def _signature(self):
+        stat = os.stat(self.path)
+        return (stat.st_mtime_ns, stat.st_size)
+
+    def _watch(self):
+        while True:
+            time.sleep(self.watch_seconds)
+            try:
+                signature = self._signature()
+            except OSError:
+                # Mid-replacement or removed; keep serving the active version
+                continue
+            if signature == self._file_signature:
+                continue
+            if self._active is not None:
+                self.reload()
+            elif self._state == 'failed':
+                # A replacement for a first version that failed; no need to wait for retry_seconds
+                self.warm()
+
+    def _after_fork(self):
+        # A load or watcher running on another thread did not survive the fork; the active model is shared
+        self._lock = threading.Lock()
+        self._watcher = None
+        if self._state == 'loading':
+            self._state = 'not_loaded'
+
+def build_triage_inference(path, version):
+    return TriageInference(load_triage_model(path), version=version)
+
+# Shared per process; a model warmed before fork is shared copy-on-write by workers
+model_registry = ModelRegistry('Triage model', model_path, build_triage_inference, validate_triage_inference)
@@ -0,0 +1,151 @@
+import os
+import queue
+import threading
+import time
+from .registry import ModelRegistry, build_triage_inference
+from ..wait_stats import LogHistogram
+
+RISK_LEVELS = (0, 1, 2)
+
+class ShadowEvaluator:
+    """Scores live intake records with a candidate model, off the request path.
+
+    Requests hand over a copy of the record with the production risk level and
+    how long the production prediction took; submit() only puts it on a
+    bounded queue and never waits. Worker threads run the candidate model and
+    keep agreement counts, a production x candidate confusion matrix and
+    latency histograms. Records are scored in batches of up to `batch_size`
+    collected over `batch_wait` seconds, so the workers run rarely and briefly
+    next to the request threads. When the queue is full, records are dropped (and
+    counted) rather than slowing intake down.
+    """
+
+    def __init__(self, path, workers=None, max_pending=None, batch_size=None):
+        self.path = path
+        self.workers = workers or int(os.environ.get('SHADOW_WORKERS', 1))
+        self.max_pending = max_pending or int(os.environ.get('SHADOW_MAX_PENDING', 1000))
+        self.batch_size = batch_size or int(os.environ.get('SHADOW_BATCH_SIZE', 64))
+        self.batch_wait = float(os.environ.get('SHADOW_BATCH_WAIT_SECONDS', 1))
+        self.registry = ModelRegistry('Shadow model', path, build_triage_inference) if path else None
+
+        self._queue = queue.Queue(maxsize=self.max_pending)
+        self._threads = []
+        self._start_lock = threading.Lock()
+        self._stats_lock = threading.Lock()
+        self.reset()
+
+    @property
+    def enabled(self):
+        return self.registry is not None
+
+    def submit(self, record, risk_level, model_version, latency_ms, source):
+        """Queue one production prediction for shadow scoring; returns immediately"""
+        if not self.enabled:
+            return
+        self._ensure_started()
+        try:
+            self._queue.put_nowait((dict(record), risk_level, model_version, latency_ms, source))
+        except queue.Full:
+            with self._stats_lock:
+                self._counts['dropped'] += 1
+            return
+        with self._stats_lock:
+            self._counts['submitted'] += 1
+
+    def reset(self):
+        """Start a new comparison, e.g. after swapping the candidate"""
+        with self._stats_lock:
+            self._counts = {'submitted': 0, 'evaluated': 0, 'agreed': 0, 'dropped': 0, 'errors': 0}
+            self._confusion = [[0 for _ in RISK_LEVELS] for _ in RISK_LEVELS]
+            self._by_source = {}
+            # production: one predict_one call; candidate: its share of a batched call; candidate_batch: the whole call
+            self._latency = {name: LogHistogram(min_value=0.001) for name in ('production', 'candidate', 'candidate_batch')}
+            self._versions = {}
+
+    def stats(self):
+        if not self.enabled:
+            return {'enabled': False}
+        with self._stats_lock:
+            counts = dict(self._counts)
+            confusion = [list(row) for row in self._confusion]
+            by_source = {
+                source: dict(values, agreement_rate=values['agreed'] / values['evaluated'] if values['evaluated'] else None)
+                for source, values in self._by_source.items()
+            }
+            latency = {}
+            for name, histogram in self._latency.items():
+                p50, p90, p99 = histogram.quantiles([0.5, 0.9, 0.99])
+                latency[name] = {'count': histogram.count, 'p50_ms': p50, 'p90_ms': p90, 'p99_ms': p99}
+            versions = dict(self._versions)
+
+        counts['agreement_rate'] = counts['agreed'] / counts['evaluated'] if counts['evaluated'] else None
+        counts['pending'] = self._queue.qsize()
+        return {
+            'enabled': True,
+            'candidate': self.registry.status(),
+            'compared_versions': versions,
+            'counts': counts,
+            'by_source': by_source,
+            # confusion[production risk level][candidate risk level]
+            'confusion': confusion,
+            'latency': latency
+        }
+
+    def _ensure_started(self):
+        if len(self._threads) == self.workers and all(thread.is_alive() for thread in self._threads):
+            return
+        with self._start_lock:
+            # Threads do not survive a fork, so a worker process starts its own
+            self._threads = [thread for thread in self._threads if thread.is_alive()]
+            while len(self._threads) < self.workers:
+                thread = threading.Thread(target=self._run, name=f'shadow-model-{len(self._threads)}', daemon=True)
+                thread.start()
+                self._threads.append(thread)
+            self.registry.start_watching()
+
+    def _run(self):
+        while True:
+            jobs = [self._queue.get()]
+            deadline = time.monotonic() + self.batch_wait
+            while len(jobs) < self.batch_size:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                try:
+                    jobs.append(self._queue.get(timeout=remaining))
+                except queue.Empty:
+                    break
+            try:
+                self._evaluate(jobs)
+            except Exception as e:
+                print(f"Shadow model evaluation failed: {str(e)}")
+                with self._stats_lock:
+                    self._counts['errors'] += len(jobs)
+
+    def _evaluate(self, jobs):
+        candidate = self.registry.get()
+        started = time.perf_counter()
+        levels = candidate.predict([job[0] for job in jobs])
+        # One call scores the whole batch; each record is charged its share
+        batch_ms = (time.perf_counter() - started) * 1000
+        latency_ms = batch_ms / len(jobs)
+
+        with self._stats_lock:
+            self._latency['candidate_batch'].add(batch_ms)
+            for (record, risk_level, model_version, production_ms, source), level in zip(jobs, levels):
+                level = int(level)
+                agreed = level == risk_level
+                self._counts['evaluated'] += 1
+                self._counts['agreed'] += int(agreed)
+                if risk_level in RISK_LEVELS and level in RISK_LEVELS:
+                    self._confusion[risk_level][level] += 1
+                source_counts = self._by_source.setdefault(source, {'evaluated': 0, 'agreed': 0})
+                source_counts['evaluated'] += 1
+                source_counts['agreed'] += int(agreed)
+                self._latency['production'].add(production_ms)
+                self._latency['candidate'].add(latency_ms)
+                key = f"{model_version} vs {candidate.version}"
+                self._versions[key] = self._versions.get(key, 0) + 1
+
+# Shared per process; disabled unless SHADOW_MODEL_PATH names a candidate model file
+shadow_evaluator = ShadowEvaluator(os.environ.get('SHADOW_MODEL_PATH'))
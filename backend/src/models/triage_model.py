@@ -1,15 +1,15 @@
-import joblib
 import os
 
-# Load the trained model from file with error handling
-model_path = os.path.join(os.path.dirname(__file__), 'triage_model.joblib')
+# Trained model shipped next to this module; TRIAGE_MODEL_PATH can point elsewhere
+model_path = os.environ.get('TRIAGE_MODEL_PATH', os.path.join(os.path.dirname(__file__), 'triage_model.joblib'))
 
-try:
-    triage_model = joblib.load(model_path)
-    print("Model loaded successfully.")
-except FileNotFoundError:
-    print(f"Model file not found at path: {model_path}")
-    triage_model = None
-except Exception as e:
-    print(f"Error loading model: {str(e)}")
-    triage_model = None
+def load_triage_model(path=None):
+    """Load the trained model from file; raises if it is missing or cannot be read"""
+    path = path or model_path
+    if path.endswith('.npz'):
+        # Exported by `python -m src.models.compiled_trees`; needs NumPy only
+        from .compiled_trees import CompiledTriageModel
+        return CompiledTriageModel.load(path)
+    # joblib (and the sklearn/xgboost modules the pickle needs) are only imported here
+    import joblib
+    return joblib.load(path)
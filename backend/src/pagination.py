@@ -0,0 +1,110 @@
+import json
+import os
+import re
+from flask import Response, jsonify, request, stream_with_context
+from .supabase_client import supabase_request
+
+# Rows fetched per Supabase request while walking a table
+PAGE_SIZE = int(os.environ.get('LIST_PAGE_SIZE', 500))
+# Largest page a client may ask for with limit=
+MAX_LIMIT = int(os.environ.get('LIST_MAX_LIMIT', 1000))
+
+FIELD_PATTERN = re.compile(r'^[A-Za-z_][A-Za-z0-9_]*$')
+CURSOR_PATTERN = re.compile(r'^[A-Za-z0-9_.:+-]+$')
+
+class ListQueryError(ValueError):
+    """Raised for invalid limit, after or fields query parameters"""
+
+def parse_list_query(args):
+    """Read limit, after, fields and format from a request's query string"""
+    limit = args.get('limit')
+    if limit is not None:
+        try:
+            limit = int(limit)
+        except ValueError:
+            raise ListQueryError("limit must be an integer")
+        if not 1 <= limit <= MAX_LIMIT:
+            raise ListQueryError(f"limit must be between 1 and {MAX_LIMIT}")
+
+    after = args.get('after')
+    if after is not None and not CURSOR_PATTERN.match(after):
+        raise ListQueryError("Invalid after cursor")
+
+    fields = None
+    if args.get('fields'):
+        fields = [field.strip() for field in args['fields'].split(',') if field.strip()]
+        invalid = [field for field in fields if not FIELD_PATTERN.match(field)]
+        if invalid:
+            raise ListQueryError(f"Invalid fields: {', '.join(invalid)}")
+
+    ndjson = args.get('format') == 'ndjson' or 'application/x-ndjson' in request.headers.get('Accept', '')
+    return {'limit': limit, 'after': after, 'fields': fields, 'ndjson': ndjson}
+
+def select_fields(fields, key='id'):
+    """PostgREST select= value; the cursor key is always included"""
+    if not fields:
+        return '*'
+    return ','.join(fields if key in fields else [key] + fields)
+
+def iterate_rows(path, filters=None, fields=None, after=None, limit=None, key='id', page_size=None):
+    """Walk rows in key order one page at a time, so only one page is held in memory"""
+    page_size = page_size or PAGE_SIZE
+    remaining = limit
+    while remaining is None or remaining > 0:
+        size = page_size if remaining is None else min(page_size, remaining)
+        params = dict(filters or {})
+        params['select'] = select_fields(fields, key)
+        params['order'] = f'{key}.asc'
+        params['limit'] = size
+        if after is not None:
+            params[key] = f'gt.{after}'
+
+        rows = supabase_request('GET', path, params=params) or []
+        for row in rows:
+            yield row
+        if len(rows) < size:
+            return
+
+        after = rows[-1][key]
+        if remaining is not None:
+            remaining -= len(rows)
+
+def list_response(path, filters=None, key='id'):
+    """Response for a list endpoint, honouring limit/after/fields/format.
+
+    Without limit, after or format=ndjson the whole result is returned as one
+    JSON array, as before. With limit/after the page is ordered by `key` and the
+    cursor for the next page is sent in the X-Next-Cursor header. NDJSON output
+    is streamed one Supabase page at a time.
+    """
+    try:
+        query = parse_list_query(request.args)
+    except ListQueryError as e:
+        return jsonify({"error": str(e)}), 400
+
+    if query['ndjson']:
+        rows = iterate_rows(path, filters, query['fields'], query['after'], query['limit'], key)
+
+        def lines():
+            try:
+                for row in rows:
+                    yield json.dumps(row) + '\n'
+            except Exception as e:
+                # Headers are already sent; end the stream and log the failure
+                print(f"NDJSON stream error for {path}: {str(e)}")
+
+        return Response(stream_with_context(lines()), mimetype='application/x-ndjson')
+
+    if query['limit'] is None and query['after'] is None:
+        params = dict(filters or {})
+        if query['fields']:
+            params['select'] = select_fields(query['fields'], key)
+        return jsonify(supabase_request('GET', path, params=params))
+
+    # Fetch one extra row to know whether there is a next page
+    limit = query['limit'] or PAGE_SIZE
+    rows = list(iterate_rows(path, filters, query['fields'], query['after'], limit + 1, key, page_size=limit + 1))
+    response = jsonify(rows[:limit])
+    if len(rows) > limit:
+        response.headers['X-Next-Cursor'] = str(rows[limit - 1][key])
+    return response
@@ -0,0 +1,125 @@
+import heapq
+import threading
+
+class IndexedPriorityQueue:
+    """Binary heap of items addressable by key.
+
+    Insert, remove and rekey are O(log n) through a key -> heap position
+    index, and the first k items in priority order are read in
+    O(k log k) by walking the heap, without sorting the whole queue.
+    Priorities are compared as plain values; smaller comes first.
+    """
+
+    def __init__(self):
+        self._heap = []       # [priority, key] pairs
+        self._positions = {}  # key -> index in self._heap
+        self._items = {}      # key -> item
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._heap)
+
+    def __contains__(self, key):
+        return key in self._positions
+
+    def get(self, key, default=None):
+        return self._items.get(key, default)
+
+    def push(self, key, priority, item=None):
+        """Insert an item, or move an existing one to its new priority"""
+        with self._lock:
+            self._items[key] = item
+            position = self._positions.get(key)
+            if position is None:
+                self._heap.append([priority, key])
+                self._positions[key] = len(self._heap) - 1
+                self._sift_up(len(self._heap) - 1)
+                return
+
+            previous = self._heap[position][0]
+            self._heap[position][0] = priority
+            if priority < previous:
+                self._sift_up(position)
+            elif previous < priority:
+                self._sift_down(position)
+
+    def remove(self, key):
+        """Remove an item; returns it, or None if the key is not queued"""
+        with self._lock:
+            position = self._positions.pop(key, None)
+            if position is None:
+                return None
+            item = self._items.pop(key)
+
+            last = self._heap.pop()
+            if position < len(self._heap):
+                self._heap[position] = last
+                self._positions[last[1]] = position
+                self._sift_up(position)
+                self._sift_down(self._positions[last[1]])
+            return item
+
+    def retain(self, keys):
+        """Remove every item whose key is not in keys"""
+        with self._lock:
+            stale = [key for key in self._positions if key not in keys]
+        for key in stale:
+            self.remove(key)
+
+    def entries(self):
+        """(key, priority, item) for every queued item, e.g. to copy the queue to another process"""
+        with self._lock:
+            return [(key, priority, self._items[key]) for priority, key in self._heap]
+
+    def replace(self, entries):
+        """Replace the whole queue with (key, priority, item) entries from entries()"""
+        heap = [[priority, key] for key, priority, _ in entries]
+        heapq.heapify(heap)
+        with self._lock:
+            self._heap = heap
+            self._positions = {key: position for position, (_, key) in enumerate(heap)}
+            self._items = {key: item for key, _, item in entries}
+
+    def top(self, limit=None, offset=0):
+        """Items in priority order, skipping `offset` and returning at most `limit`"""
+        with self._lock:
+            if limit is None:
+                # The whole queue was asked for; a sort is cheaper than a heap walk
+                ordered = sorted(self._heap)
+                return [self._items[key] for _, key in ordered[offset:]]
+
+            # Expand the heap from the root, always taking the smallest frontier entry
+            result = []
+            frontier = [(self._heap[0][0], self._heap[0][1], 0)] if self._heap else []
+            while frontier and len(result) < offset + limit:
+                _, key, position = heapq.heappop(frontier)
+                result.append(key)
+                for child in (2 * position + 1, 2 * position + 2):
+                    if child < len(self._heap):
+                        heapq.heappush(frontier, (self._heap[child][0], self._heap[child][1], child))
+            return [self._items[key] for key in result[offset:]]
+
+    def _swap(self, i, j):
+        self._heap[i], self._heap[j] = self._heap[j], self._heap[i]
+        self._positions[self._heap[i][1]] = i
+        self._positions[self._heap[j][1]] = j
+
+    def _sift_up(self, position):
+        while position > 0:
+            parent = (position - 1) // 2
+            if not self._heap[position][0] < self._heap[parent][0]:
+                break
+            self._swap(position, parent)
+            position = parent
+
+    def _sift_down(self, position):
+        size = len(self._heap)
+        while True:
+            smallest = position
+            for child in (2 * position + 1, 2 * position + 2):
+                if child < size and self._heap[child][0] < self._heap[smallest][0]:
+                    smallest = child
+            if smallest == position:
+                break
+            self._swap(position, smallest)
+            position = smallest
@@ -0,0 +1,108 @@
+import collections
+import json
+import threading
+
+def format_event(event, data):
+    """Encode one server-sent event"""
+    return f"event: {event}\ndata: {json.dumps(data, default=str)}\n\n"
+
+def diff_queues(previous, current):
+    """Compact changes between two queue views (lists of patients in rank order)"""
+    before = {str(patient['id']): (rank, patient) for rank, patient in enumerate(previous)}
+    after = {str(patient['id']): (rank, patient) for rank, patient in enumerate(current)}
+
+    diff = {'arrivals': [], 'departures': [], 'moves': [], 'scores': [], 'updates': []}
+    for patient_id, (rank, patient) in after.items():
+        if patient_id not in before:
+            diff['arrivals'].append({'rank': rank, 'patient': patient})
+            continue
+
+        old_rank, old_patient = before[patient_id]
+        if rank != old_rank:
+            diff['moves'].append([patient_id, rank])
+        if (patient.get('priority_score'), patient.get('waiting_time_minutes')) != \
+                (old_patient.get('priority_score'), old_patient.get('waiting_time_minutes')):
+            diff['scores'].append([patient_id, patient.get('priority_score'), patient.get('waiting_time_minutes')])
+
+        # Any other field edited since the last view is sent as the whole record
+        ignored = ('priority_score', 'waiting_time_minutes')
+        if any(patient.get(key) != old_patient.get(key) for key in set(patient) | set(old_patient) if key not in ignored):
+            diff['updates'].append(patient)
+
+    diff['departures'] = [patient_id for patient_id in before if patient_id not in after]
+    return diff
+
+class QueueBroadcaster:
+    """Fans one computed queue out to every connected stream.
+
+    Each publish() diffs the new view against the previous one and encodes the
+    event once; subscribers only wait on a condition and copy the encoded
+    messages, so N open dashboards cost one computation. A subscriber that
+    falls further behind than the event history is sent a fresh snapshot.
+    """
+
+    def __init__(self, history=64):
+        self.version = 0
+        self.view = None
+        self.computed_at = None
+        self._events = collections.deque(maxlen=history)  # (version, encoded event)
+        self._condition = threading.Condition()
+        self._wakers = set()
+
+    def publish(self, view, computed_at):
+        """Store a new queue view and wake every subscriber if anything changed"""
+        with self._condition:
+            if self.view is not None:
+                diff = diff_queues(self.view, view)
+                if not any(diff.values()):
+                    return
+                diff['version'] = self.version + 1
+                diff['computed_at'] = computed_at
+                self._events.append((self.version + 1, format_event('diff', diff)))
+
+            self.version += 1
+            self.view = view
+            self.computed_at = computed_at
+            self._condition.notify_all()
+            wakers = list(self._wakers)
+
+        for waker in wakers:
+            try:
+                waker()
+            except Exception as e:
+                print(f"Queue stream waker failed: {str(e)}")
+
+    def add_waker(self, waker):
+        """Call `waker` after every publish; lets event-loop subscribers wait without a thread"""
+        with self._condition:
+            self._wakers.add(waker)
+
+    def remove_waker(self, waker):
+        with self._condition:
+            self._wakers.discard(waker)
+
+    def snapshot(self):
+        """The current version and its encoded snapshot event"""
+        with self._condition:
+            return self.version, format_event('snapshot', {
+                'version': self.version,
+                'computed_at': self.computed_at,
+                'queue': self.view or []
+            })
+
+    def wait(self, version, timeout):
+        """Encoded events after `version`, waiting up to `timeout` seconds for one.
+
+        Returns (new version, messages). messages is empty on timeout, and is a
+        single snapshot if the events since `version` are no longer kept.
+        """
+        with self._condition:
+            self._condition.wait_for(lambda: self.version > version, timeout)
+            if self.version <= version:
+                return version, []
+
+            messages = [message for event_version, message in self._events if event_version > version]
+            if not self._events or self._events[0][0] > version + 1:
+                # Missed events have been dropped from the history
+                return self.snapshot()[0], [self.snapshot()[1]]
+            return self.version, messages
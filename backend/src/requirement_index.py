@@ -0,0 +1,140 @@
+import os
+import threading
+import time
+from datetime import datetime, timezone
+from .supabase_client import supabase_request
+
+# How often rows added since the last sync are pulled in, in seconds
+SYNC_SECONDS = float(os.environ.get('REQUIREMENTS_SYNC_SECONDS', 30))
+# How often every indexed patient is reloaded in full, which drops removed rows
+RELOAD_SECONDS = float(os.environ.get('REQUIREMENTS_RELOAD_SECONDS', 900))
+
+class RequirementIndex:
+    """Patient requirements as bitsets over interned resource types or specialties.
+
+    Each type is given a bit the first time it is seen, and a patient's
+    requirements become one integer. Availability is then
+    popcount(required & available) / popcount(required), with no per-patient
+    queries. A patient's rows are loaded the first time they are scored; rows
+    added afterwards are picked up by created_at every `sync_seconds`, and the
+    whole index is reloaded every `reload_seconds`.
+    """
+
+    def __init__(self, table, column, sync_seconds=None, reload_seconds=None):
+        self.table = table
+        self.column = column
+        self.sync_seconds = sync_seconds or SYNC_SECONDS
+        self.reload_seconds = reload_seconds or RELOAD_SECONDS
+        self._bits = {}   # type -> bit position
+        self._masks = {}  # patient id -> bitset of required types
+        self._synced_at = None
+        self._synced_through = None  # created_at of the newest row seen
+        self._reloaded_at = time.monotonic()
+        self._lock = threading.Lock()
+        self._stats = {'patients_loaded': 0, 'syncs': 0, 'rows_synced': 0, 'reloads': 0}
+
+    def masks(self, patient_ids):
+        """Required-type bitsets for these patients, loading any not yet indexed"""
+        patient_ids = [str(patient_id) for patient_id in patient_ids]
+        with self._lock:
+            if time.monotonic() - self._reloaded_at >= self.reload_seconds:
+                self._masks = {}
+                self._synced_at = None
+                self._reloaded_at = time.monotonic()
+                self._stats['reloads'] += 1
+
+            missing = [patient_id for patient_id in patient_ids if patient_id not in self._masks]
+            if missing:
+                self._load(missing)
+            # Independent of loads, so steady arrivals cannot hold off picking up new rows
+            if self._masks and (self._synced_at is None or time.monotonic() - self._synced_at >= self.sync_seconds):
+                self._sync()
+
+            return {patient_id: self._masks.get(patient_id, 0) for patient_id in patient_ids}
+
+    def mask(self, types):
+        """Bitset of the given types; types no patient requires have no bit and are skipped"""
+        with self._lock:
+            mask = 0
+            for value in types:
+                bit = self._bits.get(value)
+                if bit is not None:
+                    mask |= 1 << bit
+            return mask
+
+    def retain(self, patient_ids):
+        """Forget patients that are no longer waiting"""
+        keep = set(str(patient_id) for patient_id in patient_ids)
+        with self._lock:
+            for patient_id in [patient_id for patient_id in self._masks if patient_id not in keep]:
+                del self._masks[patient_id]
+
+    def stats(self):
+        with self._lock:
+            stats = dict(self._stats)
+            stats['patients'] = len(self._masks)
+            stats['types'] = len(self._bits)
+        return stats
+
+    def _load(self, patient_ids):
+        """Fetch every row for these patients in one query; caller holds the lock"""
+        started_at = datetime.now(timezone.utc).isoformat()
+        rows = supabase_request('GET', f'/rest/v1/{self.table}', params={
+            'patient_id': f"in.({','.join(patient_ids)})",
+            'select': f'patient_id,{self.column},created_at'
+        })
+        masks = {patient_id: 0 for patient_id in patient_ids}
+        for row in rows or []:
+            masks[str(row['patient_id'])] = masks.get(str(row['patient_id']), 0) | self._bit(row[self.column])
+        if self._synced_through is None:
+            # First load: every indexed patient's rows are in this result, so the
+            # first sync can start from here instead of reading the whole table.
+            # Later loads leave the watermark to _sync, or they would skip rows
+            # added since the last sync for patients already indexed
+            if not self._masks:
+                for row in rows or []:
+                    self._advance(row)
+                if self._synced_through is None:
+                    self._synced_through = started_at
+        self._masks.update(masks)
+        if self._synced_at is None:
+            self._synced_at = time.monotonic()
+        self._stats['patients_loaded'] += len(patient_ids)
+
+    def _sync(self):
+        """Pull rows created since the last load or sync; caller holds the lock"""
+        params = {'select': f'patient_id,{self.column},created_at', 'order': 'created_at.asc'}
+        if self._synced_through is not None:
+            # gte rather than gt: rows sharing the last timestamp may have been missed,
+            # and OR-ing a bit in twice is harmless
+            params['created_at'] = f'gte.{self._synced_through}'
+        rows = supabase_request('GET', f'/rest/v1/{self.table}', params=params)
+        for row in rows or []:
+            patient_id = str(row['patient_id'])
+            # Patients not indexed yet are loaded in full when first scored
+            if patient_id in self._masks:
+                self._masks[patient_id] |= self._bit(row[self.column])
+            self._advance(row)
+        self._synced_at = time.monotonic()
+        self._stats['syncs'] += 1
+        self._stats['rows_synced'] += len(rows or [])
+
+    def _advance(self, row):
+        if row.get('created_at') and (self._synced_through is None or row['created_at'] > self._synced_through):
+            self._synced_through = row['created_at']
+
+    def _bit(self, value):
+        """Intern a type to its bit; caller holds the lock"""
+        if value not in self._bits:
+            self._bits[value] = len(self._bits)
+        return 1 << self._bits[value]
+
+def availability_percentage(required, available):
+    """Percentage of a patient's required types that are available, from bitsets"""
+    if not required:
+        return 100  # No requirements means 100% availability
+    return (required & available).bit_count() / required.bit_count() * 100
+
+# Shared per process; used by queue scoring
+resource_requirements = RequirementIndex('patient_resource_requirements', 'resource_type')
+specialty_requirements = RequirementIndex('patient_specialty_requirements', 'specialty')
@@ -1,55 +1,23 @@
-import os
-import requests
-import json
-import joblib
-import pandas as pd
-from flask import Blueprint, jsonify, request, make_response
+import time
+from flask import Blueprint, jsonify, request
 from datetime import datetime
 from dotenv import load_dotenv
+from ..supabase_client import supabase_request, SupabaseError
+from ..pagination import list_response
 load_dotenv()
 
 patients_bp = Blueprint('patients', __name__)
 
-# Load the triage model
-from ..models.triage_model import triage_model  # Import the triage model
-
-
-# Supabase connection details
-def get_supabase_url():
-    return os.environ.get('SUPABASE_URL', 'https://my-custom.supabase.co')
-
-def get_supabase_key():
-    return os.environ.get('SUPABASE_SERVICE_KEY', 'SUPABASE_SERVICE_KEY')
-
-def supabase_request(method, path, data=None, params=None):
-    """Helper function to make requests to Supabase REST API"""
-    url = f"{get_supabase_url()}{path}"
-    headers = {
-        'apikey': get_supabase_key(),
-        'Authorization': f'Bearer {get_supabase_key()}',
-        'Content-Type': 'application/json',
-        'Prefer': 'return=representation'
-    }
-    
-    if method == 'GET':
-        response = requests.get(url, headers=headers, params=params)
-    elif method == 'POST':
-        response = requests.post(url, headers=headers, json=data)
-    elif method == 'PUT':
-        response = requests.put(url, headers=headers, json=data)
-    elif method == 'DELETE':
-        response = requests.delete(url, headers=headers, params=params)
-    else:
-        raise ValueError(f"Unsupported method: {method}")
-    
-    if response.status_code >= 400:
-        raise Exception(f"Supabase API error: {response.status_code} - {response.text}")
-    
-    return response.json()
+# Triage model, loaded on first use or by the startup warm-up
+from ..models.registry import model_registry
+from ..models.shadow import shadow_evaluator
+from ..models.features import news2_score, news2_scores, shock_index, shock_indices
+from ..models.inference import CATEGORICAL_CODES
+from .triage import queue_scheduler, waiting_queue
 
 @patients_bp.route('/', methods=['GET'])
 def get_patients():
-    """Get all patients"""
+    """Get all patients; supports limit/after cursors, fields= and format=ndjson"""
     try:
         # Get query parameters
         status = request.args.get('status')
@@ -59,9 +27,8 @@ def get_patients():
         if status:
             params['status'] = f'eq.{status}'
         
-        # Make request to Supabase
-        result = supabase_request('GET', '/rest/v1/patients', params=params)
-        return jsonify(result)
+        # Make request to Supabase, paginated and projected if asked for
+        return list_response('/rest/v1/patients', params)
     except Exception as e:
         return jsonify({"error": str(e)}), 500
 
@@ -99,77 +66,35 @@ def add_patient():
             
         # Calculate Shock Index
         try:
-            data['Shock_Index'] = float(data['Pulse_Rate']) / float(data['Systolic_BP'])
+            data['Shock_Index'] = shock_index(data)
         except (ZeroDivisionError, ValueError) as e:
             return jsonify({
                 "error": "Invalid values for Pulse_Rate or Systolic_BP"
             }), 400
         
         # Calculate NEWS2 score
-        def calculate_NEWS2(data):
-            score = 0
-            
-            try:
-                # Respiratory Rate
-                resp_rate = float(data['Respiratory_Rate'])
-                if resp_rate <= 8: score += 3
-                elif 9 <= resp_rate <= 11: score += 1
-                elif 21 <= resp_rate <= 24: score += 2
-                elif resp_rate >= 25: score += 3
-                
-                # SPO2 (assuming room air)
-                spo2 = float(data['SPO2'])
-                if spo2 <= 92: score += 3
-                elif 93 <= spo2 <= 94: score += 2
-                elif 95 <= spo2 <= 96: score += 1
-                
-                # Systolic BP
-                sys_bp = float(data['Systolic_BP'])
-                if sys_bp <= 90: score += 3
-                elif 91 <= sys_bp <= 100: score += 2
-                elif 101 <= sys_bp <= 110: score += 1
-                elif sys_bp >= 220: score += 3
-                
-                # Pulse
-                pulse = float(data['Pulse_Rate'])
-                if pulse <= 40: score += 3
-                elif 41 <= pulse <= 50: score += 1
-                elif 91 <= pulse <= 110: score += 1
-                elif 111 <= pulse <= 130: score += 2
-                elif pulse >= 131: score += 3
-                
-                # Temperature
-                temp = float(data['Temperature'])
-                if temp <= 35.0: score += 3
-                elif 35.1 <= temp <= 36.0: score += 1
-                elif 38.1 <= temp <= 39.0: score += 1
-                elif temp >= 39.1: score += 2
-                
-                # AVPU
-                if data['AVPU'] != 'Alert': score += 3
-                
-                return score
-            except (ValueError, KeyError) as e:
-                raise ValueError(f"Error calculating NEWS2 score: {str(e)}")
-        
-        # Add NEWS2 score to data
         try:
-            data['NEWS2'] = calculate_NEWS2(data)
+            data['NEWS2'] = news2_score(data)
         except ValueError as e:
             return jsonify({"error": str(e)}), 400
         
         # Make prediction using the model
         try:
-            df = pd.DataFrame([data])
-            prediction = triage_model.predict(df)
-            risk_level = int(prediction[0])
+            model = model_registry.get()
+            started = time.perf_counter()
+            risk_level = model.predict_one(data)
+            prediction_ms = (time.perf_counter() - started) * 1000
         except Exception as e:
             return jsonify({
                 "error": f"Error making triage prediction: {str(e)}"
             }), 400
         
-        # Add prediction results to data
+        # Score the same record with the candidate model, if any, off the request path
+        shadow_evaluator.submit(data, risk_level, model.version, prediction_ms, 'add_patient')
+        
+        # Add prediction results to data, with the model version that produced them
         data['risk_level'] = risk_level
+        data['model_version'] = model.version
         data['status'] = 'waiting'
         data['arrival_time'] = datetime.now().isoformat() + 'Z'  # Add UTC indicator
         
@@ -178,7 +103,8 @@ def add_patient():
 
         # Insert into database with calculated scores and prediction
         try:
-            result = supabase_request('POST', '/rest/v1/patients', data=data)
+            result = post_patients(data)
+            queue_scheduler.trigger()
             
             return jsonify({
                 'message': 'Patient added successfully',
@@ -186,7 +112,8 @@ def add_patient():
                 'risk_level': risk_level,
                 'risk_level_text': ["Low", "Medium", "High"][risk_level],
                 'shock_index': data['Shock_Index'],
-                'news2_score': data['NEWS2']
+                'news2_score': data['NEWS2'],
+                'model_version': model.version
             }), 201
         except Exception as e:
             return jsonify({
@@ -197,6 +124,183 @@ def add_patient():
         print(f"Error adding patient: {str(e)}")  # Add debug logging
         return jsonify({'error': str(e)}), 500
 
+# Vital signs required for every intake
+REQUIRED_VITALS = [
+    'Pulse_Rate', 'Systolic_BP', 'Respiratory_Rate', 'SPO2', 
+    'Temperature', 'AVPU', 'Lactate'
+]
+
+NUMERIC_VITALS = ['Pulse_Rate', 'Systolic_BP', 'Respiratory_Rate', 'SPO2', 'Temperature', 'Lactate']
+
+def validate_intake(data):
+    """Return an error message for an invalid intake payload, or None"""
+    if not isinstance(data, dict):
+        return "Patient payload must be a JSON object"
+    
+    missing_fields = [field for field in REQUIRED_VITALS if field not in data]
+    if missing_fields:
+        return f"Missing required fields: {', '.join(missing_fields)}"
+    
+    try:
+        for field in NUMERIC_VITALS:
+            float(data[field])
+    except (TypeError, ValueError):
+        return f"Invalid value for {field}"
+    
+    if float(data['Systolic_BP']) == 0:
+        return "Invalid values for Pulse_Rate or Systolic_BP"
+    
+    if data['AVPU'] not in CATEGORICAL_CODES['AVPU']:
+        return f"Invalid value for AVPU. Must be one of: {', '.join(CATEGORICAL_CODES['AVPU'])}"
+    
+    return None
+
+@patients_bp.route('/batch', methods=['POST'])
+def add_patients_batch():
+    """Register many patients at once with a single model call and a single insert"""
+    try:
+        payloads = request.json
+        if not isinstance(payloads, list) or not payloads:
+            return jsonify({"error": "Request body must be a non-empty JSON array of patients"}), 400
+        
+        results = [None] * len(payloads)
+        
+        # Validate each payload on its own so one bad row does not fail the batch
+        valid_indices = []
+        for i, data in enumerate(payloads):
+            error = validate_intake(data)
+            if error:
+                results[i] = {'index': i, 'error': error}
+            else:
+                valid_indices.append(i)
+        
+        if valid_indices:
+            import pandas as pd
+            frame = pd.DataFrame([payloads[i] for i in valid_indices])
+            for field in NUMERIC_VITALS:
+                frame[field] = frame[field].astype(float)
+            
+            # Calculate Shock Index and NEWS2 for all rows at once
+            frame['Shock_Index'] = shock_indices(frame)
+            frame['NEWS2'] = news2_scores(frame)
+            
+            # Make predictions for all rows with one model call
+            risk_levels = {}
+            try:
+                model = model_registry.get()
+            except Exception as e:
+                model = None
+                for i in valid_indices:
+                    results[i] = {'index': i, 'error': f"Error making triage prediction: {str(e)}"}
+            if model is not None:
+                try:
+                    risk_levels = dict(enumerate(int(level) for level in model.predict_columns(frame)))
+                except Exception as e:
+                    # Score rows one at a time so only the rows the model rejects fail
+                    print(f"Batch prediction failed, scoring rows one at a time: {str(e)}")
+                    for position, i in enumerate(valid_indices):
+                        try:
+                            risk_levels[position] = model.predict_one(frame.iloc[position].to_dict())
+                        except Exception as row_error:
+                            results[i] = {'index': i, 'error': f"Error making triage prediction: {str(row_error)}"}
+            
+            # Build rows to insert with calculated scores and prediction
+            arrival_time = datetime.now().isoformat() + 'Z'  # Add UTC indicator
+            predicted = [(position, i) for position, i in enumerate(valid_indices) if position in risk_levels]
+            valid_indices = [i for _, i in predicted]
+            rows = []
+            for position, i in predicted:
+                data = dict(payloads[i])
+                data['Shock_Index'] = float(frame['Shock_Index'].iloc[position])
+                data['NEWS2'] = int(frame['NEWS2'].iloc[position])
+                data['risk_level'] = risk_levels[position]
+                data['model_version'] = model.version
+                data['status'] = 'waiting'
+                data['arrival_time'] = arrival_time
+                data['avpu'] = data.pop('AVPU', None)
+                rows.append(data)
+            
+            if rows:
+                saved = insert_patients(rows)
+                for (i, data), outcome in zip(zip(valid_indices, rows), saved):
+                    if isinstance(outcome, Exception):
+                        results[i] = {'index': i, 'error': f"Error saving to database: {str(outcome)}"}
+                    else:
+                        results[i] = {
+                            'index': i,
+                            'id': outcome['id'],
+                            'risk_level': data['risk_level'],
+                            'risk_level_text': ["Low", "Medium", "High"][data['risk_level']],
+                            'shock_index': data['Shock_Index'],
+                            'news2_score': data['NEWS2'],
+                            'model_version': data.get('model_version')
+                        }
+                queue_scheduler.trigger()
+        
+        created = sum(1 for result in results if 'error' not in result)
+        failed = len(results) - created
+        status_code = 201 if not failed else (207 if created else 400)
+        
+        return jsonify({
+            'created': created,
+            'failed': failed,
+            'results': results
+        }), status_code
+    except Exception as e:
+        print(f"Error adding patients: {str(e)}")  # Add debug logging
+        return jsonify({'error': str(e)}), 500
+
+# Cleared once Supabase reports that patients has no model_version column yet
+store_model_version = True
+
+def post_patients(data, params=None, headers=None):
+    """POST patient rows, leaving out model_version if that column has not been added yet"""
+    global store_model_version
+    if not store_model_version:
+        data, params = without_model_version(data, params)
+    try:
+        return supabase_request('POST', '/rest/v1/patients', data=data, params=params, headers=headers)
+    except SupabaseError as e:
+        if not store_model_version or 'model_version' not in e.text:
+            raise
+        print("patients.model_version column is missing (see the database schema doc); saving without it")
+        store_model_version = False
+        data, params = without_model_version(data, params)
+        return supabase_request('POST', '/rest/v1/patients', data=data, params=params, headers=headers)
+
+def without_model_version(data, params):
+    if isinstance(data, list):
+        data = [{key: value for key, value in row.items() if key != 'model_version'} for row in data]
+    else:
+        data = {key: value for key, value in data.items() if key != 'model_version'}
+    if params and 'columns' in params:
+        params = dict(params, columns=','.join(column for column in params['columns'].split(',') if column != 'model_version'))
+    return data, params
+
+def insert_patients(rows):
+    """Insert patient rows with one POST, retrying row by row if the batch is rejected.
+    
+    Returns the inserted record or the exception for each row, in order.
+    """
+    # PostgREST bulk inserts need one column list; keys a row lacks take the column default
+    columns = sorted(set().union(*(row.keys() for row in rows)))
+    try:
+        return post_patients(
+            rows,
+            params={'columns': ','.join(columns)},
+            headers={'Prefer': 'return=representation,missing=default'}
+        )
+    except Exception as e:
+        print(f"Batch insert failed, inserting rows individually: {e}")
+    
+    saved = []
+    for row in rows:
+        try:
+            saved.append(post_patients(row)[0])
+        except Exception as e:
+            saved.append(e)
+    return saved
+
 @patients_bp.route('/<patient_id>', methods=['PUT'])
 def update_patient(patient_id):
     """Update a patient"""
@@ -219,6 +323,10 @@ def update_patient(patient_id):
         if not result:
             return jsonify({"error": "Patient not found"}), 404
         
+        # Take the patient off the queue now; the next pass rekeys waiting patients
+        if result[0].get('status') != 'waiting':
+            waiting_queue.remove(str(patient_id))
+        queue_scheduler.trigger()
         return jsonify(result[0])
     except Exception as e:
         return jsonify({"error": str(e)}), 500
@@ -253,6 +361,10 @@ def update_patient_status(patient_id):
         if not result:
             return jsonify({"error": "Patient not found"}), 404
         
+        # Take the patient off the queue now; the next pass rekeys waiting patients
+        if result[0].get('status') != 'waiting':
+            waiting_queue.remove(str(patient_id))
+        queue_scheduler.trigger()
         return jsonify(result[0])
     except Exception as e:
         return jsonify({"error": str(e)}), 500
@@ -264,6 +376,8 @@ def delete_patient(patient_id):
         # Make request to Supabase
         params = {'id': f'eq.{patient_id}'}
         supabase_request('DELETE', '/rest/v1/patients', params=params)
+        waiting_queue.remove(str(patient_id))
+        queue_scheduler.trigger()
         
         return jsonify({"message": "Patient deleted successfully"})
     except Exception as e:
@@ -1,49 +1,17 @@
-import os
-import requests
-import json
 from flask import Blueprint, jsonify, request
 from datetime import datetime
 from dotenv import load_dotenv
+from ..supabase_client import supabase_request
+from ..pagination import list_response
+from ..availability import resource_availability
+from .triage import queue_scheduler
 load_dotenv()
 
 resources_bp = Blueprint('resources', __name__)
 
-# Supabase connection details
-def get_supabase_url():
-    return os.environ.get('SUPABASE_URL', 'https://my-custom.supabase.co')
-
-def get_supabase_key():
-    return os.environ.get('SUPABASE_SERVICE_KEY', 'SUPABASE_SERVICE_KEY')
-
-def supabase_request(method, path, data=None, params=None):
-    """Helper function to make requests to Supabase REST API"""
-    url = f"{get_supabase_url()}{path}"
-    headers = {
-        'apikey': get_supabase_key(),
-        'Authorization': f'Bearer {get_supabase_key()}',
-        'Content-Type': 'application/json',
-        'Prefer': 'return=representation'
-    }
-    
-    if method == 'GET':
-        response = requests.get(url, headers=headers, params=params)
-    elif method == 'POST':
-        response = requests.post(url, headers=headers, json=data)
-    elif method == 'PUT':
-        response = requests.put(url, headers=headers, json=data)
-    elif method == 'DELETE':
-        response = requests.delete(url, headers=headers, params=params)
-    else:
-        raise ValueError(f"Unsupported method: {method}")
-    
-    if response.status_code >= 400:
-        raise Exception(f"Supabase API error: {response.status_code} - {response.text}")
-    
-    return response.json()
-
 @resources_bp.route('/', methods=['GET'])
 def get_resources():
-    """Get all resources"""
+    """Get all resources; supports limit/after cursors, fields= and format=ndjson"""
     try:
         # Get query parameters
         status = request.args.get('status')
@@ -56,9 +24,8 @@ def get_resources():
         if type:
             params['type'] = f'eq.{type}'
         
-        # Make request to Supabase
-        result = supabase_request('GET', '/rest/v1/resources', params=params)
-        return jsonify(result)
+        # Make request to Supabase, paginated and projected if asked for
+        return list_response('/rest/v1/resources', params)
     except Exception as e:
         return jsonify({"error": str(e)}), 500
 
@@ -97,6 +64,8 @@ def create_resource():
         # Make request to Supabase
         result = supabase_request('POST', '/rest/v1/resources', data=data)
         
+        resource_availability.apply(result[0])
+        queue_scheduler.trigger()
         return jsonify(result[0]), 201
     except Exception as e:
         return jsonify({"error": str(e)}), 500
@@ -123,6 +92,8 @@ def update_resource(resource_id):
         if not result:
             return jsonify({"error": "Resource not found"}), 404
         
+        resource_availability.apply(result[0])
+        queue_scheduler.trigger()
         return jsonify(result[0])
     except Exception as e:
         return jsonify({"error": str(e)}), 500
@@ -172,6 +143,8 @@ def update_resource_status(resource_id):
         # Make request to Supabase
         result = supabase_request('PUT', '/rest/v1/resources', data=update_data, params=params)
         
+        resource_availability.apply(result[0])
+        queue_scheduler.trigger()
         return jsonify(result[0])
     except Exception as e:
         return jsonify({"error": str(e)}), 500
@@ -183,6 +156,8 @@ def delete_resource(resource_id):
         # Make request to Supabase
         params = {'id': f'eq.{resource_id}'}
         supabase_request('DELETE', '/rest/v1/resources', params=params)
+        resource_availability.remove(resource_id)
+        queue_scheduler.trigger()
         
         return jsonify({"message": "Resource deleted successfully"})
     except Exception as e:
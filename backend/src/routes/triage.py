@@ -1,51 +1,28 @@
 import os
-import requests
-import json
 import math
-import pandas as pd
-from flask import Blueprint, jsonify, request
-from datetime import datetime, timedelta
+import time
+import numpy as np
+from flask import Blueprint, Response, jsonify, request, stream_with_context
+from datetime import date, datetime, timedelta
 from dotenv import load_dotenv
-from ..models.triage_model import triage_model  # Import the triage model
+from ..supabase_client import supabase_request, run_concurrently
+from ..models.registry import model_registry
+from ..models.shadow import shadow_evaluator
+from ..models.features import news2_score, shock_index
+from ..models.fuzzy_inference import get_mamdani_engine
+from ..scheduler import QueueScheduler
+from ..cache import TTLCache, LRUCache
+from ..priority_queue import IndexedPriorityQueue
+from ..queue_stream import QueueBroadcaster
+from ..pagination import iterate_rows
+from ..wait_stats import wait_stats, record_treatment_start
+from ..audit_log import priority_log_writer
+from ..availability import staff_availability, resource_availability
+from ..requirement_index import resource_requirements, specialty_requirements, availability_percentage
 load_dotenv()
 
 triage_bp = Blueprint('triage', __name__)
 
-# Supabase connection details
-def get_supabase_url():
-    return os.environ.get('SUPABASE_URL', 'https://my-custom.supabase.co')
-
-def get_supabase_key():
-    return os.environ.get('SUPABASE_SERVICE_KEY', 'SUPABASE_SERVICE_KEY')
-
-def supabase_request(method, path, data=None, params=None):
-    """Helper function to make requests to Supabase REST API"""
-    url = f"{get_supabase_url()}{path}"
-    headers = {
-        'apikey': get_supabase_key(),
-        'Authorization': f'Bearer {get_supabase_key()}',
-        'Content-Type': 'application/json',
-        'Prefer': 'return=representation'
-    }
-    
-    if method == 'GET':
-        response = requests.get(url, headers=headers, params=params)
-    elif method == 'POST':
-        response = requests.post(url, headers=headers, json=data)
-    elif method == 'PUT':
-        response = requests.put(url, headers=headers, json=data)
-    elif method == 'DELETE':
-        response = requests.delete(url, headers=headers, params=params)
-    elif method == 'PATCH':
-        response = requests.patch(url, headers=headers, json=data)
-    else:
-        raise ValueError(f"Unsupported method: {method}")
-    
-    if response.status_code >= 400:
-        raise Exception(f"Supabase API error: {response.status_code} - {response.text}")
-    
-    return response.json()
-
 # Default triage settings
 DEFAULT_TRIAGE_SETTINGS = {
     "risk_level_weight": 0.5,
@@ -53,9 +30,22 @@ DEFAULT_TRIAGE_SETTINGS = {
     "resource_availability_weight": 0.1,
     "staff_availability_weight": 0.1,
     "waiting_time_exponent_base": 1.05,
-    "waiting_time_constant": 30
+    "waiting_time_constant": 30,
+    "inference_mode": "weighted"
+}
+
+# 'weighted' is the linear weighted sum, 'mamdani' the documented fuzzy rule base
+INFERENCE_MODES = ['weighted', 'mamdani']
+
+# Map risk levels to scores (0-100)
+RISK_LEVEL_SCORES = {
+    1: 33.33,  # Low
+    2: 66.67,  # Medium
+    3: 100     # High
 }
 
+PRIORITY_COMPONENTS = ['risk_level', 'waiting_time', 'resource_availability', 'staff_availability']
+
 class TriageFuzzyLogic:
     def __init__(self, settings=None):
         # Default settings
@@ -87,6 +77,15 @@ class TriageFuzzyLogic:
             weighted_staff_availability_score
         )
         
+        # Use the fuzzy rule base instead of the weighted sum if configured
+        if self.settings.get('inference_mode', 'weighted') == 'mamdani':
+            priority_score = float(get_mamdani_engine().evaluate(
+                patient_data.get('risk_level', 1),
+                patient_data.get('waiting_time_minutes', 0),
+                patient_data.get('resource_availability', 75),
+                patient_data.get('staff_availability', 80)
+            ))
+        
         # Ensure score is within bounds and convert to integer
         priority_score = int(min(100, max(0, priority_score)))
         
@@ -117,15 +116,185 @@ class TriageFuzzyLogic:
             }
         }
     
+    def calculate_priorities(self, patients, include_components=False):
+        """Calculate priority scores for many patients in one vectorized pass.
+        
+        `patients` is a DataFrame or a mapping of equal-length arrays with the
+        columns risk_level, waiting_time_minutes, resource_availability and
+        staff_availability. Scores match calculate_priority exactly. The
+        per-patient component breakdown is only built when include_components
+        is set, since it is the expensive part for large batches.
+        """
+        risk_level = np.asarray(patients['risk_level'], dtype=float)
+        waiting_time_minutes = np.asarray(patients['waiting_time_minutes'], dtype=float)
+        resource_availability = np.asarray(patients['resource_availability'], dtype=float)
+        staff_availability = np.asarray(patients['staff_availability'], dtype=float)
+        
+        # Calculate component scores
+        risk_level_score = np.zeros_like(risk_level)
+        for level, score in RISK_LEVEL_SCORES.items():
+            risk_level_score[risk_level == level] = score
+        exponential_factor = np.power(
+            float(self.settings['waiting_time_exponent_base']),
+            waiting_time_minutes / self.settings['waiting_time_constant']
+        )
+        waiting_time_score = np.minimum(100, 100 * (1 - 1 / exponential_factor))
+        resource_availability_score = resource_availability
+        staff_availability_score = staff_availability
+        
+        # Apply weights to component scores
+        weighted = {
+            'risk_level': risk_level_score * self.settings['risk_level_weight'],
+            'waiting_time': waiting_time_score * self.settings['waiting_time_weight'],
+            'resource_availability': resource_availability_score * self.settings['resource_availability_weight'],
+            'staff_availability': staff_availability_score * self.settings['staff_availability_weight']
+        }
+        
+        # Calculate final priority score (0-100), truncated like int()
+        if self.settings.get('inference_mode', 'weighted') == 'mamdani':
+            priority_score = get_mamdani_engine().evaluate(
+                risk_level, waiting_time_minutes, resource_availability, staff_availability
+            )
+        else:
+            priority_score = (
+                weighted['risk_level'] +
+                weighted['waiting_time'] +
+                weighted['resource_availability'] +
+                weighted['staff_availability']
+            )
+        priority_score = np.trunc(np.clip(priority_score, 0, 100)).astype(int)
+        
+        result = {
+            'priority_score': priority_score,
+            'values': {
+                'risk_level': risk_level,
+                'waiting_time': waiting_time_minutes,
+                'resource_availability': resource_availability,
+                'staff_availability': staff_availability
+            },
+            'scores': {
+                'risk_level': risk_level_score,
+                'waiting_time': waiting_time_score,
+                'resource_availability': resource_availability_score,
+                'staff_availability': staff_availability_score
+            },
+            'weighted_scores': weighted
+        }
+        
+        if include_components:
+            result['components'] = self.build_components(result)
+        
+        return result
+    
+    def build_components(self, batch_result):
+        """Build the per-patient component breakdown for a calculate_priorities result"""
+        values = {name: batch_result['values'][name].tolist() for name in PRIORITY_COMPONENTS}
+        scores = {name: np.trunc(batch_result['scores'][name]).astype(int).tolist() for name in PRIORITY_COMPONENTS}
+        weighted = {name: np.trunc(batch_result['weighted_scores'][name]).astype(int).tolist() for name in PRIORITY_COMPONENTS}
+        
+        return [
+            {
+                name: {
+                    "value": values[name][i],
+                    "score": scores[name][i],
+                    "weighted_score": weighted[name][i]
+                }
+                for name in PRIORITY_COMPONENTS
+            }
+            for i in range(len(batch_result['priority_score']))
+        ]
+
+    def next_reorder_time(self, queue, now):
+        """Earliest time at which two adjacent patients in the queue swap places.
+
+        `queue` maps risk_level, resource_availability, staff_availability,
+        arrival (epoch seconds) and tie_first (True where a patient wins a
+        score tie against the one ahead of it) to arrays in queue order. Only
+        waiting time moves between rescoring passes, and its score is a fixed
+        increasing function of minutes waited, so the time each patient reaches
+        a given score has a closed form. Since the queue is in order as long as
+        every adjacent pair is, the earliest pair crossing is exact.
+
+        Returns epoch seconds, or None if waiting time alone never reorders the
+        queue or the inference mode has no closed form.
+        """
+        if self.settings.get('inference_mode', 'weighted') != 'weighted':
+            return None
+
+        arrival = np.asarray(queue['arrival'], dtype=float)
+        if len(arrival) < 2:
+            return None
+
+        inputs = {
+            name: np.asarray(queue[name], dtype=float)
+            for name in ('risk_level', 'resource_availability', 'staff_availability')
+        }
+        tie_first = np.asarray(queue['tie_first'], dtype=bool)[1:]
+
+        def scores_at(index, times):
+            # Same integer minutes as the rescoring pass
+            minutes = np.trunc((times - arrival[index]) / 60)
+            patients = {name: values[index] for name, values in inputs.items()}
+            patients['waiting_time_minutes'] = minutes
+            return self.calculate_priorities(patients)['priority_score']
+
+        def time_to_reach(index, scores, since):
+            # Invert 100 * (1 - base^(-t / constant)) for the minutes needed, then
+            # correct for rounding by checking the neighbouring minutes
+            base = float(self.settings['waiting_time_exponent_base'])
+            constant = float(self.settings['waiting_time_constant'])
+            weight = float(self.settings['waiting_time_weight'])
+            current = np.maximum(np.trunc((since - arrival[index]) / 60), 0)
+            patients = {name: values[index] for name, values in inputs.items()}
+            patients['waiting_time_minutes'] = current
+            weighted = self.calculate_priorities(patients)['weighted_scores']
+            other = weighted['risk_level'] + weighted['resource_availability'] + weighted['staff_availability']
+
+            if weight <= 0 or base <= 1:
+                return np.full(len(index), np.inf)
+            fraction = (scores - other) / (100 * weight)
+            reachable = fraction < 1
+            with np.errstate(divide='ignore', invalid='ignore'):
+                minutes = -constant * np.log1p(-np.clip(fraction, 0, 1)) / math.log(base)
+            minutes = np.where(reachable, np.maximum(np.ceil(minutes), current), 0)
+
+            for _ in range(2):
+                minutes = np.where(reachable & (scores_at(index, arrival[index] + 60 * minutes) < scores), minutes + 1, minutes)
+            for _ in range(2):
+                earlier = np.maximum(minutes - 1, current)
+                minutes = np.where(reachable & (scores_at(index, arrival[index] + 60 * earlier) >= scores), earlier, minutes)
+
+            return np.where(reachable, arrival[index] + 60 * minutes, np.inf)
+
+        ahead = np.arange(len(arrival) - 1)
+        crossing = np.full(len(ahead), np.inf)
+        times = np.full(len(ahead), float(now))
+        active = ahead
+        # Each round either finds the crossing or waits for the patient ahead to
+        # gain a point, so it ends within the 0-100 score range
+        for _ in range(202):
+            if not len(active):
+                break
+            score_ahead = scores_at(active, times[active])
+            score_behind = scores_at(active + 1, times[active])
+            swapped = (score_behind > score_ahead) | ((score_behind == score_ahead) & tie_first[active])
+            crossing[active[swapped]] = times[active[swapped]]
+
+            active = active[~swapped]
+            target = score_ahead[~swapped] + np.where(tie_first[active], 0, 1)
+            reached = time_to_reach(active + 1, target, times[active])
+            times[active] = np.maximum(times[active], reached)
+            active = active[np.isfinite(reached)]
+        # Pairs still unresolved are rechecked no later than where the search stopped
+        crossing[active] = times[active]
+
+        if not np.isfinite(crossing).any():
+            return None
+        return float(crossing.min())
+
     def calculate_risk_level_score(self, risk_level):
         """Calculate risk level score (0-100)"""
-        # Map risk levels to scores (0-100)
-        risk_level_map = {
-            1: 33.33,  # Low
-            2: 66.67,  # Medium
-            3: 100     # High
-        }
-        return risk_level_map.get(risk_level, 0)
+        return RISK_LEVEL_SCORES.get(risk_level, 0)
     
     def calculate_waiting_time_score(self, waiting_time_minutes):
         """Calculate waiting time score with exponential weighting (0-100)"""
@@ -150,102 +319,325 @@ class TriageFuzzyLogic:
         # Higher availability = higher score
         return staff_availability
 
-def get_triage_settings():
-    """Get triage settings from database or use defaults"""
+def fetch_triage_settings():
+    """Fetch triage settings from the database, or the defaults if none are stored"""
+    params = {'key': 'eq.priority_calculation'}
+    result = supabase_request('GET', '/rest/v1/system_settings', params=params)
+    
+    if result and len(result) > 0:
+        return result[0]['value']
+    
+    return DEFAULT_TRIAGE_SETTINGS
+
+# Settings rarely change, so keep them in process for TRIAGE_SETTINGS_TTL_SECONDS
+# and fall back to the last good value if Supabase is unreachable
+def fetch_triage_settings_version():
+    """updated_at of the stored settings, which every save changes"""
+    params = {'key': 'eq.priority_calculation', 'select': 'updated_at'}
+    result = supabase_request('GET', '/rest/v1/system_settings', params=params)
+    return result[0]['updated_at'] if result else None
+
+# A save in another worker is picked up by the version check rather than invalidate()
+settings_cache = TTLCache(
+    fetch_triage_settings,
+    ttl=float(os.environ.get('TRIAGE_SETTINGS_TTL_SECONDS', 60)),
+    serve_stale=os.environ.get('TRIAGE_SETTINGS_SERVE_STALE', 'true').lower() == 'true',
+    version=fetch_triage_settings_version,
+    version_ttl=float(os.environ.get('TRIAGE_SETTINGS_VERSION_CHECK_SECONDS', 5))
+)
+
+def get_triage_settings(revalidate=False):
+    """Get triage settings from the cache, database or defaults"""
     try:
-        # Try to get settings from Supabase
-        params = {'key': 'eq.priority_calculation'}
-        result = supabase_request('GET', '/rest/v1/system_settings', params=params)
-        
-        if result and len(result) > 0:
-            return result[0]['value']
-        
-        return DEFAULT_TRIAGE_SETTINGS
+        return settings_cache.get(revalidate)
     except Exception as e:
         print(f"Error fetching triage settings: {e}")
         return DEFAULT_TRIAGE_SETTINGS
 
-@triage_bp.route('/queue', methods=['GET'])
-def get_queue():
-    """Get prioritized patient queue"""
-    try:
-        # Get all waiting patients
-        params = {'status': 'eq.waiting'}
-        patients = supabase_request('GET', '/rest/v1/patients', params=params)
+def persist_priority_updates(priority_updates, reason, now):
+    """Write changed priority scores and their priority_logs rows in bulk.
+    
+    Rows whose score did not change are skipped, so the write volume follows
+    how much the queue moved rather than how long it is. Scores are written
+    with a single call to the update_priority_scores RPC; if that function is
+    not installed the rows are PATCHed grouped by score instead. Log rows are
+    handed to the write-behind priority_log_writer and inserted in the
+    background.
+    """
+    started = time.perf_counter()
+    
+    changed = [
+        update for update in priority_updates
+        if update['previous_score'] is None or int(float(update['previous_score'])) != update['new_score']
+    ]
+    
+    if changed:
+        timestamp = now.isoformat() + 'Z'  # Add UTC indicator
         
-        if not patients:
-            return jsonify([])
+        # Update patient scores
+        score_rows = [
+            {'id': update['patient']['id'], 'priority_score': update['new_score']}
+            for update in changed
+        ]
+        try:
+            supabase_request('POST', '/rest/v1/rpc/update_priority_scores', data={
+                'updates': score_rows,
+                'updated_at': timestamp
+            })
+        except Exception as e:
+            print(f"Bulk score update failed, falling back to grouped PATCH: {e}")
+            ids_by_score = {}
+            for row in score_rows:
+                ids_by_score.setdefault(row['priority_score'], []).append(str(row['id']))
+            for score, ids in ids_by_score.items():
+                update_data = {
+                    'priority_score': score,
+                    'last_priority_update': timestamp
+                }
+                supabase_request('PATCH', f"/rest/v1/patients?id=in.({','.join(ids)})", data=update_data)
         
-        # Get triage settings
-        settings = get_triage_settings()
+        # Log priority updates
+        log_rows = [{
+            'patient_id': update['patient']['id'],
+            'previous_score': int(float(update['previous_score'] or 0)),  # Convert to integer
+            'new_score': update['new_score'],
+            'waiting_time_minutes': update['waiting_time_minutes'],
+            'risk_level': update['patient']['risk_level'],
+            'resource_availability_factor': int(update['resource_availability']),  # Convert to integer
+            'staff_availability_factor': int(update['staff_availability']),  # Convert to integer
+            'reason': reason,
+            'created_at': timestamp
+        } for update in changed]
+        priority_log_writer.submit(log_rows)
+    
+    return {
+        'rows_written': len(changed),
+        'duration_ms': (time.perf_counter() - started) * 1000
+    }
+
+# Waiting patients ordered by priority score, then arrival, keyed by patient id
+waiting_queue = IndexedPriorityQueue()
+
+def queue_priority(score, arrival_time, patient_id):
+    """Sort key in waiting_queue: highest score first, earlier arrival breaks ties"""
+    return (-score, arrival_time, str(patient_id))
+
+EPOCH = datetime(1970, 1, 1)
+
+def recalculate_queue():
+    """Rescore every waiting patient, persist the changes and rekey the waiting queue"""
+    # Get all waiting patients and the triage settings together
+    params = {'status': 'eq.waiting'}
+    patients, settings = run_concurrently(
+        lambda: supabase_request('GET', '/rest/v1/patients', params=params),
+        # The pass may follow a settings save in another worker, so check for one now
+        lambda: get_triage_settings(revalidate=True)
+    )
+    
+    if not patients:
+        waiting_queue.retain(set())
+        resource_requirements.retain(set())
+        specialty_requirements.retain(set())
+        return waiting_queue, {'rows_written': 0, 'duration_ms': 0.0}, math.inf
+    
+    # Initialize fuzzy logic system
+    fuzzy_logic = TriageFuzzyLogic(settings)
+    
+    # Fetch requirements and available staff/resources once for the whole queue
+    snapshot = load_availability_snapshot([patient['id'] for patient in patients])
+    
+    # Calculate waiting time and availability for each patient
+    now = datetime.utcnow()  # Use UTC time
+    waiting_times = []
+    arrival_times = []
+    arrival_seconds = []
+    resource_availabilities = []
+    staff_availabilities = []
+    for patient in patients:
+        # Calculate waiting time in minutes
+        # Handle both ISO format with and without timezone
+        arrival_time_str = patient['arrival_time']
+        try:
+            # Try parsing with timezone info
+            arrival_time = datetime.fromisoformat(arrival_time_str)
+            # Convert to UTC if it has timezone info
+            if arrival_time.tzinfo is not None:
+                arrival_time = arrival_time.astimezone(None).replace(tzinfo=None)
+        except ValueError:
+            # If parsing fails, try removing timezone info
+            arrival_time = datetime.fromisoformat(arrival_time_str.split('+')[0].split('Z')[0])
         
-        # Initialize fuzzy logic system
-        fuzzy_logic = TriageFuzzyLogic(settings)
+        waiting_times.append(int((now - arrival_time).total_seconds() / 60))  # Convert to integer minutes
+        arrival_times.append(arrival_time.isoformat())
+        arrival_seconds.append((arrival_time - EPOCH).total_seconds())
         
-        # Calculate waiting time and priority for each patient
-        now = datetime.utcnow()  # Use UTC time
-        for patient in patients:
-            # Calculate waiting time in minutes
-            # Handle both ISO format with and without timezone
-            arrival_time_str = patient['arrival_time']
-            try:
-                # Try parsing with timezone info
-                arrival_time = datetime.fromisoformat(arrival_time_str)
-                # Convert to UTC if it has timezone info
-                if arrival_time.tzinfo is not None:
-                    arrival_time = arrival_time.astimezone(None).replace(tzinfo=None)
-            except ValueError:
-                # If parsing fails, try removing timezone info
-                arrival_time = datetime.fromisoformat(arrival_time_str.split('+')[0].split('Z')[0])
-            
-            waiting_time_minutes = int((now - arrival_time).total_seconds() / 60)  # Convert to integer minutes
-            
-            # Get resource and staff availability for this patient
-            resource_availability = calculate_resource_availability(patient)
-            staff_availability = calculate_staff_availability(patient)
-            
-            # Calculate priority score
-            priority_result = fuzzy_logic.calculate_priority({
-                'risk_level': patient['risk_level'],
-                'waiting_time_minutes': waiting_time_minutes,
-                'resource_availability': resource_availability,
-                'staff_availability': staff_availability
-            })
-            
-            # Update patient with priority score
-            patient['priority_score'] = int(priority_result['priority_score'])  # Convert to integer
-            patient['waiting_time_minutes'] = waiting_time_minutes
-            
-            # Update patient in database
-            update_data = {
-                'priority_score': int(priority_result['priority_score']),  # Convert to integer
-                'last_priority_update': now.isoformat() + 'Z',  # Add UTC indicator
-            }
-            # Format the query parameters correctly for Supabase
-            result = supabase_request('PATCH', f'/rest/v1/patients?id=eq.{patient["id"]}', data=update_data)
-            
-            # Log priority update
-            log_data = {
-                'patient_id': patient['id'],
-                'previous_score': int(patient.get('priority_score', 0)),  # Convert to integer
-                'new_score': int(priority_result['priority_score']),  # Convert to integer
-                'waiting_time_minutes': waiting_time_minutes,
-                'risk_level': patient['risk_level'],
-                'resource_availability_factor': int(resource_availability),  # Convert to integer
-                'staff_availability_factor': int(staff_availability),  # Convert to integer
-                'reason': 'Regular queue update',
-                'created_at': now.isoformat() + 'Z'  # Add UTC indicator
-            }
-            supabase_request('POST', '/rest/v1/priority_logs', data=log_data)
+        # Get resource and staff availability for this patient
+        resource_availabilities.append(calculate_resource_availability(patient, snapshot))
+        staff_availabilities.append(calculate_staff_availability(patient, snapshot))
+    
+    # Score the whole queue in one pass
+    priority_result = fuzzy_logic.calculate_priorities({
+        'risk_level': [patient['risk_level'] for patient in patients],
+        'waiting_time_minutes': waiting_times,
+        'resource_availability': resource_availabilities,
+        'staff_availability': staff_availabilities
+    })
+    new_scores = priority_result['priority_score'].tolist()
+    
+    # Queue the changes for the batched write-back
+    priority_updates = []
+    for i, patient in enumerate(patients):
+        priority_updates.append({
+            'patient': patient,
+            'previous_score': patient.get('priority_score'),
+            'new_score': new_scores[i],
+            'waiting_time_minutes': waiting_times[i],
+            'resource_availability': resource_availabilities[i],
+            'staff_availability': staff_availabilities[i]
+        })
         
-        # Sort by priority score (descending)
-        sorted_queue = sorted(patients, key=lambda p: p.get('priority_score', 0), reverse=True)
+        # Update patient with priority score
+        patient['priority_score'] = new_scores[i]
+        patient['waiting_time_minutes'] = waiting_times[i]
+    
+    # Persist changed scores and their log rows in bulk
+    write_stats = persist_priority_updates(priority_updates, 'Regular queue update', now)
+    
+    # Drop patients that left the queue and rekey the rest; unchanged scores keep their position
+    keys = [queue_priority(new_scores[i], arrival_times[i], patient['id']) for i, patient in enumerate(patients)]
+    waiting_ids = {str(patient['id']) for patient in patients}
+    waiting_queue.retain(waiting_ids)
+    resource_requirements.retain(waiting_ids)
+    specialty_requirements.retain(waiting_ids)
+    for i, patient in enumerate(patients):
+        waiting_queue.push(str(patient['id']), keys[i], {
+            'patient': patient,
+            'risk_level': patient['risk_level'],
+            'resource_availability': resource_availabilities[i],
+            'staff_availability': staff_availabilities[i],
+            'arrival': arrival_seconds[i]
+        })
+    
+    # Work out when waiting time alone will next reorder the queue, so the
+    # scheduler can sleep until then instead of rescoring on every tick
+    order = sorted(range(len(patients)), key=keys.__getitem__)
+    next_reorder = fuzzy_logic.next_reorder_time({
+        'risk_level': [patients[i]['risk_level'] for i in order],
+        'resource_availability': [resource_availabilities[i] for i in order],
+        'staff_availability': [staff_availabilities[i] for i in order],
+        'arrival': [arrival_seconds[i] for i in order],
+        'tie_first': [False] + [keys[order[k]][1:] < keys[order[k - 1]][1:] for k in range(1, len(order))]
+    }, (now - EPOCH).total_seconds())
+    if next_reorder is None and settings.get('inference_mode', 'weighted') == 'weighted':
+        next_reorder = math.inf
+    
+    return waiting_queue, write_stats, next_reorder
+
+def restore_queue(entries):
+    """Load another worker's rescoring pass into this process's waiting_queue"""
+    waiting_queue.replace(entries)
+    waiting_ids = {key for key, _, _ in entries}
+    resource_requirements.retain(waiting_ids)
+    specialty_requirements.retain(waiting_ids)
+    return waiting_queue
+
+# One worker rescores and writes; the rest load its passes (see QueueScheduler)
+queue_scheduler = QueueScheduler(recalculate_queue, export=lambda queue: queue.entries(), restore=restore_queue)
+
+def queue_view(entries):
+    """Patients for waiting_queue entries with their scores brought up to date.
+    
+    The order only changes at the crossing times the scheduler wakes for, so
+    between passes only the scores and waiting minutes need recomputing.
+    """
+    if not entries:
+        return []
+    
+    now = datetime.utcnow()  # Use UTC time
+    waiting_times = np.trunc(((now - EPOCH).total_seconds() - np.array([entry['arrival'] for entry in entries])) / 60)
+    scores = TriageFuzzyLogic(get_triage_settings()).calculate_priorities({
+        'risk_level': [entry['risk_level'] for entry in entries],
+        'waiting_time_minutes': waiting_times,
+        'resource_availability': [entry['resource_availability'] for entry in entries],
+        'staff_availability': [entry['staff_availability'] for entry in entries]
+    })['priority_score'].tolist()
+    
+    return [
+        dict(entry['patient'], priority_score=score, waiting_time_minutes=waiting_time)
+        for entry, score, waiting_time in zip(entries, scores, waiting_times.astype(int).tolist())
+    ]
+
+# Pushes each pass to /queue/stream clients; one diff is computed per pass however many are connected
+queue_broadcaster = QueueBroadcaster()
+queue_scheduler.add_listener(
+    lambda latest: queue_broadcaster.publish(queue_view(latest['queue'].top()), latest['computed_at'])
+)
+
+# Seconds between keep-alive comments on idle streams, so proxies do not drop them
+QUEUE_STREAM_KEEPALIVE_SECONDS = float(os.environ.get('QUEUE_STREAM_KEEPALIVE_SECONDS', 15))
+
+@triage_bp.route('/queue', methods=['GET'])
+def get_queue():
+    """Get prioritized patient queue as of the latest background rescoring pass.
+    
+    Pass limit (and optionally offset) to page through the queue; a page costs
+    time in proportion to its size rather than the number of waiting patients.
+    """
+    try:
+        limit = request.args.get('limit')
+        offset = request.args.get('offset', '0')
+        try:
+            limit = int(limit) if limit is not None else None
+            offset = int(offset)
+        except ValueError:
+            limit = offset = -1
+        if (limit is not None and limit < 0) or offset < 0:
+            return jsonify({"error": "limit and offset must be non-negative integers"}), 400
         
-        return jsonify(sorted_queue)
+        latest = queue_scheduler.get_latest()
+        queue = latest['queue']
+        
+        response = jsonify(queue_view(queue.top(limit, offset)))
+        response.headers['X-Queue-Total'] = str(len(queue))
+        response.headers['X-Queue-Computed-At'] = latest['computed_at']
+        response.headers['X-Priority-Rows-Written'] = str(latest['write_stats']['rows_written'])
+        response.headers['X-Priority-Write-Ms'] = f"{latest['write_stats']['duration_ms']:.1f}"
+        return response
     except Exception as e:
         print(f"Queue Error: {str(e)}")  # Add debug logging
         return jsonify({"error": str(e)}), 500
 
+@triage_bp.route('/queue/stream', methods=['GET'])
+def stream_queue():
+    """Stream the prioritized queue as server-sent events.
+    
+    Sends a `snapshot` event with the whole queue, then a `diff` event after
+    each rescoring pass that changed it: arrivals (patient and rank),
+    departures (ids), moves ([id, rank]), scores ([id, score, waiting
+    minutes]) and updates (records edited in other fields).
+    """
+    try:
+        # Runs the first pass (which publishes the queue) if none has run yet
+        queue_scheduler.get_latest()
+        version, snapshot = queue_broadcaster.snapshot()
+    except Exception as e:
+        print(f"Queue Stream Error: {str(e)}")  # Add debug logging
+        return jsonify({"error": str(e)}), 500
+    
+    def events(version, snapshot):
+        yield snapshot
+        while True:
+            version, messages = queue_broadcaster.wait(version, QUEUE_STREAM_KEEPALIVE_SECONDS)
+            if not messages:
+                yield ": keep-alive\n\n"
+            for message in messages:
+                yield message
+    
+    return Response(stream_with_context(events(version, snapshot)), mimetype='text/event-stream', headers={
+        'Cache-Control': 'no-cache',
+        'X-Accel-Buffering': 'no'  # Stop nginx buffering the stream
+    })
+
 @triage_bp.route('/calculate', methods=['POST'])
 def calculate_priority():
     """Calculate priority for a specific patient"""
@@ -256,18 +648,20 @@ def calculate_priority():
         if 'patient_id' not in data:
             return jsonify({"error": "Missing patient_id field"}), 400
         
-        # Get patient
+        # Get patient, triage settings and (unless supplied) availability at the same time
         params = {'id': f"eq.{data['patient_id']}"}
-        patients = supabase_request('GET', '/rest/v1/patients', params=params)
+        needs_snapshot = 'resource_availability' not in data or 'staff_availability' not in data
+        patients, settings, snapshot = run_concurrently(
+            lambda: supabase_request('GET', '/rest/v1/patients', params=params),
+            get_triage_settings,
+            lambda: load_availability_snapshot([data['patient_id']]) if needs_snapshot else None
+        )
         
         if not patients:
             return jsonify({"error": "Patient not found"}), 404
         
         patient = patients[0]
         
-        # Get triage settings
-        settings = get_triage_settings()
-        
         # Initialize fuzzy logic system
         fuzzy_logic = TriageFuzzyLogic(settings)
         
@@ -288,8 +682,12 @@ def calculate_priority():
         waiting_time_minutes = int((now - arrival_time).total_seconds() / 60)  # Convert to integer minutes
         
         # Get resource and staff availability
-        resource_availability = data.get('resource_availability', calculate_resource_availability(patient))
-        staff_availability = data.get('staff_availability', calculate_staff_availability(patient))
+        resource_availability = data.get('resource_availability')
+        if resource_availability is None:
+            resource_availability = calculate_resource_availability(patient, snapshot)
+        staff_availability = data.get('staff_availability')
+        if staff_availability is None:
+            staff_availability = calculate_staff_availability(patient, snapshot)
         
         # Calculate priority score
         priority_result = fuzzy_logic.calculate_priority({
@@ -319,7 +717,7 @@ def calculate_priority():
             'reason': 'Manual calculation',
             'created_at': now.isoformat() + 'Z'  # Add UTC indicator
         }
-        supabase_request('POST', '/rest/v1/priority_logs', data=log_data)
+        priority_log_writer.submit(log_data)
         
         # Update patient object for response
         patient['priority_score'] = int(priority_result['priority_score'])  # Convert to integer
@@ -370,6 +768,9 @@ def update_settings():
         if abs(weights_sum - 1.0) > 0.01:
             return jsonify({"error": "Weights must sum to 1.0"}), 400
         
+        if data.get('inference_mode', 'weighted') not in INFERENCE_MODES:
+            return jsonify({"error": f"Invalid inference_mode. Must be one of: {', '.join(INFERENCE_MODES)}"}), 400
+        
         # Update settings in database
         update_data = {
             'key': 'priority_calculation',
@@ -385,16 +786,77 @@ def update_settings():
             # If no existing record, create one
             supabase_request('POST', '/rest/v1/system_settings', data=update_data)
         
+        # Drop the cached settings and rescore with the new weights right away
+        settings_cache.invalidate()
+        queue_scheduler.trigger()
+        
         return jsonify(data)
     except Exception as e:
         return jsonify({"error": str(e)}), 500
 
+# Patient columns read when statistics are computed by scanning
+STATISTICS_FIELDS = ['status', 'risk_level', 'arrival_time', 'treatment_start_time']
+
+def parse_day(value):
+    """Date from an ISO date or datetime query parameter, or None if not given"""
+    if not value:
+        return None
+    return date.fromisoformat(value[:10])
+
+def fetch_statistics_groups(from_day, to_day):
+    """Patient counts and treatment waits per (status, risk level) for arrivals in the window.
+    
+    Read from the daily counters the database keeps up to date on every patient
+    insert, update and delete (triage_statistics RPC), so the cost depends on
+    the number of days in the window rather than the number of patients.
+    """
+    return supabase_request('POST', '/rest/v1/rpc/triage_statistics', data={
+        'from_day': from_day.isoformat() if from_day else None,
+        'to_day': to_day.isoformat() if to_day else None
+    })
+
+def scan_statistics_groups(from_day, to_day):
+    """Same groups as fetch_statistics_groups, computed by walking the patients table"""
+    conditions = []
+    if from_day:
+        conditions.append(f'arrival_time.gte.{from_day.isoformat()}')
+    if to_day:
+        conditions.append(f'arrival_time.lt.{(to_day + timedelta(days=1)).isoformat()}')
+    filters = {'and': f"({','.join(conditions)})"} if conditions else None
+    
+    groups = {}
+    for patient in iterate_rows('/rest/v1/patients', filters=filters, fields=STATISTICS_FIELDS):
+        group = groups.setdefault((patient['status'], patient['risk_level']), {
+            'status': patient['status'],
+            'risk_level': patient['risk_level'],
+            'patient_count': 0,
+            'waited_count': 0,
+            'total_wait_minutes': 0
+        })
+        group['patient_count'] += 1
+        if patient.get('arrival_time') and patient.get('treatment_start_time'):
+            arrival_time = datetime.fromisoformat(patient['arrival_time'])
+            treatment_start_time = datetime.fromisoformat(patient['treatment_start_time'])
+            group['waited_count'] += 1
+            group['total_wait_minutes'] += (treatment_start_time - arrival_time).total_seconds() / 60
+    
+    return list(groups.values())
+
 @triage_bp.route('/statistics', methods=['GET'])
 def get_statistics():
-    """Get triage system statistics"""
+    """Get triage system statistics, optionally for patients who arrived between from and to (inclusive dates)"""
     try:
-        # Get all patients
-        all_patients = supabase_request('GET', '/rest/v1/patients')
+        try:
+            from_day = parse_day(request.args.get('from'))
+            to_day = parse_day(request.args.get('to'))
+        except ValueError:
+            return jsonify({"error": "from and to must be ISO dates (YYYY-MM-DD)"}), 400
+        
+        try:
+            groups = fetch_statistics_groups(from_day, to_day) or []
+        except Exception as e:
+            print(f"Statistics RPC failed, falling back to a table scan: {e}")
+            groups = scan_statistics_groups(from_day, to_day)
         
         # Count patients by status
         status_counts = {
@@ -404,109 +866,158 @@ def get_statistics():
             'discharged': 0
         }
         
-        for patient in all_patients:
-            status = patient['status']
-            if status in status_counts:
-                status_counts[status] += 1
-        
         # Count patients by risk level
         risk_level_counts = {
             'low': 0,    # Risk level 1
             'medium': 0, # Risk level 2
             'high': 0    # Risk level 3
         }
+        risk_level_names = {1: 'low', 2: 'medium', 3: 'high'}
         
-        for patient in all_patients:
-            risk_level = patient['risk_level']
-            if risk_level == 1:
-                risk_level_counts['low'] += 1
-            elif risk_level == 2:
-                risk_level_counts['medium'] += 1
-            elif risk_level == 3:
-                risk_level_counts['high'] += 1
-        
-        # Calculate average waiting time for treated patients
-        treated_patients = [p for p in all_patients if p['status'] in ['treated', 'discharged']]
+        total_patients = 0
+        waited_patients = 0
         total_waiting_time = 0
+        for group in groups:
+            count = int(group['patient_count'])
+            total_patients += count
+            if group['status'] in status_counts:
+                status_counts[group['status']] += count
+            if group['risk_level'] in risk_level_names:
+                risk_level_counts[risk_level_names[group['risk_level']]] += count
+            
+            # Calculate average waiting time for treated patients with a recorded treatment start
+            if group['status'] in ['treated', 'discharged']:
+                waited_patients += int(group.get('waited_count') or 0)
+                total_waiting_time += float(group['total_wait_minutes'] or 0)
         
-        for patient in treated_patients:
-            if 'arrival_time' in patient and 'treatment_start_time' in patient:
-                arrival_time = datetime.fromisoformat(patient['arrival_time'])
-                treatment_start_time = datetime.fromisoformat(patient['treatment_start_time'])
-                waiting_time_minutes = (treatment_start_time - arrival_time).total_seconds() / 60
-                total_waiting_time += waiting_time_minutes
-        
-        avg_waiting_time = total_waiting_time / len(treated_patients) if treated_patients else 0
+        avg_waiting_time = total_waiting_time / waited_patients if waited_patients else 0
         
         return jsonify({
             'patient_counts': {
-                'total': len(all_patients),
+                'total': total_patients,
                 'by_status': status_counts,
                 'by_risk_level': risk_level_counts
             },
             'waiting_time': {
                 'average_minutes': avg_waiting_time
             },
+            'window': {
+                'from': from_day.isoformat() if from_day else None,
+                'to': to_day.isoformat() if to_day else None
+            },
             'created_at': datetime.now().isoformat()
         })
     except Exception as e:
         return jsonify({"error": str(e)}), 500
 
-def calculate_resource_availability(patient):
-    """Calculate resource availability percentage for a patient"""
+# Treatment starts this recent may not be committed yet, so each sync stops short of now
+WAIT_STATS_SYNC_LAG_SECONDS = float(os.environ.get('WAIT_STATS_SYNC_LAG_SECONDS', 5))
+
+def sync_wait_stats():
+    """Load treatment starts recorded since the last sync into wait_stats.
+    
+    The first sync covers the longest window. Every worker runs its own, so
+    each one's statistics include the status changes the others served.
+    """
+    until = datetime.utcnow() - timedelta(seconds=WAIT_STATS_SYNC_LAG_SECONDS)
+    since = wait_stats.synced_through or until - timedelta(seconds=max(wait_stats.windows.values()))
+    if until <= since:
+        return 0
+    filters = {'and': f"(treatment_start_time.gte.{since.isoformat()},treatment_start_time.lt.{until.isoformat()})"}
+    
+    count = 0
+    for patient in iterate_rows('/rest/v1/patients', filters=filters, fields=['arrival_time', 'treatment_start_time', 'risk_level']):
+        try:
+            record_treatment_start(patient)
+        except (TypeError, ValueError) as e:
+            print(f"Could not record treatment wait: {str(e)}")
+        count += 1
+    wait_stats.synced_through = until
+    return count
+
+@triage_bp.route('/statistics/wait-times', methods=['GET'])
+def get_wait_time_statistics():
+    """Get p50/p90/p99 door-to-treatment times and treatment throughput over sliding windows"""
     try:
-        # Get patient resource requirements
-        params = {'patient_id': f"eq.{patient['id']}"}
-        requirements = supabase_request('GET', '/rest/v1/patient_resource_requirements', params=params)
-        
-        if not requirements:
-            return 100  # No requirements means 100% availability
-        
-        # Get available resources
-        params = {'status': 'eq.available'}
-        available_resources = supabase_request('GET', '/rest/v1/resources', params=params)
-        
-        # Count how many required resource types are available
-        available_types = set(r['type'] for r in available_resources)
-        required_types = set(r['resource_type'] for r in requirements)
-        
-        # Calculate availability percentage
-        if not required_types:
-            return 100
-        
-        available_count = sum(1 for t in required_types if t in available_types)
-        return (available_count / len(required_types)) * 100
+        return jsonify({
+            'windows': wait_stats.summary(),
+            'created_at': datetime.now().isoformat()
+        })
     except Exception as e:
-        print(f"Error calculating resource availability: {e}")
-        return 75  # Default value
+        return jsonify({"error": str(e)}), 500
 
-def calculate_staff_availability(patient):
-    """Calculate staff availability percentage for a patient"""
+def load_availability_snapshot(patient_ids):
+    """Load everything availability scoring needs for a set of patients.
+    
+    Requirements come from the in-process requirement indexes as bitsets, and
+    available specialties and resource types from the availability indexes, so
+    only patients seen for the first time cost a query. A part that fails to
+    load is stored as None so scoring can fall back to its default.
+    """
+    snapshot = {
+        'resource_requirements': None,
+        'available_resource_types': None,
+        'specialty_requirements': None,
+        'available_specialties': None
+    }
+    
     try:
-        # Get patient specialty requirements
-        params = {'patient_id': f"eq.{patient['id']}"}
-        requirements = supabase_request('GET', '/rest/v1/patient_specialty_requirements', params=params)
-        
-        if not requirements:
-            return 100  # No requirements means 100% availability
-        
-        # Get available staff
-        params = {'status': 'eq.available'}
-        available_staff = supabase_request('GET', '/rest/v1/staff', params=params)
-        
-        # Count how many required specialties are available
-        available_specialties = set(s['specialty'] for s in available_staff)
-        required_specialties = set(r['specialty'] for r in requirements)
-        
-        # Calculate availability percentage
-        if not required_specialties:
-            return 100
-        
-        available_count = sum(1 for s in required_specialties if s in available_specialties)
-        return (available_count / len(required_specialties)) * 100
+        snapshot['resource_requirements'] = resource_requirements.masks(patient_ids)
+        snapshot['available_resource_types'] = resource_requirements.mask(resource_availability.counts())
     except Exception as e:
-        print(f"Error calculating staff availability: {e}")
+        print(f"Error loading resource availability: {e}")
+    
+    try:
+        snapshot['specialty_requirements'] = specialty_requirements.masks(patient_ids)
+        snapshot['available_specialties'] = specialty_requirements.mask(staff_availability.counts())
+    except Exception as e:
+        print(f"Error loading staff availability: {e}")
+    
+    return snapshot
+
+def calculate_resource_availability(patient, snapshot=None):
+    """Calculate resource availability percentage for a patient"""
+    if snapshot is None:
+        snapshot = load_availability_snapshot([patient['id']])
+    
+    if snapshot['resource_requirements'] is None or snapshot['available_resource_types'] is None:
+        return 75  # Default value
+    
+    required_types = snapshot['resource_requirements'].get(str(patient['id']), 0)
+    return availability_percentage(required_types, snapshot['available_resource_types'])
+
+def calculate_staff_availability(patient, snapshot=None):
+    """Calculate staff availability percentage for a patient"""
+    if snapshot is None:
+        snapshot = load_availability_snapshot([patient['id']])
+    
+    if snapshot['specialty_requirements'] is None or snapshot['available_specialties'] is None:
         return 80  # Default value
+    
+    required_specialties = snapshot['specialty_requirements'].get(str(patient['id']), 0)
+    return availability_percentage(required_specialties, snapshot['available_specialties'])
+
+# Intake vitals a /test prediction depends on; Shock_Index and NEWS2 are derived from them
+TEST_MODEL_FIELDS = [
+    'Pulse_Rate', 'Systolic_BP', 'Respiratory_Rate', 'SPO2',
+    'Temperature', 'AVPU', 'Lactate'
+]
+
+# /test responses for recently tried vitals, so repeated what-if queries skip NEWS2 and inference
+prediction_cache = LRUCache(int(os.environ.get('PREDICTION_CACHE_SIZE', 4096)))
+# Entries are keyed on the model version too; dropping them on a swap just frees the space sooner
+model_registry.add_swap_listener(lambda version: prediction_cache.clear())
+
+def prediction_cache_key(data, model_version):
+    """Model version plus the vitals as the model sees them, so 72 and "72" share an entry"""
+    try:
+        vitals = tuple(
+            str(data[field]) if field == 'AVPU' else float(data[field])
+            for field in TEST_MODEL_FIELDS
+        )
+    except (TypeError, ValueError):
+        return None  # Left to the validation below to reject
+    return (model_version,) + vitals
 
 @triage_bp.route('/test', methods=['POST'])
 def test_model():
@@ -515,90 +1026,54 @@ def test_model():
         data = request.json
         
         # Validate required fields
-        required_fields = [
-            'Pulse_Rate', 'Systolic_BP', 'Respiratory_Rate', 'SPO2', 
-            'Temperature', 'AVPU', 'Lactate'
-        ]
-        
-        missing_fields = [field for field in required_fields if field not in data]
+        missing_fields = [field for field in TEST_MODEL_FIELDS if field not in data]
         if missing_fields:
             return jsonify({
                 "error": f"Missing required fields: {', '.join(missing_fields)}"
             }), 400
+        
+        try:
+            model = model_registry.get()
+        except Exception as e:
+            return jsonify({
+                "error": f"Error making triage prediction: {str(e)}"
+            }), 400
+        
+        cache_key = prediction_cache_key(data, model.version)
+        cached = prediction_cache.get(cache_key) if cache_key is not None else None
+        if cached is not None:
+            return jsonify(cached)
             
         # Calculate Shock Index
         try:
-            data['Shock_Index'] = float(data['Pulse_Rate']) / float(data['Systolic_BP'])
+            data['Shock_Index'] = shock_index(data)
         except (ZeroDivisionError, ValueError) as e:
             return jsonify({
                 "error": "Invalid values for Pulse_Rate or Systolic_BP"
             }), 400
         
         # Calculate NEWS2 score
-        def calculate_NEWS2(data):
-            score = 0
-            
-            try:
-                # Respiratory Rate
-                resp_rate = float(data['Respiratory_Rate'])
-                if resp_rate <= 8: score += 3
-                elif 9 <= resp_rate <= 11: score += 1
-                elif 21 <= resp_rate <= 24: score += 2
-                elif resp_rate >= 25: score += 3
-                
-                # SPO2 (assuming room air)
-                spo2 = float(data['SPO2'])
-                if spo2 <= 92: score += 3
-                elif 93 <= spo2 <= 94: score += 2
-                elif 95 <= spo2 <= 96: score += 1
-                
-                # Systolic BP
-                sys_bp = float(data['Systolic_BP'])
-                if sys_bp <= 90: score += 3
-                elif 91 <= sys_bp <= 100: score += 2
-                elif 101 <= sys_bp <= 110: score += 1
-                elif sys_bp >= 220: score += 3
-                
-                # Pulse
-                pulse = float(data['Pulse_Rate'])
-                if pulse <= 40: score += 3
-                elif 41 <= pulse <= 50: score += 1
-                elif 91 <= pulse <= 110: score += 1
-                elif 111 <= pulse <= 130: score += 2
-                elif pulse >= 131: score += 3
-                
-                # Temperature
-                temp = float(data['Temperature'])
-                if temp <= 35.0: score += 3
-                elif 35.1 <= temp <= 36.0: score += 1
-                elif 38.1 <= temp <= 39.0: score += 1
-                elif temp >= 39.1: score += 2
-                
-                # AVPU
-                if data['AVPU'] != 'Alert': score += 3
-                
-                return score
-            except (ValueError, KeyError) as e:
-                raise ValueError(f"Error calculating NEWS2 score: {str(e)}")
-        
-        # Add NEWS2 score to data
         try:
-            data['NEWS2'] = calculate_NEWS2(data)
+            data['NEWS2'] = news2_score(data)
         except ValueError as e:
             return jsonify({"error": str(e)}), 400
         
         # Make prediction using the model
         try:
-            df = pd.DataFrame([data])
-            prediction = triage_model.predict(df)
-            risk_level = int(prediction[0])
+            started = time.perf_counter()
+            risk_level = model.predict_one(data)
+            shadow_evaluator.submit(data, risk_level, model.version, (time.perf_counter() - started) * 1000, 'test_model')
             
-            return jsonify({
+            result = {
                 'risk_level': risk_level,
                 'risk_level_text': ["Low", "Medium", "High"][risk_level],
                 'shock_index': data['Shock_Index'],
-                'news2_score': data['NEWS2']
-            })
+                'news2_score': data['NEWS2'],
+                'model_version': model.version
+            }
+            if cache_key is not None:
+                prediction_cache.put(cache_key, result)
+            return jsonify(result)
         except Exception as e:
             return jsonify({
                 "error": f"Error making triage prediction: {str(e)}"
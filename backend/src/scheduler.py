@@ -0,0 +1,264 @@
+import math
+import os
+import pickle
+import threading
+import time
+from datetime import datetime
+
+try:
+    import fcntl
+except ImportError:  # Not available on Windows; every process then rescores for itself
+    fcntl = None
+
+class QueueScheduler:
+    """Runs the queue rescoring job on a background thread at a fixed tick.
+
+    Readers get the latest computed result from memory, so the number of
+    rescoring passes (and database writes) is bounded by the tick rate rather
+    than by how many clients poll the queue.
+
+    The job may return a third value: the epoch time at which its result next
+    goes stale (math.inf if only an external change can do that). The thread
+    then sleeps until that time, at most max_idle seconds, instead of waking
+    every interval.
+
+    With export and restore, the processes sharing snapshot_path (e.g. the
+    gunicorn workers) elect one leader through a lock on the file: only the
+    leader runs the job and writes each result to the file, and the others
+    load it from there, so the database sees one pass per tick however many
+    workers there are. trigger() in any process wakes the leader, and another
+    process takes over when the leader exits.
+    """
+
+    def __init__(self, job, interval=None, max_idle=None, export=None, restore=None, snapshot_path=None):
+        self.job = job
+        if interval is None:
+            interval = float(os.environ.get('QUEUE_RESCORE_INTERVAL_SECONDS', 30))
+        if max_idle is None:
+            max_idle = float(os.environ.get('QUEUE_MAX_IDLE_SECONDS', 300))
+        self.interval = interval
+        self.max_idle = max_idle
+        self.export = export
+        self.restore = restore
+        if snapshot_path is None:
+            snapshot_path = os.environ.get('QUEUE_SNAPSHOT_PATH', os.path.join('data', 'queue_snapshot.pickle'))
+        self.snapshot_path = snapshot_path if export and restore else None
+        self.poll_seconds = float(os.environ.get('QUEUE_SNAPSHOT_POLL_SECONDS', 1))
+        self.role = None
+        self._leader_file = None
+        self._snapshot_version = None
+        self._trigger_version = None
+        self.latest = None
+        self._computed_at = None
+        self.last_error = None
+        self._listeners = []
+        self._lock = threading.Lock()
+        self._wake = threading.Event()
+        self._stop = threading.Event()
+        self._ready = threading.Event()
+        self._thread = None
+
+    def start(self):
+        """Start the background thread if it is not already running"""
+        if self._thread is not None and self._thread.is_alive():
+            return
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name='queue-scheduler', daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        """Ask the background thread to exit after the current pass"""
+        self._stop.set()
+        self._wake.set()
+
+    def add_listener(self, listener):
+        """Call listener(latest) after every pass, e.g. to push the result to clients"""
+        self._listeners.append(listener)
+
+    def trigger(self):
+        """Wake the background thread so it rescores before the next tick"""
+        self._wake.set()
+        if self.snapshot_path and self.role == 'follower':
+            # Tell the leader; it notices within poll_seconds
+            try:
+                with open(self.snapshot_path + '.trigger', 'a'):
+                    pass
+                os.utime(self.snapshot_path + '.trigger')
+            except OSError as e:
+                print(f"Queue trigger error: {str(e)}")
+
+    def stats(self):
+        """This process's part in the rescoring and the age of its snapshot"""
+        latest = self.latest
+        return {
+            'role': self.role,
+            'computed_at': latest and latest['computed_at'],
+            'last_error': self.last_error
+        }
+
+    def run_once(self):
+        """Run the job now and store its result as the latest snapshot"""
+        with self._lock:
+            return self._compute()
+
+    def get_latest(self):
+        """Return the latest snapshot, computing one if nothing has run yet.
+
+        Without the background thread (QUEUE_SCHEDULER_ENABLED=false) the
+        snapshot is also recomputed here once trigger() has marked it stale or
+        it is older than the interval.
+        """
+        latest = self.latest
+        if latest is not None and not self._needs_rescore():
+            return latest
+        if latest is None and self.role == 'follower':
+            # The leader's first pass is on its way; only rescore here if it never arrives
+            self._ready.wait(self.interval)
+            if self.latest is not None:
+                return self.latest
+        with self._lock:
+            if self.latest is None:
+                return self._compute()
+            if not self._needs_rescore():
+                return self.latest
+            # Cleared first so a trigger() during the pass marks the new result stale
+            self._wake.clear()
+            try:
+                latest = self._compute()
+                self.last_error = None
+            except Exception as e:
+                print(f"Queue rescoring error: {str(e)}")
+                self.last_error = str(e)
+                latest = self.latest
+        return latest
+
+    def _needs_rescore(self):
+        """Whether a reader should rescore because no background thread will"""
+        if self._thread is not None and self._thread.is_alive():
+            return False
+        return self._wake.is_set() or time.monotonic() - self._computed_at >= self.interval
+
+    def _compute(self):
+        result = self.job()
+        queue, write_stats = result[0], result[1]
+        latest = {
+            'queue': queue,
+            'write_stats': write_stats,
+            'computed_at': datetime.utcnow().isoformat() + 'Z',  # Add UTC indicator
+            'stale_at': result[2] if len(result) > 2 else None
+        }
+        if self.role == 'leader':
+            self._write_snapshot(latest)
+        return self._publish(latest)
+
+    def _publish(self, latest):
+        self._computed_at = time.monotonic()
+        self.latest = latest
+        self._ready.set()
+        for listener in self._listeners:
+            try:
+                listener(self.latest)
+            except Exception as e:
+                print(f"Queue listener error: {str(e)}")
+        return self.latest
+
+    def _sleep_seconds(self):
+        """Time until the next pass: the job's stale time if it gave one, else the tick"""
+        stale_at = self.latest and self.latest['stale_at']
+        if stale_at is None or self.last_error is not None:
+            return self.interval
+        if math.isinf(stale_at):
+            return self.max_idle
+        # Wake just after the stale time so the rescoring sees the new minute
+        return min(self.max_idle, max(1.0, stale_at - time.time() + 0.5))
+
+    def _run(self):
+        if not self._lead():
+            self._follow()
+        while not self._stop.is_set():
+            try:
+                self.run_once()
+                self.last_error = None
+            except Exception as e:
+                print(f"Queue scheduler error: {str(e)}")
+                self.last_error = str(e)
+
+            self._wait(self._sleep_seconds())
+            self._wake.clear()
+
+    def _lead(self):
+        """Try to become the process that rescores; True if this one should"""
+        if self.snapshot_path is None or fcntl is None:
+            self.role = 'leader' if self.snapshot_path else None
+            return True
+        directory = os.path.dirname(self.snapshot_path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        leader_file = open(self.snapshot_path + '.lock', 'a')
+        try:
+            fcntl.flock(leader_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except BlockingIOError:
+            leader_file.close()
+            self.role = 'follower'
+            return False
+        # Held until the process exits, when the lock passes to a follower
+        self._leader_file = leader_file
+        self.role = 'leader'
+        self._trigger_version = self._file_version(self.snapshot_path + '.trigger')
+        return True
+
+    def _follow(self):
+        """Load the leader's snapshots until this process becomes the leader or stops"""
+        while not self._stop.is_set():
+            try:
+                self._read_snapshot()
+            except Exception as e:
+                print(f"Queue snapshot read error: {str(e)}")
+            self._wake.wait(self.poll_seconds)
+            self._wake.clear()
+            if self._lead():
+                return
+
+    def _wait(self, seconds):
+        """Sleep up to seconds, returning early on trigger() here or in a follower"""
+        deadline = time.monotonic() + seconds
+        while not self._stop.is_set():
+            remaining = deadline - time.monotonic()
+            if remaining <= 0 or self._wake.wait(min(remaining, self.poll_seconds)):
+                return
+            if self.snapshot_path:
+                version = self._file_version(self.snapshot_path + '.trigger')
+                if version != self._trigger_version:
+                    self._trigger_version = version
+                    return
+
+    def _write_snapshot(self, latest):
+        snapshot = dict(latest, queue=self.export(latest['queue']))
+        partial = self.snapshot_path + '.tmp'
+        try:
+            with open(partial, 'wb') as snapshot_file:
+                pickle.dump(snapshot, snapshot_file, protocol=pickle.HIGHEST_PROTOCOL)
+            os.replace(partial, self.snapshot_path)
+        except OSError as e:
+            print(f"Queue snapshot write error: {str(e)}")
+
+    def _read_snapshot(self):
+        version = self._file_version(self.snapshot_path)
+        if version is None or version == self._snapshot_version:
+            return
+        # A file left by an earlier run is not a current snapshot
+        if self.latest is None and time.time() - version[1] / 1e9 > self.max_idle + self.interval:
+            return
+        with open(self.snapshot_path, 'rb') as snapshot_file:
+            snapshot = pickle.load(snapshot_file)
+        self._snapshot_version = version
+        with self._lock:
+            self._publish(dict(snapshot, queue=self.restore(snapshot['queue'])))
+
+    @staticmethod
+    def _file_version(path):
+        try:
+            stat = os.stat(path)
+        except FileNotFoundError:
+            return None
+        return (stat.st_ino, stat.st_mtime_ns)
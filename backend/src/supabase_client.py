@@ -0,0 +1,150 @@
+import os
+import threading
+import time
+import requests
+from concurrent.futures import ThreadPoolExecutor
+from requests.adapters import HTTPAdapter
+from dotenv import load_dotenv
+load_dotenv()
+
+# Supabase connection details
+def get_supabase_url():
+    return os.environ.get('SUPABASE_URL', 'https://my-custom.supabase.co')
+
+def get_supabase_key():
+    return os.environ.get('SUPABASE_SERVICE_KEY', 'SUPABASE_SERVICE_KEY')
+
+# Verbs that are safe to send again after a connection error or gateway failure
+IDEMPOTENT_METHODS = frozenset(['GET', 'HEAD', 'PUT', 'DELETE'])
+RETRY_STATUS_CODES = frozenset([502, 503, 504])
+
+class SupabaseError(Exception):
+    """Raised when the Supabase REST API answers with an error status"""
+
+    def __init__(self, status_code, text):
+        super().__init__(f"Supabase API error: {status_code} - {text}")
+        self.status_code = status_code
+        self.text = text
+
+class SupabaseClient:
+    """Pooled HTTP client for the Supabase REST API.
+
+    Reuses keep-alive connections through a single requests.Session, applies a
+    timeout to every call, retries idempotent verbs with exponential backoff and
+    keeps request/latency counters.
+    """
+
+    def __init__(self, pool_size=None, timeout=None, max_retries=None, retry_backoff=None):
+        self.pool_size = pool_size or int(os.environ.get('SUPABASE_POOL_SIZE', 10))
+        self.timeout = timeout or float(os.environ.get('SUPABASE_TIMEOUT_SECONDS', 10))
+        self.max_retries = max_retries if max_retries is not None else int(os.environ.get('SUPABASE_MAX_RETRIES', 2))
+        self.retry_backoff = retry_backoff if retry_backoff is not None else float(os.environ.get('SUPABASE_RETRY_BACKOFF', 0.2))
+
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=self.pool_size, pool_maxsize=self.pool_size)
+        self.session.mount('https://', adapter)
+        self.session.mount('http://', adapter)
+
+        self._stats_lock = threading.Lock()
+        self._stats = {
+            'requests': 0,
+            'errors': 0,
+            'retries': 0,
+            'total_latency_ms': 0.0,
+            'max_latency_ms': 0.0,
+            'by_method': {}
+        }
+
+    def headers(self, extra=None):
+        headers = {
+            'apikey': get_supabase_key(),
+            'Authorization': f'Bearer {get_supabase_key()}',
+            'Content-Type': 'application/json',
+            'Prefer': 'return=representation'
+        }
+        if extra:
+            headers.update(extra)
+        return headers
+
+    def request(self, method, path, data=None, params=None, headers=None, timeout=None):
+        """Send a request and return the decoded JSON body"""
+        method = method.upper()
+        if method not in ('GET', 'HEAD', 'POST', 'PUT', 'PATCH', 'DELETE'):
+            raise ValueError(f"Unsupported method: {method}")
+
+        url = f"{get_supabase_url()}{path}"
+        attempts = 1 + (self.max_retries if method in IDEMPOTENT_METHODS else 0)
+
+        for attempt in range(attempts):
+            if attempt:
+                self._record_retry()
+                time.sleep(self.retry_backoff * (2 ** (attempt - 1)))
+
+            started = time.perf_counter()
+            try:
+                response = self.session.request(
+                    method, url,
+                    headers=self.headers(headers),
+                    params=params,
+                    json=data,
+                    timeout=timeout or self.timeout
+                )
+            except (requests.ConnectionError, requests.Timeout):
+                self._record(method, started, error=True)
+                if attempt + 1 < attempts:
+                    continue
+                raise
+
+            self._record(method, started, error=response.status_code >= 400)
+            if response.status_code in RETRY_STATUS_CODES and attempt + 1 < attempts:
+                continue
+            break
+
+        if response.status_code >= 400:
+            raise SupabaseError(response.status_code, response.text)
+
+        if not response.content:
+            return None
+        return response.json()
+
+    def stats(self):
+        """Snapshot of the request and latency counters"""
+        with self._stats_lock:
+            stats = dict(self._stats)
+            stats['by_method'] = dict(self._stats['by_method'])
+        stats['avg_latency_ms'] = stats['total_latency_ms'] / stats['requests'] if stats['requests'] else 0.0
+        stats['pool_size'] = self.pool_size
+        return stats
+
+    def _record(self, method, started, error=False):
+        latency_ms = (time.perf_counter() - started) * 1000
+        with self._stats_lock:
+            self._stats['requests'] += 1
+            self._stats['errors'] += int(error)
+            self._stats['total_latency_ms'] += latency_ms
+            self._stats['max_latency_ms'] = max(self._stats['max_latency_ms'], latency_ms)
+            self._stats['by_method'][method] = self._stats['by_method'].get(method, 0) + 1
+
+    def _record_retry(self):
+        with self._stats_lock:
+            self._stats['retries'] += 1
+
+# Shared client used by all blueprints
+supabase = SupabaseClient()
+
+def supabase_request(method, path, data=None, params=None, headers=None, timeout=None):
+    """Helper function to make requests to Supabase REST API"""
+    return supabase.request(method, path, data=data, params=params, headers=headers, timeout=timeout)
+
+# Shared by requests that issue several independent Supabase calls
+executor = ThreadPoolExecutor(max_workers=supabase.pool_size, thread_name_prefix='supabase')
+
+def run_concurrently(*calls):
+    """Run independent zero-argument calls side by side and return their results in order.
+
+    The calls share the client's connection pool, so a request waits for its
+    slowest call rather than the sum of them. The calls must not themselves
+    use run_concurrently. The first exception raised is re-raised.
+    """
+    futures = [executor.submit(call) for call in calls]
+    return [future.result() for future in futures]
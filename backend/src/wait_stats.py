@@ -0,0 +1,150 @@
+import math
+import os
+import threading
+import time
+from datetime import datetime, timezone
+
+class LogHistogram:
+    """HDR-style histogram with logarithmic buckets.
+
+    Memory grows with the number of distinct buckets, not observations, and
+    every quantile is within `precision` relative error of the true value.
+    """
+
+    def __init__(self, precision=0.02, min_value=0.1):
+        self.precision = precision
+        self.min_value = min_value
+        self._log_base = math.log1p(precision)
+        self.counts = {}
+        self.count = 0
+
+    def _bucket(self, value):
+        if value < self.min_value:
+            return 0
+        return int(math.log(value / self.min_value) / self._log_base) + 1
+
+    def _value(self, bucket):
+        if bucket == 0:
+            return 0.0
+        # Midpoint of the bucket's [low, high) range
+        low = self.min_value * math.exp((bucket - 1) * self._log_base)
+        return low * (1 + self.precision / 2)
+
+    def add(self, value, count=1):
+        bucket = self._bucket(max(0.0, value))
+        self.counts[bucket] = self.counts.get(bucket, 0) + count
+        self.count += count
+
+    def merge(self, other):
+        for bucket, count in other.counts.items():
+            self.counts[bucket] = self.counts.get(bucket, 0) + count
+        self.count += other.count
+
+    def quantiles(self, quantiles):
+        """Values at the given quantiles (0-1), or None for each if empty"""
+        if not self.count:
+            return [None for _ in quantiles]
+        ranks = [max(1, math.ceil(q * self.count)) for q in quantiles]
+        results = [None] * len(quantiles)
+        seen = 0
+        for bucket in sorted(self.counts):
+            seen += self.counts[bucket]
+            for i, rank in enumerate(ranks):
+                if results[i] is None and seen >= rank:
+                    results[i] = self._value(bucket)
+        return results
+
+# Sliding windows reported by the wait-time statistics, in seconds
+WAIT_STATS_WINDOWS = {
+    'last_hour': 3600,
+    'shift': float(os.environ.get('WAIT_STATS_SHIFT_HOURS', 8)) * 3600,
+    'day': 86400
+}
+
+class SlidingWaitStats:
+    """Door-to-treatment wait sketches per risk level over sliding time windows.
+
+    Observations go into one histogram per (time slot, risk level); a window
+    merges the slots it covers, so windows slide in steps of `slot_seconds`.
+    Slots older than the longest window are dropped, which bounds memory.
+    """
+
+    def __init__(self, windows=None, slot_seconds=None):
+        self.windows = windows or WAIT_STATS_WINDOWS
+        self.slot_seconds = slot_seconds or float(os.environ.get('WAIT_STATS_SLOT_SECONDS', 300))
+        self._slots = {}  # slot index -> {risk_level: LogHistogram}
+        self.synced_through = None  # Treatment starts before this (UTC) have been loaded
+        self._lock = threading.Lock()
+
+    def record(self, wait_minutes, risk_level, at=None):
+        """Add one patient's wait, observed when their treatment started (epoch seconds)"""
+        at = time.time() if at is None else at
+        slot = int(at // self.slot_seconds)
+        with self._lock:
+            histograms = self._slots.setdefault(slot, {})
+            histograms.setdefault(risk_level, LogHistogram()).add(wait_minutes)
+            self._prune(time.time())
+
+    def summary(self, quantiles=(0.5, 0.9, 0.99), now=None):
+        """Wait percentiles and treatment starts per hour for every window"""
+        now = time.time() if now is None else now
+        current = int(now // self.slot_seconds)
+        with self._lock:
+            self._prune(now)
+            slots = dict(self._slots)
+
+        result = {}
+        for name, seconds in self.windows.items():
+            first = current - int(math.ceil(seconds / self.slot_seconds)) + 1
+            by_risk_level = {}
+            for slot, histograms in slots.items():
+                if slot < first:
+                    continue
+                for risk_level, histogram in histograms.items():
+                    by_risk_level.setdefault(risk_level, LogHistogram()).merge(histogram)
+
+            overall = LogHistogram()
+            for histogram in by_risk_level.values():
+                overall.merge(histogram)
+
+            result[name] = {
+                'window_seconds': seconds,
+                'all': self._describe(overall, quantiles, seconds),
+                'by_risk_level': {
+                    risk_level: self._describe(histogram, quantiles, seconds)
+                    for risk_level, histogram in sorted(by_risk_level.items(), key=lambda item: str(item[0]))
+                }
+            }
+        return result
+
+    def _describe(self, histogram, quantiles, seconds):
+        values = histogram.quantiles(quantiles)
+        description = {f"p{round(q * 100):g}_minutes": value for q, value in zip(quantiles, values)}
+        description['treatment_starts'] = histogram.count
+        description['treatment_starts_per_hour'] = histogram.count / (seconds / 3600)
+        return description
+
+    def _prune(self, now):
+        oldest = int(now // self.slot_seconds) - int(math.ceil(max(self.windows.values()) / self.slot_seconds))
+        for slot in [slot for slot in self._slots if slot <= oldest]:
+            del self._slots[slot]
+
+# Shared per process; fed from the database by sync_wait_stats in routes/triage.py
+wait_stats = SlidingWaitStats()
+
+def parse_timestamp(value):
+    """Epoch seconds of an ISO timestamp; naive timestamps are taken as UTC"""
+    parsed = datetime.fromisoformat(value.replace('Z', '+00:00'))
+    if parsed.tzinfo is None:
+        parsed = parsed.replace(tzinfo=timezone.utc)
+    return parsed.timestamp()
+
+RISK_LEVEL_NAMES = {1: 'low', 2: 'medium', 3: 'high'}
+
+def record_treatment_start(patient):
+    """Record a patient's door-to-treatment wait from their arrival and treatment start times"""
+    if not patient.get('arrival_time') or not patient.get('treatment_start_time'):
+        return
+    started = parse_timestamp(patient['treatment_start_time'])
+    wait_minutes = (started - parse_timestamp(patient['arrival_time'])) / 60
+    wait_stats.record(wait_minutes, RISK_LEVEL_NAMES.get(patient.get('risk_level'), 'unknown'), at=started)
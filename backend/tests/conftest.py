@@ -0,0 +1,26 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from src.models.features import news2_scores, shock_indices
+from src.models.inference import CATEGORICAL_CODES
+
+@pytest.fixture(scope='session')
+def intake_frame():
+    """Synthetic intake records and their risk levels (0-2, from NEWS2), for fitting small models"""
+    rng = np.random.default_rng(0)
+    count = 1500
+    columns = {
+        'Pulse_Rate': rng.integers(40, 160, count).astype(float),
+        'Systolic_BP': rng.integers(70, 200, count).astype(float),
+        'Respiratory_Rate': rng.integers(6, 35, count).astype(float),
+        'SPO2': rng.integers(80, 101, count).astype(float),
+        'Temperature': rng.uniform(34, 40.5, count).round(1),
+        'AVPU': rng.choice(list(CATEGORICAL_CODES['AVPU']), count, p=[0.7, 0.1, 0.1, 0.1]),
+        'Lactate': rng.uniform(0.5, 8, count).round(1)
+    }
+    columns['Shock_Index'] = shock_indices(columns)
+    columns['NEWS2'] = news2_scores(columns)
+    frame = pd.DataFrame(columns)
+    labels = np.clip(frame['NEWS2'].to_numpy() // 4, 0, 2).astype(int)
+    return frame, labels
@@ -0,0 +1,74 @@
+import asyncio
+import os
+import time
+
+# Keep the import of src.main from starting threads or loading the model
+os.environ.setdefault('BACKGROUND_JOBS_AT_IMPORT', 'false')
+os.environ.setdefault('MODEL_WARMUP', 'lazy')
+
+from flask import Flask, Response, request
+from src.asgi import WsgiBridge, wsgi_executor
+
+UPSTREAM_SECONDS = 0.5
+REQUESTS = 8
+
+def slow_app():
+    app = Flask(__name__)
+
+    @app.route('/slow')
+    def slow():
+        # Stands in for a route waiting on Supabase
+        time.sleep(UPSTREAM_SECONDS)
+        return 'ok'
+
+    @app.route('/echo', methods=['POST'])
+    def echo():
+        return f"{request.headers.get('X-Name')}:{request.get_data(as_text=True)}"
+
+    @app.route('/chunks')
+    def chunks():
+        return Response((f"{i}\n" for i in range(3)), mimetype='application/x-ndjson')
+
+    return app
+
+async def call(asgi_app, path, method='GET', body=b'', headers=()):
+    scope = {
+        'type': 'http', 'method': method, 'path': path, 'root_path': '', 'query_string': b'',
+        'http_version': '1.1', 'headers': list(headers), 'server': ('testserver', 80), 'client': ('127.0.0.1', 1234)
+    }
+    messages = []
+
+    async def receive():
+        return {'type': 'http.request', 'body': body, 'more_body': False}
+
+    async def send(message):
+        messages.append(message)
+
+    await asgi_app(scope, receive, send)
+    return messages[0]['status'], b''.join(m.get('body', b'') for m in messages[1:]), len(messages) - 1
+
+def test_flask_routes_run_concurrently():
+    asgi_app = WsgiBridge(slow_app(), wsgi_executor)
+
+    async def run():
+        return await asyncio.gather(*(call(asgi_app, '/slow') for _ in range(REQUESTS)))
+
+    started = time.perf_counter()
+    responses = asyncio.run(run())
+    elapsed = time.perf_counter() - started
+
+    assert [response[:2] for response in responses] == [(200, b'ok')] * REQUESTS
+    # One after another would take REQUESTS * UPSTREAM_SECONDS (4 s)
+    assert elapsed < 2 * UPSTREAM_SECONDS
+
+def test_request_body_and_headers_reach_flask():
+    asgi_app = WsgiBridge(slow_app(), wsgi_executor)
+    status, body, _ = asyncio.run(call(asgi_app, '/echo', 'POST', b'hello', [(b'x-name', b'triage')]))
+    assert (status, body) == (200, b'triage:hello')
+
+def test_streamed_responses_are_sent_chunk_by_chunk():
+    asgi_app = WsgiBridge(slow_app(), wsgi_executor)
+    status, body, body_messages = asyncio.run(call(asgi_app, '/chunks'))
+    assert (status, body) == (200, b'0\n1\n2\n')
+    # Three chunks plus the closing empty body
+    assert body_messages == 4
@@ -0,0 +1,39 @@
+import numpy as np
+import pytest
+from sklearn.compose import ColumnTransformer
+from sklearn.ensemble import RandomForestClassifier
+from sklearn.pipeline import Pipeline
+from sklearn.preprocessing import OneHotEncoder
+
+from src.models.compiled_trees import CompiledTriageModel, check_parity, compile_triage_model, parity_records
+from src.models.inference import TriageInference
+from src.models.triage_model import load_triage_model
+
+def xgboost_classifier():
+    xgboost = pytest.importorskip('xgboost')
+    return xgboost.XGBClassifier(n_estimators=20, max_depth=4)
+
+def random_forest():
+    return RandomForestClassifier(n_estimators=20, max_depth=6, random_state=0)
+
+@pytest.mark.parametrize('classifier', [xgboost_classifier, random_forest])
+def test_exported_model_predicts_like_the_pipeline(classifier, intake_frame, tmp_path):
+    frame, labels = intake_frame
+    pipeline = Pipeline([
+        ('encode', ColumnTransformer([('avpu', OneHotEncoder(handle_unknown='ignore'), ['AVPU'])], remainder='passthrough')),
+        ('classify', classifier())
+    ]).fit(frame, labels)
+
+    path = str(tmp_path / 'triage_model.npz')
+    compile_triage_model(pipeline).save(path)
+    model = load_triage_model(path)
+    assert isinstance(model, CompiledTriageModel)
+
+    records = parity_records(samples=2000)
+    assert check_parity(pipeline, model, records) == []
+
+    # Served through the same wrapper the registry builds
+    inference = TriageInference(model)
+    assert inference.path == 'compiled'
+    expected = pipeline.predict(frame)
+    assert np.array_equal(inference.predict(frame.to_dict('records')), expected)
@@ -0,0 +1,80 @@
+import numpy as np
+import pytest
+
+from src.models.features import NEWS2_BANDS, news2_score, news2_scores
+
+NORMAL_VITALS = {'Respiratory_Rate': 16, 'SPO2': 98, 'Systolic_BP': 120, 'Pulse_Rate': 70, 'Temperature': 37.0}
+AVPU_LEVELS = ['Alert', 'Voice', 'Pain', 'Unresponsive']
+
+def reference_news2(record):
+    """The original scalar NEWS2 rules the band tables replaced"""
+    score = 0
+
+    resp_rate = float(record['Respiratory_Rate'])
+    if resp_rate <= 8: score += 3
+    elif 9 <= resp_rate <= 11: score += 1
+    elif 21 <= resp_rate <= 24: score += 2
+    elif resp_rate >= 25: score += 3
+
+    spo2 = float(record['SPO2'])
+    if spo2 <= 92: score += 3
+    elif 93 <= spo2 <= 94: score += 2
+    elif 95 <= spo2 <= 96: score += 1
+
+    sys_bp = float(record['Systolic_BP'])
+    if sys_bp <= 90: score += 3
+    elif 91 <= sys_bp <= 100: score += 2
+    elif 101 <= sys_bp <= 110: score += 1
+    elif sys_bp >= 220: score += 3
+
+    pulse = float(record['Pulse_Rate'])
+    if pulse <= 40: score += 3
+    elif 41 <= pulse <= 50: score += 1
+    elif 91 <= pulse <= 110: score += 1
+    elif 111 <= pulse <= 130: score += 2
+    elif pulse >= 131: score += 3
+
+    temp = float(record['Temperature'])
+    if temp <= 35.0: score += 3
+    elif 35.1 <= temp <= 36.0: score += 1
+    elif 38.1 <= temp <= 39.0: score += 1
+    elif temp >= 39.1: score += 2
+
+    if record['AVPU'] != 'Alert': score += 3
+
+    return score
+
+def boundary_values(field):
+    """Every band edge of a vital sign plus values just either side of it"""
+    edges = sorted({edge for low, high, _ in NEWS2_BANDS[field] for edge in (low, high) if np.isfinite(edge)})
+    values = set()
+    for edge in edges:
+        for offset in (-1, -0.5, -0.05, -1e-9, 0, 1e-9, 0.05, 0.5, 1):
+            values.add(edge + offset)
+    return sorted(values)
+
+def assert_matches_reference(records):
+    columns = {field: [record[field] for record in records] for field in records[0]}
+    for record, score in zip(records, news2_scores(columns)):
+        expected = reference_news2(record)
+        assert score == expected, record
+        assert news2_score(record) == expected, record
+
+@pytest.mark.parametrize('field', list(NEWS2_BANDS))
+def test_every_band_boundary_scores_like_the_if_chains(field):
+    # Each boundary on its own, with every other vital in the normal range
+    assert_matches_reference([
+        dict(NORMAL_VITALS, **{field: value, 'AVPU': avpu})
+        for value in boundary_values(field)
+        for avpu in ('Alert', 'Voice')
+    ])
+
+def test_combined_boundaries_score_like_the_if_chains():
+    rng = np.random.default_rng(0)
+    choices = {field: boundary_values(field) for field in NEWS2_BANDS}
+    records = []
+    for _ in range(5000):
+        record = {field: float(rng.choice(values)) for field, values in choices.items()}
+        record['AVPU'] = str(rng.choice(AVPU_LEVELS))
+        records.append(record)
+    assert_matches_reference(records)
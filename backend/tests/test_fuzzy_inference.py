@@ -0,0 +1,35 @@
+import numpy as np
+
+from src.models.fuzzy_inference import GRID_AXES, get_mamdani_engine, reference_priority
+
+SAMPLES = 2000
+
+# Interpolation is exact on grid points; between them it may drift by up to a score point
+GRID_TOLERANCE = 1e-9
+RANDOM_TOLERANCE = 1.0
+
+def max_error(points):
+    fast = get_mamdani_engine().evaluate(*points)
+    slow = np.array([reference_priority(*values) for values in zip(*points)])
+    return np.max(np.abs(fast - slow))
+
+def test_grid_points_match_the_reference():
+    rng = np.random.default_rng(0)
+    assert max_error([rng.choice(axis, SAMPLES) for axis in GRID_AXES]) <= GRID_TOLERANCE
+
+def test_random_inputs_stay_close_to_the_reference():
+    rng = np.random.default_rng(1)
+    # Realistic inputs, including waits outside the grid
+    points = [
+        rng.integers(1, 4, SAMPLES).astype(float),
+        rng.uniform(-10, 300, SAMPLES),
+        rng.uniform(0, 100, SAMPLES),
+        rng.uniform(0, 100, SAMPLES)
+    ]
+    assert max_error(points) <= RANDOM_TOLERANCE
+
+def test_scalar_inputs_score_like_arrays():
+    engine = get_mamdani_engine()
+    scores = engine.evaluate(np.array([3.0, 1.0]), np.array([90.0, 5.0]), np.array([50.0, 80.0]), np.array([20.0, 60.0]))
+    assert engine.evaluate(3, 90, 50, 20) == scores[0]
+    assert engine.evaluate(1, 5, 80, 60) == scores[1]
@@ -0,0 +1,48 @@
+import numpy as np
+from sklearn.compose import ColumnTransformer
+from sklearn.ensemble import RandomForestClassifier
+from sklearn.pipeline import Pipeline
+from sklearn.preprocessing import FunctionTransformer, OneHotEncoder, StandardScaler
+
+from src.models.inference import TriageInference
+
+NUMERIC_FEATURES = ['Pulse_Rate', 'Systolic_BP', 'Respiratory_Rate', 'SPO2', 'Temperature', 'Lactate', 'Shock_Index', 'NEWS2']
+
+def random_forest():
+    return RandomForestClassifier(n_estimators=20, max_depth=6, random_state=0)
+
+def pipeline(numeric_transformer):
+    return Pipeline([
+        ('encode', ColumnTransformer([
+            ('avpu', OneHotEncoder(handle_unknown='ignore'), ['AVPU']),
+            ('numeric', numeric_transformer, NUMERIC_FEATURES)
+        ])),
+        ('classify', random_forest())
+    ])
+
+def test_bare_estimator_uses_the_matrix_path(intake_frame):
+    frame, labels = intake_frame
+    model = random_forest().fit(frame[NUMERIC_FEATURES], labels)
+
+    inference = TriageInference(model)
+    assert inference.path == 'matrix'
+    assert inference.preprocess is None
+    assert np.array_equal(inference.predict(frame.to_dict('records')), model.predict(frame[NUMERIC_FEATURES]))
+
+def test_affine_preprocessing_is_compiled(intake_frame):
+    frame, labels = intake_frame
+    model = pipeline(StandardScaler()).fit(frame, labels)
+
+    inference = TriageInference(model)
+    assert inference.path == 'matrix'
+    assert inference.preprocess is not None
+    assert np.array_equal(inference.predict(frame.to_dict('records')), model.predict(frame))
+
+def test_non_affine_preprocessing_falls_back_to_dataframes(intake_frame):
+    frame, labels = intake_frame
+    model = pipeline(FunctionTransformer(np.log1p)).fit(frame, labels)
+
+    inference = TriageInference(model)
+    assert inference.path == 'dataframe'
+    assert inference.preprocess is None
+    assert np.array_equal(inference.predict(frame.to_dict('records')), model.predict(frame))
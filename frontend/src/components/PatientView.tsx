@@ -1,6 +1,6 @@
 import { useState, useEffect, useCallback, useRef } from 'react';
 import type { FC } from 'react';
-import { supabase } from '../lib/supabase';
+import { supabase, subscribeToTriageQueue } from '../lib/supabase';
 import type { Patient } from '../lib/supabase';
 
 const PatientView: FC = () => {
@@ -89,6 +89,19 @@ const PatientView: FC = () => {
   }, [fetchPatientQueue]);
 
   useEffect(() => {
+    // Prefer the server-pushed queue stream: one backend computation serves every open view
+    if (typeof EventSource !== 'undefined') {
+      return subscribeToTriageQueue(
+        (queue) => {
+          setPatients(stableSortPatients(queue));
+          setLastUpdated(new Date());
+          setError(null);
+          setLoading(false);
+        },
+        () => setError('Live queue connection lost. Reconnecting...')
+      );
+    }
+
     fetchPatientQueue();
     
     // Set up real-time subscription
@@ -113,7 +126,7 @@ const PatientView: FC = () => {
       subscription.unsubscribe();
       clearInterval(intervalId);
     };
-  }, [fetchPatientQueue, debouncedUpdate]);
+  }, [fetchPatientQueue, debouncedUpdate, stableSortPatients]);
 
   // Calculate waiting time in minutes
   const calculateWaitingTime = (arrivalTime: string): number => {
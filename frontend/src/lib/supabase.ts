@@ -409,6 +409,61 @@ export const getTriageQueue = async () => {
   }
 };
 
+// Changes pushed by /api/triage/queue/stream after each rescoring pass
+export type TriageQueueDiff = {
+  version: number;
+  computed_at: string;
+  arrivals: { rank: number; patient: Patient }[];
+  departures: string[];
+  moves: [string, number][];
+  scores: [string, number, number][];
+  updates: Patient[];
+};
+
+// Apply a queue stream diff to the current queue, keeping the server's rank order
+export const applyTriageQueueDiff = (queue: Patient[], diff: TriageQueueDiff): Patient[] => {
+  const departed = new Set(diff.departures.map(String));
+  const byId = new Map<string, Patient>(
+    queue.filter((p) => !departed.has(String(p.id))).map((p): [string, Patient] => [String(p.id), p])
+  );
+  const ranks = new Map<string, number>(queue.map((p, rank): [string, number] => [String(p.id), rank]));
+
+  diff.updates.forEach((patient) => byId.set(String(patient.id), patient));
+  diff.scores.forEach(([id, score, waiting]) => {
+    const patient = byId.get(id);
+    if (patient) byId.set(id, { ...patient, priority_score: score, waiting_time_minutes: waiting });
+  });
+  diff.arrivals.forEach(({ rank, patient }) => {
+    byId.set(String(patient.id), patient);
+    ranks.set(String(patient.id), rank);
+  });
+  diff.moves.forEach(([id, rank]) => ranks.set(id, rank));
+
+  return [...byId.values()].sort((a, b) => (ranks.get(String(a.id)) ?? 0) - (ranks.get(String(b.id)) ?? 0));
+};
+
+// Subscribe to the server-pushed triage queue; returns a function that closes the stream.
+// EventSource reconnects on its own and the server starts every connection with a snapshot.
+export const subscribeToTriageQueue = (
+  onQueue: (queue: Patient[]) => void,
+  onError?: (event: Event) => void
+) => {
+  let queue: Patient[] = [];
+  const source = new EventSource(`${import.meta.env.VITE_API_URL || ''}/api/triage/queue/stream`);
+
+  source.addEventListener('snapshot', (event) => {
+    queue = JSON.parse((event as MessageEvent).data).queue as Patient[];
+    onQueue(queue);
+  });
+  source.addEventListener('diff', (event) => {
+    queue = applyTriageQueueDiff(queue, JSON.parse((event as MessageEvent).data) as TriageQueueDiff);
+    onQueue(queue);
+  });
+  if (onError) source.onerror = onError;
+
+  return () => source.close();
+};
+
 export const calculatePatientPriority = async (patientId: string) => {
   try {
     const response = await fetch(`${import.meta.env.VITE_API_URL || ''}/api/triage/calculate`, {